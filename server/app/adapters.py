@@ -1,31 +1,209 @@
+import logging
+import threading
+import time
 from typing import List, Dict, Any, Optional
-from utils import recommenders as R
 from utils import pdf_utils as PDF
+from utils.profiling import profiled
+from server.app.httpcache import ResponseCache
+from server.app.jobs import PdfJob, PdfJobQueue
+from server.app.pagination import RankedListCache
+from server.app.settings import settings
+from server.app.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# utils.recommenders pulls in pandas and sklearn; it is imported on first use
+_R = None
+_precompute_scheduler = None
+_registry = None
+_registry_lock = threading.Lock()
+_ring = None
+
+def _recommenders():
+    """Import and configure the recommenders module on first use"""
+    global _R
+    if _R is None:
+        from utils import recommenders as R
+        if settings.embeddings_dir:
+            R.embeddings_dir = settings.embeddings_dir
+        R.bert_inference_options = {
+            "quantize": settings.bert_quantize,
+            "num_threads": settings.bert_num_threads,
+            "interop_threads": settings.bert_interop_threads,
+            "export": settings.bert_export,
+            "max_length": settings.bert_max_length,
+        }
+        R.recommend_deadlines = {algorithm: ms / 1000 for algorithm, ms in settings.recommend_deadlines_ms.items()}
+        R.deadline_workers = settings.recommend_workers
+        if settings.shard_count > 1:
+            R.shard = (settings.shard_index, settings.shard_count)
+        R.diversity_pool_size = settings.diversity_pool_size
+        R.diversity_weight = settings.diversity_weight
+        R.diversity_max_per_category = settings.diversity_max_per_category
+        if settings.precompute_db:
+            from utils.precompute import PrecomputedStore
+            R.precomputed_store = PrecomputedStore(settings.precompute_db)
+            R.precomputed_max_age = settings.precompute_max_age_seconds
+        _R = R
+    return _R
+
+# Identical concurrent requests (e.g. a newsletter burst) share one computation
+_trending_flight = SingleFlight("trending")
+_recommend_flight = SingleFlight("recommend")
+_search_flight = SingleFlight("search")
+
+# Serialized /trending and /search bodies; keys include the model version
+response_cache = ResponseCache("http_response", max_bytes=settings.response_cache_max_bytes)
+
+# Ranked lists behind pagination cursors
+ranked_lists = RankedListCache(max_lists=settings.pagination_max_lists, ttl=settings.pagination_ttl_seconds)
+
+_report_cache = PDF.ReportCache(max_bytes=settings.pdf_cache_max_bytes)
+pdf_jobs = PdfJobQueue(_report_cache, max_workers=settings.pdf_workers,
+                       max_pending=settings.pdf_max_pending, ttl=settings.pdf_job_ttl_seconds)
+
+def warm_up(algorithms: Optional[List[str]] = None):
+    """Import heavy modules and load data/models ahead of the first request"""
+    start = time.perf_counter()
+    _ensure_loaded()
+    for algorithm in algorithms or []:
+        try:
+            _recommenders().recommend_for_user("__warmup__", k=1, algorithm=algorithm)
+        except Exception:
+            logger.exception("Warm-up failed", extra={"algorithm": algorithm})
+    logger.info("Warm-up complete", extra={
+        "algorithms": algorithms or [], "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+
+def start_precompute_scheduler():
+    """Start refreshing the precomputed store in a background thread (None if not configured)"""
+    global _precompute_scheduler
+    R = _recommenders()
+    if not settings.precompute_scheduler or R.precomputed_store is None:
+        return None
+    _ensure_loaded()
+    from utils.precompute import PrecomputeScheduler
+    _precompute_scheduler = PrecomputeScheduler(
+        R.precomputed_store, settings.precompute_algorithms, settings.precompute_users,
+        settings.precompute_k, settings.precompute_interval_seconds,
+    ).start()
+    return _precompute_scheduler
+
+def stop_precompute_scheduler():
+    if _precompute_scheduler is not None:
+        _precompute_scheduler.stop(timeout=5)
+
+def owns_user(user_id: str) -> bool:
+    """Whether this process serves user_id (always, unless sharded)"""
+    global _ring
+    if settings.shard_count <= 1:
+        return True
+    if _ring is None:
+        from utils.sharding import HashRing
+        _ring = HashRing.for_shards(settings.shard_count)
+    return _ring.index_for(user_id) == settings.shard_index
+
+def model_registry():
+    """The ModelRegistry under settings.registry_dir, or None when not configured"""
+    global _registry
+    if _registry is None and settings.registry_dir:
+        from utils.registry import ModelRegistry
+        _registry = ModelRegistry(settings.registry_dir)
+    return _registry
+
+def reload_model(version: Optional[str] = None) -> Dict[str, Any]:
+    """Load a registry version (default: CURRENT) and swap it in once warm"""
+    registry = model_registry()
+    if registry is None:
+        raise RuntimeError("No model registry configured")
+    _recommenders()
+    registry.load(version)
+    return model_status()
+
+def model_status() -> Dict[str, Any]:
+    """Version and load time of the bundle being served (None before the first load)"""
+    registry = model_registry()
+    if registry is not None and _R is not None:
+        return registry.status()
+    bundle = _R._active_bundle if _R is not None else None
+    return {"version": bundle.version if bundle else None, "loaded_at": bundle.loaded_at if bundle else None}
+
+def model_version() -> Optional[str]:
+    """Version of the bundle being served, loading the data first if needed"""
+    _ensure_loaded()
+    bundle = _recommenders()._active_bundle
+    return bundle.version if bundle else None
+
+def start_model_watcher():
+    """Poll the registry for a new CURRENT version (None if not configured)"""
+    registry = model_registry()
+    if registry is None or settings.registry_watch_interval_seconds <= 0:
+        return None
+    _recommenders()
+    return registry.watch(settings.registry_watch_interval_seconds)
+
+def stop_model_watcher():
+    if _registry is not None:
+        _registry.stop_watching(timeout=5)
 
 def _ensure_loaded():
+    # Must not be called while holding the model: the first registry load swaps it
     try:
+        R = _recommenders()
+        if R._active_bundle is None and model_registry() is not None:
+            with _registry_lock:
+                if R._active_bundle is None:
+                    model_registry().load()
         R._ensure_data_loaded()
     except Exception:
-        pass
+        logger.exception("Loading model data failed")
+
+def _holding_model(fn):
+    """fn run with the served bundle held, so a reload can't swap it mid-request"""
+    def call(*args, **kwargs):
+        with _recommenders().hold_model():
+            return fn(*args, **kwargs)
+    return call
 
-def get_trending(k: int = 20) -> List[Dict[str, Any]]:
+@profiled
+def get_trending(k: int = 20, category: Optional[str] = None) -> List[Dict[str, Any]]:
     _ensure_loaded()
-    return R.get_trending_articles(k=k)
+    return _trending_flight.do((k, category), _holding_model(_recommenders().get_trending_articles),
+                               k=k, category=category)
 
-def recommend(user_id: str, k: int = 10, recent_clicks: Optional[list] = None, locale: str = "en", algorithm: str = "hybrid") -> List[Dict[str, Any]]:
+@profiled
+def recommend(user_id: str, k: int = 10, recent_clicks: Optional[list] = None, locale: str = "en", algorithm: str = "hybrid",
+              category: Optional[str] = None, exclude_seen: bool = True, exclude_skipped: bool = False,
+              rerank: Optional[str] = None) -> List[Dict[str, Any]]:
     _ensure_loaded()
-    return R.recommend_for_user(user_id=user_id, k=k, recent_clicks=recent_clicks, locale=locale, algorithm=algorithm)
+    key = (user_id, k, tuple(recent_clicks) if recent_clicks else None, locale, algorithm, category,
+           exclude_seen, exclude_skipped, rerank)
+    return _recommend_flight.do(key, _holding_model(_recommenders().recommend_for_user), user_id=user_id, k=k,
+                                recent_clicks=recent_clicks, locale=locale, algorithm=algorithm, category=category,
+                                exclude_seen=exclude_seen, exclude_skipped=exclude_skipped, rerank=rerank)
 
+@profiled
 def keyword_search(q: str, k: int = 20, category: Optional[str] = None) -> List[Dict[str, Any]]:
     _ensure_loaded()
-    return R.search_by_keywords(q=q, k=k, category=category)
+    return _search_flight.do((q, k, category), _holding_model(_recommenders().search_by_keywords),
+                             q=q, k=k, category=category)
 
-def export_pdf(articles: List[Dict[str, Any]], user_id: str = "guest") -> str:
-    """Return an absolute/relative file path to the generated PDF."""
+@profiled
+def submit_pdf_export(articles: List[Dict[str, Any]], user_id: str = "guest") -> PdfJob:
+    """Queue a report render in the worker pool; cached reports come back as finished jobs."""
     # Extract item IDs from the RecItem objects
     news_ids = [article.get('item_id') for article in articles if article.get('item_id')]
     
+    key = PDF.report_cache_key(news_ids, user_id)
+    cached = _report_cache.get(key)
+    if cached is not None:
+        return pdf_jobs.completed(user_id, *cached)
+    
     # Get full article details for PDF generation
-    full_articles = R.get_article_details(news_ids)
+    _ensure_loaded()
+    full_articles = _holding_model(_recommenders().get_article_details)(news_ids)
     
-    return PDF.generate_pdf_from_articles(full_articles, user_id)
+    return pdf_jobs.submit(key, full_articles, user_id)
+
+def get_pdf_job(job_id: str) -> Optional[PdfJob]:
+    return pdf_jobs.get(job_id)
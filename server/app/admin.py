@@ -0,0 +1,16 @@
+"""Token check for /admin endpoints, shared by the API and the shard router."""
+
+import hmac
+
+from fastapi import HTTPException, Request
+
+from server.app.settings import settings
+
+
+def require_admin_token(request: Request) -> None:
+    """Raise 403 unless X-Admin-Token matches ADMIN_TOKEN; with no token configured admin is disabled"""
+    if not settings.admin_token:
+        raise HTTPException(403, "Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), settings.admin_token.encode()):
+        raise HTTPException(403, "Invalid admin token")
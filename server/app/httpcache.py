@@ -0,0 +1,88 @@
+"""Cached JSON response bodies with ETags, for conditional GETs that return 304 without recomputing."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from server.app.responses import dumps
+from utils.metrics import record_cache
+
+
+def etag_for(body: bytes) -> str:
+    # Weak: the same entity may be sent gzip- or brotli-encoded
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value matches etag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Thread-safe LRU of key -> (etag, JSON body), bounded by total bytes"""
+
+    def __init__(self, name: str, max_bytes: int = 16 * 1024 * 1024):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache(self.name, entry is not None)
+        return entry
+
+    def put(self, key: Hashable, etag: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous[1])
+            self._entries[key] = (etag, body)
+            self.size_bytes += len(body)
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def cached_json(request: Request, cache: ResponseCache, key: Hashable, compute: Callable[[], Any],
+                conditional: bool = True) -> Response:
+    """JSON response for key, computing and caching the body on a miss.
+
+    The key must change whenever the content can (e.g. include the model
+    version). With conditional, a matching If-None-Match gets a 304.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        body = dumps(compute())
+        entry = (etag_for(body), body)
+        cache.put(key, *entry)
+    etag, body = entry
+    # Clients may store the response but must revalidate before reusing it
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if conditional and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
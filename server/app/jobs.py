@@ -0,0 +1,134 @@
+"""Background PDF export jobs rendered in a bounded process pool."""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import pdf_utils as PDF
+from utils.metrics import record_stage
+
+
+class QueueFullError(Exception):
+    """Raised when too many exports are already pending"""
+
+
+class PdfJob:
+    def __init__(self, job_id: str, user_id: str, future: Future):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.future = future
+        self.created = time.time()
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        return "failed" if self.future.exception() is not None else "done"
+
+    @property
+    def error(self) -> Optional[str]:
+        if self.future.done() and self.future.exception() is not None:
+            return str(self.future.exception())
+        return None
+
+    def result(self) -> Tuple[bytes, str]:
+        """(content bytes, media type); only valid once status is 'done'"""
+        return self.future.result()
+
+    async def wait(self) -> Tuple[bytes, str]:
+        return await asyncio.wrap_future(self.future)
+
+
+class PdfJobQueue:
+    """Renders reports in worker processes with a cap on pending work.
+
+    The pool is bounded by ``max_workers`` processes and at most
+    ``max_pending`` renders may be queued or running; further submissions
+    raise ``QueueFullError`` so export bursts are rejected early instead of
+    tying up the API's request threads. Finished reports are added to the
+    shared report cache and kept for ``ttl`` seconds for download.
+    """
+
+    def __init__(self, cache: PDF.ReportCache, max_workers: int = 2, max_pending: int = 16, ttl: float = 600):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs: Dict[str, PdfJob] = {}
+        self._pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def completed(self, user_id: str, content: bytes, media_type: str) -> PdfJob:
+        """Register an already-rendered (cached) report as a finished job"""
+        future = Future()
+        future.set_result((content, media_type))
+        return self._register(PdfJob(uuid.uuid4().hex, user_id, future))
+
+    def submit(self, key: str, articles: List[Dict[str, Any]], user_id: str) -> PdfJob:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} PDF exports already pending")
+            self._pending += 1
+        # Timed here: metrics recorded inside a worker process never reach /metrics
+        started = time.perf_counter()
+        try:
+            try:
+                future = self._get_pool().submit(PDF.render_report, articles, user_id)
+            except BrokenProcessPool:
+                # A worker died; release the broken pool's manager thread and workers, retry once on a fresh one
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                future = self._get_pool().submit(PDF.render_report, articles, user_id)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        def on_done(done: Future):
+            with self._lock:
+                self._pending -= 1
+            record_stage("pdf_build", time.perf_counter() - started)
+            if not done.cancelled() and done.exception() is None:
+                content, media_type = done.result()
+                self.cache.put(key, content, media_type)
+
+        future.add_done_callback(on_done)
+        return self._register(PdfJob(uuid.uuid4().hex, user_id, future))
+
+    def get(self, job_id: str) -> Optional[PdfJob]:
+        return self._jobs.get(job_id)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _register(self, job: PdfJob) -> PdfJob:
+        with self._lock:
+            self._expire()
+            self._jobs[job.job_id] = job
+        return job
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.created < cutoff and job.future.done()]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -1,25 +1,154 @@
-from fastapi import FastAPI, HTTPException
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
 
 from server.app import adapters
+from server.app.admin import require_admin_token
+from server.app.compression import CompressionMiddleware
+from server.app.httpcache import cached_json
+from server.app.jobs import QueueFullError
+from server.app.pagination import CursorExpiredError, paginate
+from server.app.responses import FastJSONResponse, columnar
 from server.app.schemas import (
-    RecItem,
+    ColumnarRecommendResponse,
     RecommendRequest,
     RecommendResponse,
     SearchQuery,
     SummarizeRequest,
     ExportPdfRequest,
+    PdfJobResponse,
 )
 from server.app.settings import settings
+from utils import metrics
+from utils import profiling
+from utils.log import configure_logging, request_id_var
+
+configure_logging(settings.log_level, json_format=settings.log_json, queue_size=settings.log_queue_size)
+logger = logging.getLogger(__name__)
+
+
 
-app = FastAPI(title="Smart News Recommender API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.warmup:
+        await run_in_threadpool(adapters.warm_up, settings.warmup_algorithms)
+    if settings.precompute_scheduler:
+        await run_in_threadpool(adapters.start_precompute_scheduler)
+    adapters.start_model_watcher()
+    yield
+    adapters.stop_model_watcher()
+    adapters.stop_precompute_scheduler()
+    adapters.pdf_jobs.shutdown()
+
+
+app = FastAPI(title="Smart News Recommender API", version="1.0.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+
+
+def _endpoint_label(request: Request) -> str:
+    """Route template for the request (bounded label cardinality)"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        logger.info("Request completed", extra={
+            "method": request.method, "path": request.url.path, "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        })
+        return response
+    finally:
+        request_id_var.reset(token)
+
+
+if settings.metrics_enabled:
+    @app.middleware("http")
+    async def record_request_latency(request: Request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                method=request.method, endpoint=_endpoint_label(request), status=str(status),
+            )
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render_latest(), media_type=metrics.CONTENT_TYPE)
+
+
+if settings.profiling_enabled:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        mode = request.headers.get("x-profile") or request.query_params.get("profile")
+        if not mode:
+            return await call_next(request)
+        if settings.profiling_token and request.headers.get("x-profile-token") != settings.profiling_token:
+            return await call_next(request)
+        if mode not in profiling.MODES:
+            mode = settings.profiling_default_mode
+
+        profile_request, token = profiling.activate(mode)
+        try:
+            response = await call_next(request)
+        finally:
+            profiling.deactivate(token)
+
+        if profile_request.profiles:
+            os.makedirs(settings.profiling_dir, exist_ok=True)
+            profile_id = uuid.uuid4().hex
+            for i, profile in enumerate(profile_request.profiles):
+                suffix = f"-{i}" if i else ""
+                profile.save(os.path.join(settings.profiling_dir, f"{profile_id}{suffix}{profile.extension}"))
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    @app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+    def download_profile(profile_id: str):
+        if not profile_id.isalnum():
+            raise HTTPException(404, "Profile not found")
+        for extension in (".folded", ".prof"):
+            path = os.path.join(settings.profiling_dir, profile_id + extension)
+            if os.path.exists(path):
+                return FileResponse(path, filename=profile_id + extension,
+                                    media_type="application/octet-stream")
+        raise HTTPException(404, "Profile not found")
 
 
 @app.get("/health")
@@ -27,42 +156,172 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """Model version being served; version is null until data is loaded (first request or warm-up)"""
+    status = adapters.model_status()
+    return {"status": "ready" if status["version"] else "loading", "model": status}
+
+
+@app.post("/admin/reload")
+def admin_reload(request: Request, version: Optional[str] = None):
+    """Load a model version (default: the registry's CURRENT) and swap it in once warm"""
+    require_admin_token(request)
+    if adapters.model_registry() is None:
+        raise HTTPException(404, "No model registry configured")
+    try:
+        return adapters.reload_model(version)
+    except FileNotFoundError as e:
+        raise HTTPException(404, str(e))
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+# The recommenders already return plain item dicts of the documented shape, so
+# these endpoints serialize them directly with orjson instead of building
+# pydantic models and letting FastAPI re-validate and re-encode them.
+# Trending and search bodies only change with the model version: they are
+# cached serialized, with an ETag, and If-None-Match on GET gets a 304.
+
 @app.get("/trending")
-def trending(k: int = 20):
+def trending(request: Request, k: int = 20, category: Optional[str] = None):
     try:
-        items = adapters.get_trending(k=k)
-        return {"items": items}
+        key = ("trending", adapters.model_version(), k, category)
+        return cached_json(request, adapters.response_cache, key,
+                           lambda: {"items": adapters.get_trending(k=k, category=category)})
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
-@app.post("/recommend", response_model=RecommendResponse)
+def _paginate(scope: str, compute, page_size: Optional[int], cursor: Optional[str]):
+    try:
+        return paginate(adapters.ranked_lists, scope, compute, page_size, cursor,
+                        default_page_size=settings.pagination_default_page_size)
+    except CursorExpiredError as e:
+        raise HTTPException(410, str(e))
+
+
+@app.post("/recommend", response_model=RecommendResponse | ColumnarRecommendResponse)
 def recommend(req: RecommendRequest):
     """Personalized recommendations using different algorithms"""
+    if not adapters.owns_user(req.user_id):
+        # Sharded mode: this process has no history for the user; the router sends them to the owner
+        raise HTTPException(421, f"User {req.user_id!r} belongs to another shard")
+    paginated = req.page_size is not None or req.cursor is not None
     try:
-        raw = adapters.recommend(
-            req.user_id, k=req.k, recent_clicks=req.recent_clicks, 
-            locale=req.locale, algorithm=req.algorithm
-        )
-        items = [RecItem(**r) for r in raw]
-        return {"user_id": req.user_id, "items": items}
+        def compute(k):
+            return adapters.recommend(
+                req.user_id, k=k, recent_clicks=req.recent_clicks, 
+                locale=req.locale, algorithm=req.algorithm, category=req.category,
+                exclude_seen=req.exclude_seen, exclude_skipped=req.exclude_skipped, rerank=req.rerank
+            )
+        if paginated:
+            scope = (f"recommend:{req.user_id}:{req.algorithm}:{req.category}"
+                     f":{req.exclude_seen}:{req.exclude_skipped}:{req.rerank}")
+            items, next_cursor = _paginate(scope, lambda: compute(settings.pagination_depth),
+                                           req.page_size, req.cursor)
+        else:
+            items = compute(req.k)
+        content = {"user_id": req.user_id}
+        if req.format == "columnar":
+            content["columns"] = columnar(items)
+        else:
+            content["items"] = items
+        if paginated:
+            content["next_cursor"] = next_cursor
+        return FastJSONResponse(content)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
-@app.post("/search")
-def search(body: SearchQuery):
+def _search_response(request: Request, q: str, k: int, category: Optional[str], conditional: bool,
+                     page_size: Optional[int] = None, cursor: Optional[str] = None):
     try:
-        items = adapters.keyword_search(body.q, k=body.k, category=body.category)
-        return {"items": items}
+        if page_size is not None or cursor is not None:
+            items, next_cursor = _paginate(
+                f"search:{q}:{category}",
+                lambda: adapters.keyword_search(q, k=settings.pagination_depth, category=category),
+                page_size, cursor)
+            return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+        key = ("search", adapters.model_version(), q, k, category)
+        return cached_json(request, adapters.response_cache, key,
+                           lambda: {"items": adapters.keyword_search(q, k=k, category=category)},
+                           conditional=conditional)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
+@app.post("/search")
+def search(request: Request, body: SearchQuery):
+    return _search_response(request, body.q, body.k, body.category, conditional=False,
+                            page_size=body.page_size, cursor=body.cursor)
+
+
+@app.get("/search")
+def search_get(request: Request, q: str, k: int = 20, category: Optional[str] = None,
+               page_size: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None):
+    """Same as POST /search; as a GET it can be revalidated with If-None-Match"""
+    return _search_response(request, q, k, category, conditional=True, page_size=page_size, cursor=cursor)
+
+
+def _report_response(content: bytes, media_type: str) -> Response:
+    filename = "smart_news_report.pdf" if media_type == "application/pdf" else "smart_news_report.txt"
+    return Response(content, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def _job_response(job) -> PdfJobResponse:
+    download_url = f"/export/pdf/jobs/{job.job_id}/download" if job.status == "done" else None
+    return PdfJobResponse(job_id=job.job_id, status=job.status, error=job.error, download_url=download_url)
+
+
 @app.post("/export/pdf")
-def export_pdf(body: ExportPdfRequest):
+async def export_pdf(body: ExportPdfRequest):
+    """Render a report and return it; rendering runs in the PDF worker pool"""
+    try:
+        job = await run_in_threadpool(
+            adapters.submit_pdf_export, [i.model_dump() for i in body.articles], body.user_id
+        )
+        content, media_type = await job.wait()
+        return _report_response(content, media_type)
+    except QueueFullError as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.post("/export/pdf/jobs", response_model=PdfJobResponse, status_code=202)
+def submit_pdf_job(body: ExportPdfRequest):
+    """Queue a report render and return a job id to poll"""
     try:
-        path = adapters.export_pdf([i.model_dump() for i in body.articles], body.user_id)
-        return FileResponse(path, filename="smart_news_report.pdf", media_type="application/pdf")
+        job = adapters.submit_pdf_export([i.model_dump() for i in body.articles], body.user_id)
+        return _job_response(job)
+    except QueueFullError as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(500, str(e))
+
+
+@app.get("/export/pdf/jobs/{job_id}", response_model=PdfJobResponse)
+def pdf_job_status(job_id: str):
+    job = adapters.get_pdf_job(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return _job_response(job)
+
+
+@app.get("/export/pdf/jobs/{job_id}/download")
+def download_pdf_job(job_id: str):
+    job = adapters.get_pdf_job(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if job.status == "failed":
+        raise HTTPException(500, job.error)
+    if job.status != "done":
+        raise HTTPException(409, f"Job is {job.status}")
+    content, media_type = job.result()
+    return _report_response(content, media_type)
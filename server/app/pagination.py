@@ -0,0 +1,79 @@
+"""Cursor pagination over ranked lists computed once and kept server-side.
+
+The first paginated call ranks up to a fixed depth and stores the list under
+a random token; the cursor returned with each page is "<token>.<offset>", so
+following pages are slices of the stored list and cost no ranking work.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import record_cache
+
+
+class CursorExpiredError(Exception):
+    """Raised for unknown, expired or malformed cursors"""
+
+
+class RankedListCache:
+    """Thread-safe LRU of token -> ranked list, bounded by count and age"""
+
+    def __init__(self, max_lists: int = 2000, ttl: float = 600):
+        self.max_lists = max_lists
+        self.ttl = ttl
+        self._lists = OrderedDict()  # token -> (scope, items, page_size, created)
+        self._lock = threading.Lock()
+
+    def put(self, scope: str, items: List[Dict[str, Any]], page_size: int) -> str:
+        token = secrets.token_urlsafe(12)
+        with self._lock:
+            self._lists[token] = (scope, items, page_size, time.monotonic())
+            while len(self._lists) > self.max_lists:
+                self._lists.popitem(last=False)
+        return token
+
+    def get(self, scope: str, token: str):
+        """(items, page_size) stored for token in scope, or None"""
+        with self._lock:
+            entry = self._lists.get(token)
+            if entry is not None and time.monotonic() - entry[3] > self.ttl:
+                del self._lists[token]
+                entry = None
+            if entry is not None:
+                self._lists.move_to_end(token)
+        hit = entry is not None and entry[0] == scope
+        record_cache("ranked_list", hit)
+        return (entry[1], entry[2]) if hit else None
+
+    def __len__(self):
+        return len(self._lists)
+
+
+def paginate(cache: RankedListCache, scope: str, compute: Callable[[], List[Dict[str, Any]]],
+             page_size: Optional[int] = None, cursor: Optional[str] = None,
+             default_page_size: int = 20) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """(page items, next cursor or None). Without a cursor, compute() ranks the full list.
+
+    scope ties a list to the request it came from (e.g. endpoint and user),
+    so a cursor cannot be replayed against another one.
+    """
+    if cursor is None:
+        items = compute()
+        page_size = page_size or default_page_size
+        if len(items) <= page_size:
+            return items, None
+        token = cache.put(scope, items, page_size)
+        return items[:page_size], f"{token}.{page_size}"
+
+    token, _, offset = cursor.rpartition(".")
+    entry = cache.get(scope, token) if token and offset.isdigit() else None
+    if entry is None:
+        raise CursorExpiredError("Cursor expired or invalid; request the first page again")
+    items, stored_page_size = entry
+    offset = int(offset)
+    end = offset + (page_size or stored_page_size)
+    next_cursor = f"{token}.{end}" if end < len(items) else None
+    return items[offset:end], next_cursor
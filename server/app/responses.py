@@ -0,0 +1,43 @@
+"""JSON responses serialized with orjson, skipping FastAPI's re-validation and encoding passes."""
+
+import json
+from typing import Any, Dict, List
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional dependency
+    ORJSON_AVAILABLE = False
+
+# Fields of a recommendation item, in response order
+ITEM_FIELDS = ("item_id", "score", "title", "reason")
+
+
+def dumps(content: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        # NaN becomes null, numpy scalars and arrays are serialized natively
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _default(value):
+    # numpy values orjson does not cover natively (and all of them without orjson)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(Response):
+    """Response for content that is already plain dicts/lists of the documented shape"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def columnar(items: List[Dict[str, Any]]) -> Dict[str, list]:
+    """Items as one array per field: {"item_id": [...], "score": [...], ...}"""
+    return {field: [item.get(field) for item in items] for field in ITEM_FIELDS}
@@ -0,0 +1,242 @@
+"""
+Router in front of sharded API processes.
+
+In sharded mode every shard runs server.app.main with SHARD_INDEX and
+SHARD_COUNT and keeps only the users hashed to it (see utils/sharding.py);
+articles and item-side models are on every shard. This app sits in front:
+
+    POST /recommend          forwarded to the shard owning user_id
+    GET  /trending, /search  one shard chosen by query (the data is replicated),
+    POST /search             the next one if it is down
+    POST /admin/reload       sent to every shard
+    GET  /ready              ready when every shard is
+    anything else            shard 0 (PDF jobs and profiles are per process)
+
+Run N local shards and the router on one box:
+    python -m server.app.router --shards 4 --port 8000 --base-port 8100
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from pydantic import ValidationError
+
+from server.app.admin import require_admin_token
+from server.app.compression import CompressionMiddleware
+from server.app.responses import FastJSONResponse
+from server.app.schemas import RecommendRequest
+from server.app.settings import settings
+from utils.log import configure_logging
+from utils.sharding import HashRing
+
+configure_logging(settings.log_level, json_format=settings.log_json, queue_size=settings.log_queue_size)
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Hop-by-hop and body-encoding headers are not copied from shard responses (httpx decodes the body)
+DROPPED_RESPONSE_HEADERS = {"connection", "content-encoding", "content-length", "transfer-encoding", "vary"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not settings.shard_urls:
+        raise RuntimeError("SHARD_URLS is empty; list the shard base URLs in shard index order")
+    app.state.shard_urls = [url.rstrip("/") for url in settings.shard_urls]
+    app.state.ring = HashRing.for_shards(len(app.state.shard_urls))
+    app.state.client = httpx.AsyncClient(timeout=settings.router_timeout_seconds)
+    yield
+    await app.state.client.aclose()
+
+
+app = FastAPI(title="Smart News Recommender Router", version="1.0.0", lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.cors_origins,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+
+
+def _forward_headers(request: Request) -> Dict[str, str]:
+    headers = {"X-Request-ID": request.headers.get("x-request-id") or uuid.uuid4().hex}
+    for name in ("content-type", "if-none-match", "x-admin-token", "x-profile", "x-profile-token"):
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    return headers
+
+
+async def _send(request: Request, shard: int, path: Optional[str] = None, body: Optional[bytes] = None):
+    url = request.app.state.shard_urls[shard] + (path or request.url.path)
+    try:
+        return await request.app.state.client.request(
+            request.method, url, params=request.query_params, headers=_forward_headers(request),
+            content=await request.body() if body is None else body)
+    except httpx.HTTPError as e:
+        logger.warning("Shard request failed", extra={"shard": shard, "url": url, "error": str(e)})
+        raise HTTPException(502, f"Shard {shard} unavailable")
+
+
+def _relay(response: httpx.Response) -> Response:
+    headers = {name: value for name, value in response.headers.items()
+               if name.lower() not in DROPPED_RESPONSE_HEADERS}
+    return Response(response.content, status_code=response.status_code, headers=headers)
+
+
+async def _fan_out(request: Request, path: Optional[str] = None) -> List[Any]:
+    """Send the request to every shard; httpx responses, or None for shards that could not be reached"""
+    body = await request.body()
+    results = await asyncio.gather(
+        *(_send(request, shard, path, body) for shard in range(len(request.app.state.shard_urls))),
+        return_exceptions=True)
+    return [result if isinstance(result, httpx.Response) else None for result in results]
+
+
+async def _send_with_failover(request: Request, shard: int) -> Response:
+    """Relay the first answer from shard, trying the following shards while one is down or fails (5xx)"""
+    count = len(request.app.state.shard_urls)
+    response = None
+    for attempt in range(count):
+        index = (shard + attempt) % count
+        try:
+            response = await _send(request, index)
+        except HTTPException:
+            continue
+        if response.status_code < 500:
+            return _relay(response)
+        logger.warning("Shard failed, trying the next one", extra={"shard": index, "path": request.url.path,
+                                                                   "status": response.status_code})
+    if response is None:
+        raise HTTPException(502, "No shard answered")
+    return _relay(response)
+
+
+def _replica_for(request: Request, key: str) -> int:
+    # Same key, same shard: its response and ranked-list caches stay warm
+    return request.app.state.ring.index_for(key)
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready(request: Request):
+    responses = await _fan_out(request)
+    shards = [response.json() if response is not None and response.status_code == 200 else {"status": "unavailable"}
+              for response in responses]
+    status = "ready" if all(shard.get("status") == "ready" for shard in shards) else "loading"
+    return FastJSONResponse({"status": status, "shards": shards}, status_code=200 if status == "ready" else 503)
+
+
+@app.post("/recommend")
+async def recommend(request: Request):
+    try:
+        user_id = RecommendRequest.model_validate_json(await request.body()).user_id
+    except ValidationError as e:
+        raise HTTPException(422, e.errors(include_url=False, include_context=False))
+    return _relay(await _send(request, request.app.state.ring.index_for(user_id)))
+
+
+@app.get("/trending")
+async def trending(request: Request):
+    key = f"trending:{request.query_params.get('category')}"
+    return await _send_with_failover(request, _replica_for(request, key))
+
+
+@app.api_route("/search", methods=["GET", "POST"])
+async def search(request: Request):
+    if request.method == "GET":
+        params = request.query_params
+    else:
+        try:
+            params = await request.json()
+        except ValueError:
+            raise HTTPException(422, "Invalid JSON body")
+        if not isinstance(params, dict):
+            raise HTTPException(422, "Expected a JSON object")
+    # Paginated searches must stay on the shard holding the cursor's ranked list
+    key = f"search:{params.get('q')}:{params.get('category')}"
+    return await _send_with_failover(request, _replica_for(request, key))
+
+
+@app.post("/admin/reload")
+async def admin_reload(request: Request):
+    # Checked here too, so an unauthenticated call never reaches the shards
+    require_admin_token(request)
+    responses = await _fan_out(request)
+    shards = [{"status_code": response.status_code, "body": response.json()} if response is not None
+              else {"status_code": 502, "body": None} for response in responses]
+    return FastJSONResponse({"shards": shards}, status_code=max(shard["status_code"] for shard in shards))
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def forward_to_first_shard(request: Request, path: str):
+    # PDF jobs, profiles and metrics are per process: pin them to one shard
+    return _relay(await _send(request, 0))
+
+
+def _spawn_shard(index, count, port, host="127.0.0.1"):
+    """Start one shard (server.app.main with SHARD_INDEX/SHARD_COUNT) and wait for /health"""
+    env = dict(os.environ, SHARD_INDEX=str(index), SHARD_COUNT=str(count))
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "server.app.main:app",
+                                "--host", host, "--port", str(port)], cwd=PROJECT_ROOT, env=env)
+    for _ in range(120):
+        try:
+            if httpx.get(f"http://{host}:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError(f"Shard {index} exited before becoming healthy")
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Shard {index} did not become healthy in time")
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run N local shards behind the router")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--host", default=settings.host, help="Router host")
+    parser.add_argument("--port", type=int, default=settings.port, help="Router port")
+    parser.add_argument("--base-port", type=int, default=8100, help="Shard i listens on base-port + i")
+    args = parser.parse_args(argv)
+
+    processes = []
+    try:
+        for index in range(args.shards):
+            processes.append(_spawn_shard(index, args.shards, args.base_port + index))
+        settings.shard_urls = [f"http://127.0.0.1:{args.base_port + index}" for index in range(args.shards)]
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
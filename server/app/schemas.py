@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class RecommendRequest(BaseModel):
@@ -8,7 +8,15 @@ class RecommendRequest(BaseModel):
     k: Optional[int] = 10
     recent_clicks: Optional[List[str]] = None
     locale: Optional[str] = "en"
-    algorithm: Optional[str] = "hybrid"  # "hybrid", "collaborative", "content", "bert"
+    algorithm: Optional[str] = "hybrid"  # "hybrid", "collaborative", "content", "bert", "semantic", "entity"
+    category: Optional[str] = None  # restrict to a Category or SubCategory
+    exclude_seen: bool = True  # leave out articles in the user's history and recent_clicks
+    exclude_skipped: bool = False  # also leave out articles shown to the user and not clicked
+    rerank: Optional[Literal["mmr", "category"]] = None  # diversify: maximal marginal relevance or category quota
+    format: Literal["items", "columnar"] = "items"  # "columnar": one array per field (batch clients)
+    # Pagination: page_size starts a ranked list (k is ignored), cursor fetches the next page
+    page_size: Optional[int] = Field(None, ge=1)
+    cursor: Optional[str] = None
 
 
 class RecItem(BaseModel):
@@ -21,12 +29,28 @@ class RecItem(BaseModel):
 class RecommendResponse(BaseModel):
     user_id: str
     items: List[RecItem]
+    next_cursor: Optional[str] = None  # only on paginated requests; null on the last page
+
+
+class ColumnarItems(BaseModel):
+    item_id: List[str]
+    score: List[float]
+    title: List[Optional[str]]
+    reason: List[Optional[str]]
+
+
+class ColumnarRecommendResponse(BaseModel):
+    user_id: str
+    columns: ColumnarItems
+    next_cursor: Optional[str] = None
 
 
 class SearchQuery(BaseModel):
     q: str
     k: Optional[int] = 20
     category: Optional[str] = None  # New: category filter
+    page_size: Optional[int] = Field(None, ge=1)  # see RecommendRequest
+    cursor: Optional[str] = None
 
 
 class SummarizeRequest(BaseModel):
@@ -38,3 +62,10 @@ class SummarizeRequest(BaseModel):
 class ExportPdfRequest(BaseModel):
     articles: List[RecItem]  # or a leaner schema; keep keys used in pdf_utils
     user_id: Optional[str] = "guest"  # Add user_id field with default
+
+
+class PdfJobResponse(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "done", "failed"
+    error: Optional[str] = None
+    download_url: Optional[str] = None
@@ -1,3 +1,7 @@
+import os
+import tempfile
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -13,6 +17,79 @@ class Settings(BaseSettings):
         "https://snr-web.azurestaticapps.net",  # Azure Static Web Apps
         "https://*.azurestaticapps.net",  # Allow all Azure SWA subdomains
     ]  # Vite dev + Azure SWA
+    metrics_enabled: bool = True  # Expose Prometheus metrics at /metrics
+
+    # Response compression (brotli if installed, else gzip) and cached /trending, /search bodies
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024  # Smaller bodies are sent as is
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    response_cache_max_bytes: int = 16 * 1024 * 1024  # Serialized bodies kept for ETag/304
+
+    # Cursor pagination: the first page ranks pagination_depth items, later pages slice them
+    pagination_depth: int = 200
+    pagination_default_page_size: int = 20
+    pagination_max_lists: int = 2000  # Ranked lists kept (LRU)
+    pagination_ttl_seconds: int = 600
+
+    # Diversity re-ranking on /recommend ("rerank": "mmr" or "category"), see utils/diversity.py
+    diversity_pool_size: int = 50  # Candidates ranked before re-ranking (at least 2 * k)
+    diversity_weight: float = 0.3  # MMR: 0 is pure relevance, 1 pure novelty
+    diversity_max_per_category: int = 2  # Category quota per response
+
+    # Heavy modules (pandas, sklearn, torch) load on first use unless warmed up at startup
+    warmup: bool = False  # Load data before serving instead of on the first request
+    warmup_algorithms: list[str] = []  # Also run one request per algorithm, e.g. ["hybrid", "bert"]
+
+    # Structured logging (queue-based, written by a background thread)
+    log_level: str = "INFO"
+    log_json: bool = True  # JSON lines; False for human-readable text
+    log_queue_size: int = 10000  # Records beyond this are dropped, never blocking
+
+    # Opt-in request profiling: send "X-Profile: cprofile|sample" or ?profile=...
+    profiling_enabled: bool = False
+    profiling_token: Optional[str] = None  # If set, X-Profile-Token must match
+    profiling_default_mode: str = "cprofile"
+    profiling_dir: str = os.path.join(tempfile.gettempdir(), "snr_profiles")
+
+    # Per-algorithm /recommend deadline, e.g. {"bert": 300, "hybrid": 500}; past it a
+    # degraded result (last good response, CF model, trending) is returned
+    recommend_deadlines_ms: dict[str, float] = {}
+    recommend_workers: int = 8  # Threads running deadline-bound recommendations
+
+    # Precomputed top-k for the most active users (see utils/precompute.py)
+    precompute_db: Optional[str] = None  # SQLite store to serve from; None disables
+    precompute_max_age_seconds: int = 3600  # Older entries fall back to online scoring
+    precompute_scheduler: bool = False  # Refresh the store from this process
+    precompute_interval_seconds: int = 900
+    precompute_algorithms: list[str] = ["collaborative"]
+    precompute_users: int = 1000
+    precompute_k: int = 50
+
+    embeddings_dir: Optional[str] = None  # Article embeddings artifact (default: artifacts/embeddings)
+
+    # Versioned model bundles (see utils/registry.py); None serves MINDsmall_train
+    registry_dir: Optional[str] = None
+    registry_watch_interval_seconds: float = 0  # Poll for a new CURRENT version; 0 disables
+    admin_token: Optional[str] = None  # /admin endpoints require a matching X-Admin-Token; unset disables them
+
+    # Sharded mode (see server/app/router.py): users are split by consistent hash of user_id
+    shard_index: int = 0  # This process serves the users hashed to this shard...
+    shard_count: int = 1  # ...of this many; 1 serves everyone
+    shard_urls: list[str] = []  # Router only: base URL of each shard, in shard index order
+    router_timeout_seconds: float = 10
+
+    # BERT4Rec CPU inference
+    bert_quantize: bool = True  # int8 dynamic quantization of Linear layers
+    bert_num_threads: Optional[int] = None  # intra-op threads; set to cores / uvicorn workers
+    bert_interop_threads: Optional[int] = None
+    bert_export: Optional[str] = None  # None, "torchscript" or "onnx"
+    bert_max_length: int = 64  # truncation length (padding is dynamic)
+
+    pdf_cache_max_bytes: int = 64 * 1024 * 1024  # LRU budget for rendered reports
+    pdf_workers: int = 2  # Processes rendering PDFs outside the request threads
+    pdf_max_pending: int = 16  # Exports queued or rendering before new ones get 429
+    pdf_job_ttl_seconds: int = 600  # How long finished export jobs stay downloadable
 
 
 settings = Settings()
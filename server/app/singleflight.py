@@ -0,0 +1,59 @@
+"""Single-flight deduplication of concurrent identical calls."""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from utils.metrics import record_singleflight
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome.
+
+    The first caller for a key (the leader) runs the function. Callers that
+    arrive with the same key while it runs block until it finishes and get the
+    same result object, or the same exception. Nothing is cached: once the
+    call returns, the next caller starts a fresh computation. Shared results
+    must be treated as read-only.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            record_singleflight(self.name, shared=True)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            record_singleflight(self.name, shared=False)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,77 @@
+"""
+Import-time budget check for the API.
+
+Imports the app in fresh interpreters and fails (exit code 1) if the median
+import time exceeds the budget, or if any heavy module that should only load
+on first use (pandas, sklearn, torch, ...) was imported eagerly. Run it in CI
+or before shipping an image, since scale-out cold starts pay this cost.
+
+Usage:
+    python -m server.import_budget
+    python -m server.import_budget --budget 0.8 --runs 7
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULE = "server.app.main"
+DEFAULT_BUDGET_SECONDS = 1.0
+
+# Must not be imported until an algorithm or endpoint needs them
+LAZY_MODULES = ["pandas", "sklearn", "scipy", "torch", "transformers", "reportlab", "onnxruntime"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module=DEFAULT_MODULE, runs=5):
+    """Import times (seconds) over fresh interpreters and the lazy modules that got loaded"""
+    times, loaded = [], set()
+    probe = _PROBE.format(module=module, lazy=LAZY_MODULES)
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True,
+                             cwd=PROJECT_ROOT)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return times, sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that importing the API stays within a time budget")
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Median import seconds allowed")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    times, loaded = measure(args.module, args.runs)
+    median = statistics.median(times)
+    print(f"import {args.module}: median {median * 1000:.0f}ms "
+          f"(min {min(times) * 1000:.0f}ms, max {max(times) * 1000:.0f}ms, {args.runs} runs), "
+          f"budget {args.budget * 1000:.0f}ms")
+
+    ok = True
+    if median > args.budget:
+        print(f"FAIL: import time over budget by {(median - args.budget) * 1000:.0f}ms")
+        ok = False
+    if loaded:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(loaded)}")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+HTTP load-test scenarios for the Smart News Recommender API.
+
+Drives /recommend (one scenario per algorithm), /search, /trending and
+/export/pdf with a fixed number of concurrent keep-alive clients. User ids
+are sampled from behaviors.tsv (uniformly over users or weighted by their
+impression count) and search queries from news titles, using a seeded RNG so
+runs are reproducible. Reports throughput and a latency histogram per
+scenario, optionally as JSON.
+
+Usage (from the project root):
+    python -m server.loadtest --spawn --concurrency 8 --duration 60
+    python -m server.loadtest --url http://localhost:8000 \
+        --mix recommend:hybrid=4,recommend:bert=1,search=2,trending=2,export_pdf=1 \
+        --user-dist weighted --output loadtest.json
+
+Only the standard library is used so the generator can run anywhere.
+"""
+
+import argparse
+import csv
+import http.client
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_ROOT, 'MINDsmall_train')
+
+ALGORITHMS = ["collaborative", "content", "hybrid", "bert"]
+DEFAULT_MIX = "recommend:hybrid=3,recommend:collaborative=1,recommend:content=1," \
+              "recommend:bert=1,search=2,trending=2,export_pdf=1"
+
+# Histogram bucket upper bounds in milliseconds (roughly log-spaced)
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+WARM_UP_SEED = 0
+
+csv.field_size_limit(sys.maxsize)
+
+
+class Workload:
+    """Seeded request generator backed by the MIND behaviors and news files"""
+
+    def __init__(self, data_dir=DATA_DIR, user_dist="uniform", seed=42, max_rows=50000, k=10):
+        self.rng = random.Random(seed)
+        self.k = k
+        self.user_dist = user_dist
+        self.users, self.user_weights = self._load_users(os.path.join(data_dir, 'behaviors.tsv'), max_rows)
+        self.news_ids, self.query_terms = self._load_news(os.path.join(data_dir, 'news.tsv'), max_rows)
+
+    @staticmethod
+    def _load_users(path, max_rows):
+        counts = Counter()
+        with open(path, encoding='utf-8') as f:
+            for i, row in enumerate(csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)):
+                if i >= max_rows:
+                    break
+                if len(row) > 1:
+                    counts[row[1]] += 1
+        users = list(counts)
+        return users, [counts[u] for u in users]
+
+    @staticmethod
+    def _load_news(path, max_rows):
+        news_ids, terms = [], Counter()
+        with open(path, encoding='utf-8') as f:
+            for i, row in enumerate(csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)):
+                if i >= max_rows:
+                    break
+                if len(row) > 3:
+                    news_ids.append(row[0])
+                    terms.update(w.lower() for w in row[3].split() if len(w) > 4 and w.isalpha())
+        # Popular title words make realistic, repeating search queries
+        return news_ids, [w for w, _ in terms.most_common(200)]
+
+    def sample_user(self, rng=None):
+        rng = rng or self.rng
+        if self.user_dist == "weighted":
+            return rng.choices(self.users, weights=self.user_weights, k=1)[0]
+        return rng.choice(self.users)
+
+    def build(self, scenario, rng=None):
+        """Return (method, path, json body or None) for a scenario name, drawing from rng (default self.rng)"""
+        rng = rng or self.rng
+        if scenario.startswith("recommend:"):
+            algorithm = scenario.split(":", 1)[1]
+            return "POST", "/recommend", {"user_id": self.sample_user(rng), "k": self.k, "algorithm": algorithm}
+        if scenario == "search":
+            return "POST", "/search", {"q": rng.choice(self.query_terms), "k": 20}
+        if scenario == "trending":
+            return "GET", f"/trending?k={self.k * 2}", None
+        if scenario == "export_pdf":
+            articles = [{"item_id": nid, "score": 1.0} for nid in rng.sample(self.news_ids, self.k)]
+            return "POST", "/export/pdf", {"articles": articles, "user_id": self.sample_user(rng)}
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+
+class ScenarioStats:
+    """Latency samples and error counts for one scenario"""
+
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = Counter()
+        self.bytes_received = 0
+
+    def summary(self, elapsed):
+        lat = sorted(self.latencies_ms)
+        ok = len(lat)
+        histogram = Counter()
+        for value in lat:
+            bucket = next((b for b in BUCKETS_MS if value <= b), math.inf)
+            histogram["+Inf" if bucket == math.inf else f"<={bucket}ms"] += 1
+        return {
+            "requests": ok + sum(self.errors.values()),
+            "ok": ok,
+            "errors": dict(self.errors),
+            "throughput_rps": round(ok / elapsed, 3) if elapsed > 0 else None,
+            "bytes_received": self.bytes_received,
+            "latency_ms": {
+                "mean": round(sum(lat) / ok, 3) if ok else None,
+                "p50": _percentile(lat, 50),
+                "p90": _percentile(lat, 90),
+                "p95": _percentile(lat, 95),
+                "p99": _percentile(lat, 99),
+                "max": round(lat[-1], 3) if ok else None,
+            },
+            "histogram": {label: histogram[label] for label in
+                          [f"<={b}ms" for b in BUCKETS_MS] + ["+Inf"] if histogram[label]},
+        }
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[index], 3)
+
+
+def parse_mix(mix):
+    """Parse 'scenario=weight,...' into parallel lists of names and weights"""
+    names, weights = [], []
+    for part in mix.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        names.append(name.strip())
+        weights.append(float(weight) if weight else 1.0)
+    return names, weights
+
+
+def run_load(base_url, workload, scenarios, weights, concurrency=8, duration=30.0,
+             max_requests=None, timeout=120.0):
+    """Run closed-loop clients against base_url; return (stats per scenario, elapsed)"""
+    target = urlparse(base_url)
+    stats = {name: ScenarioStats() for name in scenarios}
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration
+
+    # Pre-generate the request sequence so the mix is identical across runs
+    plan_size = max_requests or max(1000, concurrency * 500)
+    plan = [(name, workload.build(name)) for name in
+            workload.rng.choices(scenarios, weights=weights, k=plan_size)]
+
+    def next_request():
+        with lock:
+            if max_requests is not None and issued[0] >= max_requests:
+                return None
+            item = plan[issued[0] % len(plan)]
+            issued[0] += 1
+            return item
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=timeout)
+        while time.perf_counter() < deadline:
+            item = next_request()
+            if item is None:
+                break
+            name, (method, path, body) = item
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload else {}
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with lock:
+                    if response.status < 400:
+                        stats[name].latencies_ms.append(elapsed_ms)
+                        stats[name].bytes_received += len(data)
+                    else:
+                        stats[name].errors[str(response.status)] += 1
+            except Exception as e:
+                with lock:
+                    stats[name].errors[type(e).__name__] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=timeout)
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stats, time.perf_counter() - started
+
+
+def spawn_server(port, workers=1):
+    """Start a local uvicorn instance from the project root and wait for /health"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.app.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=PROJECT_ROOT,
+    )
+    for _ in range(120):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited before becoming healthy")
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy in time")
+
+
+def warm_up(base_url, workload, scenarios, timeout=600.0):
+    """Issue each scenario once, in order, so data and model loading is not measured.
+    
+    Requests are drawn from a separate RNG so workload.rng, and with it the
+    measured request plan, is the same whether or not the warm-up ran.
+    """
+    target = urlparse(base_url)
+    rng = random.Random(WARM_UP_SEED)
+    stats = {name: ScenarioStats() for name in scenarios}
+    conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=timeout)
+    try:
+        for name in scenarios:
+            method, path, body = workload.build(name, rng)
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload else {}
+            start = time.perf_counter()
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            if response.status < 400:
+                stats[name].latencies_ms.append((time.perf_counter() - start) * 1000)
+                stats[name].bytes_received += len(data)
+            else:
+                stats[name].errors[str(response.status)] += 1
+    finally:
+        conn.close()
+    return stats
+
+
+def print_report(report):
+    print(f"\n{'scenario':24s} {'ok':>7s} {'err':>5s} {'rps':>8s} {'p50':>9s} "
+          f"{'p95':>9s} {'p99':>9s} {'max':>9s}")
+    for name, s in report["scenarios"].items():
+        lat = s["latency_ms"]
+        print(f"{name:24s} {s['ok']:7d} {sum(s['errors'].values()):5d} "
+              f"{s['throughput_rps'] or 0:8.2f} {lat['p50'] or 0:9.1f} {lat['p95'] or 0:9.1f} "
+              f"{lat['p99'] or 0:9.1f} {lat['max'] or 0:9.1f}")
+    for name, s in report["scenarios"].items():
+        total = max(s["ok"], 1)
+        print(f"\n{name} latency histogram:")
+        for label, count in s["histogram"].items():
+            bar = "#" * max(1, round(40 * count / total))
+            print(f"  {label:>10s} {count:7d} {bar}")
+    print(f"\nTotal: {report['total_ok']} ok in {report['elapsed_s']}s "
+          f"({report['total_rps']} req/s, concurrency {report['config']['concurrency']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Smart News Recommender API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the API")
+    parser.add_argument("--spawn", action="store_true", help="Start a local uvicorn instance first")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --spawn")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --spawn")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted scenarios, e.g. 'recommend:hybrid=3,search=1'")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests")
+    parser.add_argument("--user-dist", choices=["uniform", "weighted"], default="uniform",
+                        help="Sample users uniformly or by their impression count")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory with behaviors.tsv and news.tsv")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--output", default=None, help="Write JSON report to this path")
+    args = parser.parse_args(argv)
+
+    scenarios, weights = parse_mix(args.mix)
+    workload = Workload(args.data_dir, args.user_dist, args.seed, k=args.k)
+
+    server = None
+    base_url = args.url
+    if args.spawn:
+        server = spawn_server(args.port, args.workers)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        if not args.no_warmup:
+            warm_up(base_url, workload, scenarios)
+        stats, elapsed = run_load(base_url, workload, scenarios, weights, args.concurrency,
+                                  args.duration, args.requests)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    summaries = {name: s.summary(elapsed) for name, s in stats.items()}
+    total_ok = sum(s["ok"] for s in summaries.values())
+    report = {
+        "config": {**vars(args), "url": base_url},
+        "elapsed_s": round(elapsed, 3),
+        "total_ok": total_ok,
+        "total_rps": round(total_ok / elapsed, 3) if elapsed > 0 else None,
+        "scenarios": summaries,
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app.main import app
+from server.app.settings import settings
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_reload_disabled_without_admin_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", None)
+    assert client.post("/admin/reload").status_code == 403
+    assert client.post("/admin/reload", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_reload_rejects_wrong_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    assert client.post("/admin/reload").status_code == 403
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+def test_reload_accepts_matching_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    monkeypatch.setattr(settings, "registry_dir", None)
+    # Past the token check: without a registry there is nothing to reload
+    response = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 404
+
+
+def test_router_checks_the_token_before_fanning_out(monkeypatch):
+    from server.app.router import app as router_app
+
+    # No lifespan: a request that got past the check would fail on the missing shard list
+    client = TestClient(router_app)
+    monkeypatch.setattr(settings, "admin_token", None)
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "anything"}).status_code == 403
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
@@ -0,0 +1,32 @@
+import importlib
+
+from utils.build import Stage, stage_keys
+
+
+def _stage_func(out_dir, inputs):
+    pass
+
+
+def _keys():
+    stages = [
+        Stage('fit', _stage_func, modules=('fitting_helpers',)),
+        Stage('plain', _stage_func),
+        Stage('downstream', _stage_func, ['fit']),
+    ]
+    return stage_keys(stages)
+
+
+def test_editing_a_stage_module_invalidates_it_and_its_dependents(tmp_path, monkeypatch):
+    helpers = tmp_path / 'fitting_helpers.py'
+    helpers.write_text("def fit(x):\n    return x\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    importlib.invalidate_caches()
+
+    before = _keys()
+    assert _keys() == before
+    helpers.write_text("def fit(x):\n    return 2 * x\n")
+    after = _keys()
+
+    assert after['fit'] != before['fit']
+    assert after['downstream'] != before['downstream']
+    assert after['plain'] == before['plain']
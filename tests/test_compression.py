@@ -0,0 +1,56 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from server.app.compression import CompressionMiddleware, accepted_encoding
+
+LARGE = "news " * 1000
+
+
+def _client(minimum_size=1024):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+
+    @app.get("/small")
+    def small():
+        return {"items": []}
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse(LARGE)
+
+    @app.get("/binary")
+    def binary():
+        return PlainTextResponse(LARGE, media_type="application/octet-stream")
+
+    return TestClient(app)
+
+
+def test_small_body_is_not_compressed():
+    response = _client().get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"items": []}
+
+
+def test_large_body_is_compressed_and_varies():
+    client = _client()
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    # The test client decodes the body; the declared length is the compressed one
+    assert response.text == LARGE
+    assert int(response.headers["content-length"]) == len(gzip.compress(LARGE.encode(), compresslevel=6, mtime=0))
+
+
+def test_identity_and_incompressible_types_pass_through():
+    client = _client()
+    assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+    assert "content-encoding" not in client.get("/binary", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_accepted_encoding_respects_quality():
+    assert accepted_encoding("gzip;q=0, identity") is None
+    assert accepted_encoding("*;q=0") is None
+    assert accepted_encoding("gzip") == "gzip"
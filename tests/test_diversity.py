@@ -0,0 +1,60 @@
+import numpy as np
+import scipy.sparse as sp
+
+from utils.diversity import category_quota, mmr
+
+
+def _pool(n=30, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return rng.random(n), vectors
+
+
+def test_mmr_without_diversity_is_relevance_order():
+    relevance, vectors = _pool()
+    selected = mmr(relevance, vectors, 10, diversity=0)
+    assert list(selected) == list(np.argsort(-relevance, kind="stable")[:10])
+
+
+def test_mmr_never_repeats_a_candidate():
+    relevance, vectors = _pool()
+    # Duplicated vectors and flat relevance are the cases most likely to re-pick an item
+    vectors = np.vstack([vectors, vectors])
+    for scores in (np.concatenate([relevance, relevance]), np.ones(len(vectors))):
+        for diversity in (0.0, 0.3, 1.0):
+            selected = mmr(scores, vectors, len(vectors), diversity=diversity)
+            assert len(selected) == len(vectors)
+            assert len(set(selected.tolist())) == len(selected)
+
+
+def test_mmr_sparse_matches_dense():
+    relevance, vectors = _pool()
+    vectors[np.abs(vectors) < 0.3] = 0
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    dense = mmr(relevance, vectors, 10)
+    assert list(mmr(relevance, sp.csr_matrix(vectors), 10)) == list(dense)
+
+
+def test_mmr_first_pick_is_most_relevant_and_k_is_capped():
+    relevance, vectors = _pool(n=5)
+    selected = mmr(relevance, vectors, 10, diversity=0.9)
+    assert selected[0] == np.argmax(relevance)
+    assert len(selected) == 5
+    assert len(mmr([], np.zeros((0, 8)), 3)) == 0
+
+
+def test_category_quota_honours_max_per_category():
+    categories = [0, 0, 0, 1, 1, 1, 2, 2, 2, 0]
+    selected = category_quota(categories, 6, max_per_category=2)
+    assert list(selected) == [0, 1, 3, 4, 6, 7]
+    picked = np.asarray(categories)[selected]
+    assert max(np.bincount(picked)) <= 2
+
+
+def test_category_quota_backfills_in_rank_order():
+    categories = [0, 0, 0, 0, 1, 0]
+    selected = category_quota(categories, 5, max_per_category=2)
+    # Quota allows 0, 1 and 4; the best held-back candidates 2 and 3 fill the list
+    assert list(selected) == [0, 1, 2, 3, 4]
+    assert list(category_quota(categories, 10, max_per_category=1)) == list(range(6))
@@ -0,0 +1,25 @@
+from server.app.httpcache import etag_for, etag_matches
+
+
+def test_etag_is_weak_and_stable():
+    etag = etag_for(b'{"items": []}')
+    assert etag.startswith('W/"')
+    assert etag == etag_for(b'{"items": []}')
+    assert etag != etag_for(b'{"items": [1]}')
+
+
+def test_weak_and_strong_forms_match():
+    etag = etag_for(b"body")
+    strong = etag[2:]
+    assert etag_matches(etag, etag)
+    assert etag_matches(strong, etag)
+
+
+def test_list_and_wildcard():
+    etag = etag_for(b"body")
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches(f'W/"other",{etag[2:]}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other", W/"another"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
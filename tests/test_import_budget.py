@@ -0,0 +1,10 @@
+import statistics
+
+from server.import_budget import DEFAULT_BUDGET_SECONDS, LAZY_MODULES, measure
+
+
+def test_app_import_within_budget_and_lazy():
+    times, loaded = measure(runs=3)
+
+    assert statistics.median(times) <= DEFAULT_BUDGET_SECONDS
+    assert loaded == [], f"imported eagerly: {loaded} (must stay lazy: {LAZY_MODULES})"
@@ -0,0 +1,42 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app.pagination import CursorExpiredError, RankedListCache, paginate
+
+ITEMS = [{"news_id": f"N{i}"} for i in range(5)]
+
+
+def test_pages_follow_the_cursor():
+    cache = RankedListCache()
+    page, cursor = paginate(cache, "scope", lambda: ITEMS, page_size=2)
+    assert page == ITEMS[:2]
+
+    page, cursor = paginate(cache, "scope", lambda: pytest.fail("recomputed"), cursor=cursor)
+    assert page == ITEMS[2:4]
+    page, cursor = paginate(cache, "scope", lambda: pytest.fail("recomputed"), cursor=cursor)
+    assert page == ITEMS[4:] and cursor is None
+
+
+def test_expired_cursor_raises():
+    cache = RankedListCache(ttl=0.05)
+    _, cursor = paginate(cache, "scope", lambda: ITEMS, page_size=2)
+    time.sleep(0.1)
+    with pytest.raises(CursorExpiredError):
+        paginate(cache, "scope", lambda: ITEMS, cursor=cursor)
+
+
+def test_cursor_from_another_scope_or_malformed_raises():
+    cache = RankedListCache()
+    _, cursor = paginate(cache, "scope", lambda: ITEMS, page_size=2)
+    for scope, bad in (("other", cursor), ("scope", "garbage"), ("scope", cursor.split(".")[0] + ".x")):
+        with pytest.raises(CursorExpiredError):
+            paginate(cache, scope, lambda: ITEMS, cursor=bad)
+
+
+def test_expired_cursor_is_gone():
+    from server.app.main import app
+
+    response = TestClient(app).get("/search", params={"q": "news", "cursor": "expired.20"})
+    assert response.status_code == 410
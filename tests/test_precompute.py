@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from utils import precompute as P
+from utils import recommenders as R
+from utils.embeddings import save_embeddings
+from utils.metrics import STAGE_LATENCY
+
+USERS = 20
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    R._ensure_data_loaded()
+    monkeypatch.setattr(R, "precomputed_store", None)
+    return P.PrecomputedStore(str(tmp_path / "precomputed.sqlite3"))
+
+
+@pytest.fixture
+def random_embeddings(tmp_path, monkeypatch):
+    """Serve random unit article embeddings; the loaded state is restored afterwards"""
+    R._ensure_data_loaded()
+    ids = R._news_df['NewsID'].tolist()
+    matrix = np.random.default_rng(0).normal(size=(len(ids), 16)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    save_embeddings(str(tmp_path), matrix, ids, model="random")
+    for name in ("_article_embeddings", "_embedding_positions", "_user_embedding_rows"):
+        monkeypatch.setattr(R, name, getattr(R, name))
+    monkeypatch.setattr(R, "embeddings_dir", str(tmp_path))
+    monkeypatch.setattr(R, "_embeddings_checked", False)
+
+
+def _assert_matches_online(store, algorithm, k=10):
+    for user_id in P.most_active_users(USERS):
+        online = [item["item_id"] for item in R.recommend_for_user(user_id, k, algorithm=algorithm)]
+        stored = P.lookup(store, user_id, algorithm, k)
+        assert stored is not None, user_id
+        assert [item["item_id"] for item in stored] == online, user_id
+        seen = R.seen_mask(user_id)
+        assert seen is None or not any(seen[R._item_code[item["item_id"]]] for item in stored)
+
+
+def test_collaborative_matches_online(store):
+    before = STAGE_LATENCY.snapshot(stage="precompute", algorithm="collaborative")[0]
+    assert P.precompute(store, ["collaborative"], users=USERS, k=50) == {"collaborative": USERS}
+    assert STAGE_LATENCY.snapshot(stage="precompute", algorithm="collaborative")[0] == before + 1
+    _assert_matches_online(store, "collaborative")
+
+
+def test_semantic_matches_online(store, random_embeddings):
+    written = P.precompute(store, ["semantic"], users=USERS, k=50)
+    assert written["semantic"] > 0
+    _assert_matches_online(store, "semantic")
+
+
+def test_embedding_algorithms_skipped_without_embeddings(store, monkeypatch):
+    monkeypatch.setattr(R, "_ensure_embeddings_loaded", lambda: None)
+    assert P.precompute(store, ["semantic", "bert"], users=USERS) == {}
+    assert len(store) == 0
+
+
+def test_other_model_version_is_a_miss(store):
+    user_id = P.most_active_users(1)[0]
+    item_ids = R._news_df['NewsID'].iloc[:5].tolist()
+    store.put_many("collaborative", [(user_id, "reason", item_ids, np.ones(5))], "previous")
+    assert P.lookup(store, user_id, "collaborative", 5) is None
+
+    store.put_many("collaborative", [(user_id, "reason", item_ids, np.ones(5))], R._active_bundle.version)
+    assert [item["item_id"] for item in P.lookup(store, user_id, "collaborative", 5)] == item_ids
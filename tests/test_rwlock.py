@@ -0,0 +1,46 @@
+import threading
+
+from utils.rwlock import ReadWriteLock
+
+
+def _enter_in_thread(section):
+    """Start a thread entering section(); the Event is set once it got in"""
+    entered = threading.Event()
+
+    def run():
+        with section():
+            entered.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, entered
+
+
+def test_writer_waits_for_readers():
+    lock = ReadWriteLock()
+    with lock.reading():
+        thread, entered = _enter_in_thread(lock.writing)
+        assert not entered.wait(0.2)
+    assert entered.wait(5)
+    thread.join(5)
+
+
+def test_writer_excludes_readers_and_writers():
+    lock = ReadWriteLock()
+    with lock.writing():
+        reader, read = _enter_in_thread(lock.reading)
+        writer, wrote = _enter_in_thread(lock.writing)
+        assert not read.wait(0.2)
+        assert not wrote.is_set()
+    assert read.wait(5) and wrote.wait(5)
+    reader.join(5)
+    writer.join(5)
+
+
+def test_readers_share_and_reenter():
+    lock = ReadWriteLock()
+    with lock.reading():
+        with lock.reading():
+            thread, entered = _enter_in_thread(lock.reading)
+            assert entered.wait(5)
+    thread.join(5)
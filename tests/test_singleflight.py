@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from server.app.singleflight import SingleFlight
+
+CALLERS = 4
+
+
+def _call_concurrently(flight, fn):
+    """Run CALLERS threads on one key while fn blocks; (results, errors) once all return"""
+    results, errors = [], []
+    started = threading.Barrier(CALLERS + 1)
+
+    def call():
+        started.wait()
+        try:
+            results.append(flight.do("key", fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    time.sleep(0.2)  # let every caller reach do() before the leader's call returns
+    fn.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert flight.in_flight == 0
+    return results, errors
+
+
+class _Blocking:
+    """Callable that counts its calls and blocks until released"""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        if isinstance(self.outcome, BaseException):
+            raise self.outcome
+        return self.outcome
+
+
+def test_followers_share_the_leader_result():
+    flight = SingleFlight("test")
+    fn = _Blocking(object())
+
+    results, errors = _call_concurrently(flight, fn)
+
+    assert errors == []
+    assert fn.calls == 1
+    assert len(results) == CALLERS and all(result is fn.outcome for result in results)
+
+
+def test_leader_error_propagates_to_followers():
+    flight = SingleFlight("test")
+    fn = _Blocking(ValueError("boom"))
+
+    results, errors = _call_concurrently(flight, fn)
+
+    assert results == []
+    assert fn.calls == 1
+    assert len(errors) == CALLERS and all(e is fn.outcome for e in errors)
+
+
+def test_nothing_is_cached_after_the_call():
+    flight = SingleFlight("test")
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(KeyError):
+        flight.do("key", lambda: {}["missing"])
+    assert flight.in_flight == 0
@@ -4,40 +4,45 @@ Smart News Recommendation System - Utils Package
 This package contains utility modules for the recommendation system:
 - recommenders.py: Core recommendation algorithms
 - pdf_utils.py: PDF generation utilities
+
+Submodules are imported lazily: ``import utils`` is cheap, and pandas,
+sklearn, ReportLab or torch are only loaded when a function that needs them
+is first accessed (e.g. ``utils.get_user_recommendations``).
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "Smart News Recommendation System"
 
-# Import key functions for easy access
-try:
-    from .recommenders import (
-        get_user_recommendations,
-        get_article_recommendations,
-        get_hybrid_recommendations,
-        get_news_metadata,
-        get_bert4rec_recommendations,
-        get_trending_articles,
-        user_histories,
-        unique_articles_df
-    )
-    from .pdf_utils import generate_pdf_from_articles
-    
-    __all__ = [
-        'get_user_recommendations',
-        'get_article_recommendations', 
-        'get_hybrid_recommendations',
-        'get_news_metadata',
-        'get_bert4rec_recommendations',
-        'get_trending_articles',
-        'user_histories',
-        'unique_articles_df',
-        'generate_pdf_from_articles'
-    ]
-    
-except ImportError as e:
-    # Handle cases where dependencies are not installed
-    print(f"Warning: Could not import all utils functions due to missing dependencies: {e}")
-    print("Please install requirements.txt to use all features.")
-    
-    __all__ = []
+# Exported name -> submodule that defines it
+_LAZY_EXPORTS = {
+    'get_user_recommendations': 'recommenders',
+    'get_article_recommendations': 'recommenders',
+    'get_hybrid_recommendations': 'recommenders',
+    'get_news_metadata': 'recommenders',
+    'get_bert4rec_recommendations': 'recommenders',
+    'get_trending_articles': 'recommenders',
+    'user_histories': 'recommenders',
+    'unique_articles_df': 'recommenders',
+    'generate_pdf_from_articles': 'pdf_utils',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{module_name}", __name__)
+    # Data-backed names (user_histories, unique_articles_df) may not exist
+    # until the data is loaded, so they are not cached on the package
+    value = getattr(module, name)
+    if callable(value):
+        globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,298 @@
+"""
+Offline evaluation and benchmark harness for the recommendation algorithms.
+
+Replays held-out MIND impressions against each algorithm served by
+``recommenders.recommend_for_user`` and reports ranking quality
+(AUC, MRR, nDCG@5, nDCG@10) together with latency percentiles, throughput
+and memory. Results are written as JSON so two runs can be diffed.
+
+Usage:
+    python -m utils.benchmark --algorithms collaborative content hybrid bert \
+        --impressions 500 --output bench/results.json
+    python -m utils.benchmark --compare bench/baseline.json bench/results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+from utils import recommenders as R
+
+ALGORITHMS = ["collaborative", "content", "hybrid", "bert", "semantic"]
+
+# Rows of behaviors.tsv that load_mind_data() reads; later rows are held out
+TRAIN_ROWS = 5000
+
+
+# ---- Ranking metrics (same definitions as the official MIND evaluation) ----
+
+def auc(labels, scores):
+    """Area under the ROC curve for one impression (None if only one class)"""
+    labels = np.asarray(labels)
+    if labels.min() == labels.max():
+        return None
+    return float(roc_auc_score(labels, scores))
+
+def mrr(labels, scores):
+    """Mean reciprocal rank of the clicked items in one impression"""
+    labels = np.asarray(labels, dtype=float)
+    order = np.argsort(scores, kind="stable")[::-1]
+    ranked = labels[order]
+    rr = ranked / (np.arange(len(ranked)) + 1)
+    return float(np.sum(rr) / max(np.sum(ranked), 1))
+
+def dcg(labels, scores, k):
+    """Discounted cumulative gain at k"""
+    labels = np.asarray(labels, dtype=float)
+    order = np.argsort(scores, kind="stable")[::-1]
+    ranked = labels[order[:k]]
+    gains = 2 ** ranked - 1
+    discounts = np.log2(np.arange(len(ranked)) + 2)
+    return float(np.sum(gains / discounts))
+
+def ndcg(labels, scores, k):
+    """Normalized discounted cumulative gain at k"""
+    best = dcg(labels, labels, k)
+    if best == 0:
+        return 0.0
+    return dcg(labels, scores, k) / best
+
+
+# ---- Impression replay ----
+
+def default_behaviors_path():
+    """Held-out impressions: MINDsmall_dev if present, else the training file"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    dev_path = os.path.join(project_root, 'MINDsmall_dev', 'behaviors.tsv')
+    if os.path.exists(dev_path):
+        return dev_path
+    return os.path.join(project_root, 'MINDsmall_train', 'behaviors.tsv')
+
+def load_heldout_impressions(path=None, limit=500, skip_rows=None):
+    """Load impressions not seen by the serving loader.
+
+    When replaying the training file, the first ``TRAIN_ROWS`` rows are skipped
+    because ``load_mind_data`` reads exactly those rows.
+    """
+    path = path or default_behaviors_path()
+    if skip_rows is None:
+        skip_rows = TRAIN_ROWS if 'MINDsmall_train' in path else 0
+    df = pd.read_csv(path, sep='\t', header=None,
+                     names=['ImpressionID', 'UserID', 'Time', 'History', 'Impressions'],
+                     skiprows=skip_rows, nrows=limit)
+
+    impressions = []
+    for row in df.itertuples(index=False):
+        pairs = R.parse_impressions(row.Impressions)
+        if not pairs:
+            continue
+        impressions.append({
+            'impression_id': row.ImpressionID,
+            'user_id': row.UserID,
+            'candidates': [news_id for news_id, _ in pairs],
+            'labels': [label for _, label in pairs],
+        })
+    return impressions
+
+def score_candidates(ranked_ids, candidates):
+    """Turn a ranked list into candidate scores (higher rank, higher score)"""
+    depth = len(ranked_ids)
+    positions = {item_id: pos for pos, item_id in enumerate(ranked_ids)}
+    return [float(depth - positions[c]) if c in positions else 0.0 for c in candidates]
+
+def percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 3) if latencies else None
+
+def run_algorithm(algorithm, impressions, depth=100, trace_memory=False):
+    """Replay all impressions against one algorithm and collect metrics"""
+    rss_before = _rss_mb()
+    # Warm-up call: excluded from steady-state latency, reported as cold start
+    start = time.perf_counter()
+    R.recommend_for_user(impressions[0]['user_id'], k=depth, algorithm=algorithm)
+    cold_start = time.perf_counter() - start
+
+    if trace_memory:
+        tracemalloc.start()
+
+    aucs, mrrs, ndcg5s, ndcg10s, latencies = [], [], [], [], []
+    wall_start = time.perf_counter()
+    for imp in impressions:
+        start = time.perf_counter()
+        recs = R.recommend_for_user(imp['user_id'], k=depth, algorithm=algorithm)
+        latencies.append(time.perf_counter() - start)
+
+        scores = score_candidates([r['item_id'] for r in recs], imp['candidates'])
+        labels = imp['labels']
+        impression_auc = auc(labels, scores)
+        if impression_auc is not None:
+            aucs.append(impression_auc)
+        mrrs.append(mrr(labels, scores))
+        ndcg5s.append(ndcg(labels, scores, 5))
+        ndcg10s.append(ndcg(labels, scores, 10))
+    wall = time.perf_counter() - wall_start
+
+    peak_traced_mb = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_traced_mb = round(peak / 2 ** 20, 2)
+
+    return {
+        'impressions': len(impressions),
+        'quality': {
+            'auc': round(float(np.mean(aucs)), 4) if aucs else None,
+            'mrr': round(float(np.mean(mrrs)), 4),
+            'ndcg@5': round(float(np.mean(ndcg5s)), 4),
+            'ndcg@10': round(float(np.mean(ndcg10s)), 4),
+        },
+        'latency_ms': {
+            'cold_start': round(cold_start * 1000, 3),
+            'mean': round(float(np.mean(latencies)) * 1000, 3),
+            'p50': percentile_ms(latencies, 50),
+            'p95': percentile_ms(latencies, 95),
+            'p99': percentile_ms(latencies, 99),
+        },
+        'throughput_rps': round(len(latencies) / wall, 3) if wall > 0 else None,
+        'memory_mb': {
+            'peak_traced': peak_traced_mb,
+            # Growth while this algorithm ran (its lazily loaded models included);
+            # the process-wide peak would repeat the largest earlier algorithm
+            'rss_delta': round(_rss_mb() - rss_before, 2),
+        },
+    }
+
+def _max_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+def _rss_mb():
+    """Current resident set size; the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        return _max_rss_mb()
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def run_benchmark(algorithms=None, impressions_path=None, limit=500, depth=100,
+                  trace_memory=False):
+    """Run the full suite and return a JSON-serializable result document"""
+    algorithms = algorithms or ALGORITHMS
+    impressions = load_heldout_impressions(impressions_path, limit=limit)
+    if not impressions:
+        raise ValueError("No held-out impressions found to replay")
+
+    start = time.perf_counter()
+    R._ensure_data_loaded()
+    data_load = time.perf_counter() - start
+
+    results = {}
+    for algorithm in algorithms:
+        print(f"Benchmarking {algorithm} on {len(impressions)} impressions...")
+        results[algorithm] = run_algorithm(algorithm, impressions, depth, trace_memory)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'impressions_path': impressions_path or default_behaviors_path(),
+            'depth': depth,
+            'data_load_ms': round(data_load * 1000, 3),
+            'max_rss_mb': round(_max_rss_mb(), 2),
+            'data_memory_mb': {name: round(size / 2 ** 20, 2)
+                               for name, size in R.data_memory_usage().items()},
+        },
+        'results': results,
+    }
+
+
+# ---- Run comparison ----
+
+def _flatten(result, prefix=''):
+    flat = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare_runs(baseline, candidate):
+    """Return rows of (algorithm, metric, baseline, candidate, relative change)"""
+    rows = []
+    for algorithm, result in candidate['results'].items():
+        if algorithm not in baseline['results']:
+            continue
+        old = _flatten(baseline['results'][algorithm])
+        new = _flatten(result)
+        for metric in sorted(set(old) & set(new)):
+            change = (new[metric] - old[metric]) / old[metric] if old[metric] else None
+            rows.append((algorithm, metric, old[metric], new[metric], change))
+    return rows
+
+def print_report(document):
+    for algorithm, result in document['results'].items():
+        q, lat = result['quality'], result['latency_ms']
+        print(f"{algorithm:14s} auc={q['auc']} mrr={q['mrr']} ndcg@5={q['ndcg@5']} "
+              f"ndcg@10={q['ndcg@10']} | p50={lat['p50']}ms p95={lat['p95']}ms "
+              f"p99={lat['p99']}ms | {result['throughput_rps']} req/s | "
+              f"rss {result['memory_mb']['rss_delta']:+}MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline recommender benchmark on MIND impressions")
+    parser.add_argument('--algorithms', nargs='+', default=ALGORITHMS)
+    parser.add_argument('--impressions-path', default=None,
+                        help="behaviors.tsv to replay (default: MINDsmall_dev or held-out train rows)")
+    parser.add_argument('--impressions', type=int, default=500, help="Number of impressions to replay")
+    parser.add_argument('--depth', type=int, default=100, help="Ranking depth requested per call")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Track peak Python allocations (slows down latency numbers)")
+    parser.add_argument('--output', default=None, help="Write JSON results to this path")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="Diff two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            candidate = json.load(f)
+        for algorithm, metric, old, new, change in compare_runs(baseline, candidate):
+            delta = f"{change:+.1%}" if change is not None else "n/a"
+            print(f"{algorithm:14s} {metric:24s} {old:>12} -> {new:>12} ({delta})")
+        return 0
+
+    document = run_benchmark(args.algorithms, args.impressions_path, args.impressions,
+                             args.depth, args.trace_memory)
+    print_report(document)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,54 +2,229 @@
 BERT4Rec Implementation for News Recommendation
 Based on the trained model from mind-ds.ipynb
 """
+import itertools
+import logging
+import os
+import time
 import pandas as pd
 import torch
 import numpy as np
 from transformers import BertTokenizerFast, BertForMaskedLM
 from collections import defaultdict
+from utils.metrics import model_load_timer
 import warnings
 warnings.filterwarnings('ignore')
 
+logger = logging.getLogger(__name__)
+
 class BERT4RecRecommender:
-    def __init__(self):
+    """
+    Masked-LM next-item predictor.
+    
+    Inference options (all CPU-oriented):
+        quantize: int8 dynamic quantization of the Linear layers
+        num_threads: intra-op thread count (None keeps torch's default, which
+            grabs every core and contends with other uvicorn workers)
+        interop_threads: inter-op thread count
+        export: None, "torchscript" (traced graph) or "onnx" (ONNX Runtime
+            session; falls back to torch when onnxruntime is not installed)
+        max_length: truncation length; inputs are padded dynamically
+    """
+    
+    def __init__(self, model_name="bert-base-uncased", quantize=False, num_threads=None,
+                 interop_threads=None, export=None, max_length=64, export_dir=None):
         self.tokenizer = None
         self.model = None
+        self.onnx_session = None
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model_name = model_name
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.interop_threads = interop_threads
+        self.export = export
+        self.max_length = max_length
+        self.export_dir = export_dir or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                     'artifacts', 'bert4rec')
         self.news_id_to_title = {}
         self.user_histories = defaultdict(list)
+        self.user_history_ids = defaultdict(list)
+        # Pre-tokenized titles: token ids of row i are title_tokens[title_offsets[i]:title_offsets[i + 1]]
+        self.title_tokens = np.zeros(0, dtype=np.int32)
+        self.title_offsets = np.zeros(1, dtype=np.int64)
+        self.title_row = {}
+        self.data_version = None  # version of the data passed to load_data
         self.is_loaded = False
         
+    def _load_tokenizer(self):
+        if self.tokenizer is None:
+            self.tokenizer = BertTokenizerFast.from_pretrained(self.model_name)
+        
     def load_model(self):
         """Load pre-trained BERT model and tokenizer"""
         if self.is_loaded:
             return
             
-        print("Loading BERT4Rec model...")
-        self.tokenizer = BertTokenizerFast.from_pretrained("bert-base-uncased")
-        self.model = BertForMaskedLM.from_pretrained("bert-base-uncased")
-        self.model.eval()
-        self.model = self.model.to(self.device)
+        start = time.perf_counter()
+        with model_load_timer("bert4rec"):
+            self._configure_threads()
+            self._load_tokenizer()
+            self.model = BertForMaskedLM.from_pretrained(self.model_name, torchscript=self.export == "torchscript")
+            self.model.eval()
+            
+            if self.export == "onnx":
+                self.onnx_session = self._load_onnx_session()
+            
+            if self.onnx_session is None:
+                if self.quantize and self.device.type == "cpu":
+                    # int8 weights for every Linear layer; activations quantized on the fly
+                    self.model = torch.quantization.quantize_dynamic(
+                        self.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                self.model = self.model.to(self.device)
+                if self.export == "torchscript":
+                    self.model = self._trace_model()
         self.is_loaded = True
-        print(f"✅ BERT4Rec loaded on {self.device}")
+        logger.info("BERT4Rec model loaded", extra={
+            "device": str(self.device), "quantized": self.quantize, "export": self.export,
+            "threads": torch.get_num_threads(),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+        
+    def _configure_threads(self):
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                # Can only be set once, before any inter-op parallel work has started
+                logger.warning("Could not set inter-op threads", extra={"interop_threads": self.interop_threads})
+        
+    def _example_inputs(self):
+        encoding = self.tokenizer("example news headline [SEP] another headline", return_tensors="pt")
+        return encoding["input_ids"].to(self.device), encoding["attention_mask"].to(self.device)
         
-    def load_data(self, news_df, behaviors_df):
-        """Load and preprocess MIND dataset"""
-        print("Processing user histories for BERT4Rec...")
+    def _trace_model(self):
+        """TorchScript-trace the model; sequence length stays dynamic"""
+        with torch.inference_mode():
+            traced = torch.jit.trace(self.model, self._example_inputs(), strict=False)
+        try:
+            return torch.jit.freeze(traced)
+        except Exception:
+            # Some quantized graphs cannot be frozen; the plain trace still avoids Python dispatch
+            return traced
+        
+    def _load_onnx_session(self):
+        """Export to ONNX once (int8-quantized if requested) and open an ONNX Runtime session"""
+        try:
+            import onnxruntime
+        except ImportError:
+            logger.warning("onnxruntime not installed, using torch for BERT4Rec inference")
+            return None
+        
+        os.makedirs(self.export_dir, exist_ok=True)
+        model_path = os.path.join(self.export_dir, "bert4rec.onnx")
+        if not os.path.exists(model_path):
+            input_ids, attention_mask = self._example_inputs()
+            torch.onnx.export(
+                self.model, (input_ids, attention_mask), model_path,
+                input_names=["input_ids", "attention_mask"], output_names=["logits"],
+                dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                              "attention_mask": {0: "batch", 1: "sequence"},
+                              "logits": {0: "batch", 1: "sequence"}},
+                opset_version=14,
+            )
+        if self.quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantized_path = os.path.join(self.export_dir, "bert4rec.int8.onnx")
+            if not os.path.exists(quantized_path):
+                quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+            model_path = quantized_path
+        
+        options = onnxruntime.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        if self.interop_threads:
+            options.inter_op_num_threads = self.interop_threads
+        return onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        
+    def _forward(self, input_ids, attention_mask):
+        """Masked-LM logits for a batch, whichever backend is active"""
+        if self.onnx_session is not None:
+            logits = self.onnx_session.run(["logits"], {
+                "input_ids": input_ids.numpy().astype(np.int64),
+                "attention_mask": attention_mask.numpy().astype(np.int64),
+            })[0]
+            return torch.from_numpy(logits)
+        outputs = self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device))
+        return outputs[0] if isinstance(outputs, tuple) else outputs.logits
+        
+    def load_data(self, news_df, behaviors_df=None, user_clicks=None, version=None):
+        """
+        Load and preprocess MIND dataset.
+        
+        Click histories come from the raw behaviors_df History strings, or from
+        user_clicks (user id -> clicked NewsIDs) when the caller already has them.
+        version labels the data (see data_version) so callers can detect a swap.
+        """
+        start = time.perf_counter()
         
         # Create news_id to title mapping
         self.news_id_to_title = dict(zip(news_df['NewsID'], news_df['Title']))
         
+        if user_clicks is None:
+            user_clicks = (
+                (row.UserID, row.History.split())
+                for row in behaviors_df.itertuples(index=False) if not pd.isna(row.History)
+            )
+        else:
+            user_clicks = user_clicks.items()
+        
         # Parse user click histories
         self.user_histories = defaultdict(list)
-        for _, row in behaviors_df.iterrows():
-            if pd.isna(row['History']):
-                continue
-            clicked_ids = row['History'].split()
-            titles = [self.news_id_to_title[nid] for nid in clicked_ids if nid in self.news_id_to_title]
-            if titles:
-                self.user_histories[row['UserID']].extend(titles)
+        self.user_history_ids = defaultdict(list)
+        for user_id, news_ids in user_clicks:
+            clicked_ids = [nid for nid in news_ids if nid in self.news_id_to_title]
+            if clicked_ids:
+                self.user_histories[user_id].extend(self.news_id_to_title[nid] for nid in clicked_ids)
+                self.user_history_ids[user_id].extend(clicked_ids)
+        
+        self._tokenize_titles()
+        self.data_version = version
+        
+        logger.info("BERT4Rec user histories loaded", extra={
+            "users": len(self.user_histories), "title_tokens": len(self.title_tokens),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+        
+    def _tokenize_titles(self):
+        """Tokenize every title once into one flat int32 array with row offsets"""
+        self._load_tokenizer()
+        news_ids = list(self.news_id_to_title)
+        titles = [t if isinstance(t, str) else '' for t in self.news_id_to_title.values()]
+        encoded = self.tokenizer(titles, add_special_tokens=False)["input_ids"] if titles else []
+        lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+        self.title_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.title_tokens = np.fromiter(itertools.chain.from_iterable(encoded), dtype=np.int32,
+                                        count=int(self.title_offsets[-1]))
+        self.title_row = {news_id: row for row, news_id in enumerate(news_ids)}
         
-        print(f"✅ Loaded histories for {len(self.user_histories)} users")
+    def build_input_ids(self, history_ids, max_items=10):
+        """
+        Assemble [CLS] t1 [SEP] t2 ... tn [SEP] from cached title tokens.
+        
+        Produces the same ids as tokenizing " [SEP] ".join(titles) with
+        truncation to max_length, without running the tokenizer.
+        """
+        sep = np.array([self.tokenizer.sep_token_id], dtype=np.int32)
+        pieces = [np.array([self.tokenizer.cls_token_id], dtype=np.int32)]
+        for i, news_id in enumerate(n for n in history_ids[-max_items:] if n in self.title_row):
+            if i:
+                pieces.append(sep)
+            row = self.title_row[news_id]
+            pieces.append(self.title_tokens[self.title_offsets[row]:self.title_offsets[row + 1]])
+        ids = np.concatenate(pieces)[:self.max_length - 1]
+        return torch.from_numpy(np.append(ids, sep).astype(np.int64)).unsqueeze(0)
         
     def mask_tokens(self, input_ids, mask_prob=0.15):
         """Randomly mask tokens for BERT-style MLM"""
@@ -74,26 +249,33 @@ class BERT4RecRecommender:
         encoding = self.tokenizer(
             input_text, 
             return_tensors="pt", 
-            padding="max_length", 
+            padding=True,  # pad to the longest sequence only, not to max_length
             truncation=True, 
-            max_length=64
+            max_length=self.max_length
         )
         
-        input_ids = encoding["input_ids"]
-        attention_mask = encoding["attention_mask"]
+        return self._predict_tokens(encoding["input_ids"], encoding["attention_mask"], top_k)
         
+    def predict_next_for_history(self, history_ids, top_k=10):
+        """Like predict_next_articles, but from NewsIDs using the pre-tokenized title cache"""
+        if not self.is_loaded:
+            self.load_model()
+            
+        if not history_ids:
+            return []
+            
+        input_ids = self.build_input_ids(history_ids)
+        return self._predict_tokens(input_ids, torch.ones_like(input_ids), top_k)
+        
+    def _predict_tokens(self, input_ids, attention_mask, top_k):
         # Replace last non-padding token with [MASK]
         mask_indices = (input_ids != self.tokenizer.pad_token_id).nonzero(as_tuple=True)[1]
         if len(mask_indices) > 0:
             mask_index = mask_indices[-1]
             input_ids[0, mask_index] = self.tokenizer.mask_token_id
             
-            with torch.no_grad():
-                outputs = self.model(
-                    input_ids=input_ids.to(self.device), 
-                    attention_mask=attention_mask.to(self.device)
-                )
-                predictions = outputs.logits
+            with torch.inference_mode():
+                predictions = self._forward(input_ids, attention_mask)
                 
             # Get top-k predictions
             predicted_token_ids = predictions[0, mask_index].topk(top_k * 3).indices.tolist()
@@ -109,27 +291,37 @@ class BERT4RecRecommender:
         
         return []
         
-    def recommend_articles_for_user(self, user_id, top_k=10):
-        """Generate article recommendations for a specific user"""
+    def recommend_articles_for_user(self, user_id, top_k=10, exclude=None):
+        """Generate article recommendations for a specific user.
+        
+        exclude is a boolean mask over the news_df rows given to load_data of
+        articles never to recommend; by default, the ones the user clicked.
+        """
         if not self.is_loaded:
             self.load_model()
             
         # Get user history
         user_titles = self.user_histories.get(user_id, [])
         if not user_titles:
-            print(f"User {user_id} not found. Using content-based recommendations with BERT embeddings...")
+            logger.debug("User not found, using new-user recommendations", extra={"user_id": user_id})
             # For new users, use BERT to find diverse, high-quality articles
-            return self._get_smart_recommendations_for_new_user(top_k)
+            return self._get_smart_recommendations_for_new_user(top_k, exclude)
+        if exclude is None:
+            exclude = self._clicked_mask(user_id)
             
-        print(f"Found user {user_id} with {len(user_titles)} articles in history")
+        logger.debug("Found user history", extra={"user_id": user_id, "history_length": len(user_titles)})
         
-        # Get predicted keywords/topics
-        predicted_tokens = self.predict_next_articles(user_titles, top_k * 2)
+        # Get predicted keywords/topics (from cached title tokens when available)
+        history_ids = self.user_history_ids.get(user_id)
+        if history_ids and self.title_row:
+            predicted_tokens = self.predict_next_for_history(history_ids, top_k * 2)
+        else:
+            predicted_tokens = self.predict_next_articles(user_titles, top_k * 2)
         
         # Find articles that match predicted tokens
         recommendations = []
         for token in predicted_tokens[:5]:  # Use top 5 tokens
-            matching_articles = self._find_articles_by_keyword(token, limit=3)
+            matching_articles = self._find_articles_by_keyword(token, limit=3, exclude=exclude)
             for article in matching_articles:
                 article['Similarity'] = 0.85  # High confidence for BERT predictions
                 article['Category'] = self._infer_category_from_title(article['Title'])
@@ -137,21 +329,19 @@ class BERT4RecRecommender:
             if len(recommendations) >= top_k:
                 break
                 
-        # Remove duplicates and user's history
+        # Remove duplicates (read articles were excluded while matching)
         seen_ids = set()
-        user_read_titles = set(user_titles)
         final_recommendations = []
         
         for article in recommendations:
             if (article['NewsID'] not in seen_ids and 
-                article['Title'] not in user_read_titles and 
                 len(final_recommendations) < top_k):
                 seen_ids.add(article['NewsID'])
                 final_recommendations.append(article)
                 
         # Fill with smart recommendations if needed
         if len(final_recommendations) < top_k:
-            additional = self._get_smart_recommendations_for_new_user(top_k - len(final_recommendations))
+            additional = self._get_smart_recommendations_for_new_user(top_k - len(final_recommendations), exclude)
             for article in additional:
                 if (article['NewsID'] not in seen_ids and 
                     len(final_recommendations) < top_k):
@@ -159,10 +349,20 @@ class BERT4RecRecommender:
                     
         return final_recommendations
         
-    def _find_articles_by_keyword(self, keyword, limit=5):
-        """Find articles containing the keyword"""
+    def _clicked_mask(self, user_id):
+        """Boolean mask over news rows of the articles the user clicked"""
+        mask = np.zeros(len(self.news_id_to_title), dtype=bool)
+        rows = [self.title_row[news_id] for news_id in self.user_history_ids.get(user_id, ()) if news_id in self.title_row]
+        mask[rows] = True
+        return mask
+        
+    def _find_articles_by_keyword(self, keyword, limit=5, exclude=None):
+        """Find articles containing the keyword, skipping rows set in exclude"""
         matching_articles = []
-        for news_id, title in list(self.news_id_to_title.items())[:1000]:  # Search subset for performance
+        news_items = itertools.islice(self.news_id_to_title.items(), 1000)  # Search subset for performance
+        for row, (news_id, title) in enumerate(news_items):
+            if exclude is not None and exclude[row]:
+                continue
             if keyword.lower() in title.lower():
                 matching_articles.append({
                     'NewsID': news_id,
@@ -191,7 +391,7 @@ class BERT4RecRecommender:
                 
         return popular_articles
         
-    def _get_smart_recommendations_for_new_user(self, top_k=10):
+    def _get_smart_recommendations_for_new_user(self, top_k=10, exclude=None):
         """Get diverse, high-quality articles for new users using content analysis"""
         smart_articles = []
         
@@ -199,7 +399,7 @@ class BERT4RecRecommender:
         quality_keywords = ['health', 'technology', 'science', 'business', 'sports', 'politics', 'entertainment', 'education']
         
         for keyword in quality_keywords:
-            matching = self._find_articles_by_keyword(keyword, limit=2)
+            matching = self._find_articles_by_keyword(keyword, limit=2, exclude=exclude)
             for article in matching:
                 article['Similarity'] = 0.75
                 article['Category'] = keyword
@@ -231,11 +431,11 @@ class BERT4RecRecommender:
 # Global instance for lazy loading
 _bert4rec_instance = None
 
-def get_bert4rec_instance():
-    """Get singleton BERT4Rec instance"""
+def get_bert4rec_instance(**options):
+    """Get singleton BERT4Rec instance (options apply when it is first created)"""
     global _bert4rec_instance
     if _bert4rec_instance is None:
-        _bert4rec_instance = BERT4RecRecommender()
+        _bert4rec_instance = BERT4RecRecommender(**options)
     return _bert4rec_instance
 
 def bert4rec_recommendations(user_id, news_df, behaviors_df, top_k=10):
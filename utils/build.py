@@ -0,0 +1,379 @@
+"""
+Offline build of every serving artifact into a versioned model directory.
+
+Stages form a dependency graph and run on a process pool as soon as their
+inputs are ready:
+
+    data ──┬── interactions ──┬── collaborative
+           │                  ├── trending
+           │                  └── entities
+           ├── tfidf ── neighbours-0..N-1 ── neighbours
+           └── embeddings (skipped when torch/transformers are missing)
+
+Each stage is keyed by a hash of its code (the source of this module and of
+the modules it calls into), parameters and inputs (the data files for
+``data``, the keys of its dependencies otherwise). Outputs are kept
+in ``<output>/.cache/<stage>/<key>/`` and linked into ``<output>/<version>/``,
+so rebuilding after a change only reruns the stages downstream of it. The
+version directory is what utils.registry serves; ``--publish`` points CURRENT
+at it.
+
+Usage:
+    python -m utils.build --data MINDsmall_train --output artifacts/models
+    python -m utils.build --version v2 --workers 8 --publish
+    python -m utils.build --force            # ignore the cache
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'artifacts', 'models')
+DATA_FILES = ('news.tsv', 'behaviors.tsv')
+# Bump to invalidate every cached stage (e.g. after changing code outside a stage's modules)
+BUILD_VERSION = 1
+# Modules whose source is part of a stage's cache key, besides utils/build.py itself
+FITTING_MODULES = ('utils.recommenders',)
+BUNDLE_MODULES = FITTING_MODULES + ('utils.registry', 'utils.categories', 'utils.entities', 'utils.sharding')
+
+NEIGHBOURS_TOP_N = 20
+NEIGHBOURS_SHARDS = 8
+NEIGHBOURS_BLOCK_ROWS = 512  # bounds the dense similarity block per step
+
+
+class Stage:
+    """One node of the build graph: ``func(out_dir, inputs, **params)`` writes into out_dir.
+
+    modules names the modules func calls into; their source is hashed into the
+    stage's cache key along with the file defining func.
+    """
+
+    def __init__(self, name, func, deps=(), params=None, publish=True, optional=False, modules=()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = params or {}
+        self.modules = tuple(modules)
+        self.publish = publish  # link outputs into the version directory
+        self.optional = optional  # a failure is logged and the build goes on
+
+
+# Stage functions run in worker processes; inputs maps dependency name -> its output directory
+
+def _stage_data(out_dir, inputs, data_dir):
+    """Snapshot of the MIND files the version is built from"""
+    # Copied, not linked: the source files may be edited in place later
+    for name in DATA_FILES:
+        shutil.copy2(os.path.join(data_dir, name), os.path.join(out_dir, name))
+
+
+def _stage_interactions(out_dir, inputs):
+    from utils import recommenders as R
+    from utils.registry import save_interactions
+
+    news_df, behaviors_df = R.load_mind_data(inputs['data'])
+    save_interactions(os.path.join(out_dir, 'interactions.npz'), R._encode_behaviors(news_df, behaviors_df))
+
+
+def _stage_collaborative(out_dir, inputs):
+    from utils import recommenders as R
+
+    bundle = _bundle_for(out_dir, inputs)
+    with open(os.path.join(out_dir, 'collaborative.pkl'), 'wb') as f:
+        pickle.dump(R._fit_collaborative_model(bundle), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _stage_trending(out_dir, inputs):
+    from utils import recommenders as R
+
+    with np.load(os.path.join(inputs['interactions'], 'interactions.npz')) as arrays:
+        clicks = R.item_click_counts(arrays)
+    np.savez(os.path.join(out_dir, 'trending.npz'), clicks=clicks,
+             ranking=np.argsort(-clicks, kind='stable').astype(np.int32))
+
+
+def _stage_entities(out_dir, inputs):
+    from utils import recommenders as R
+
+    bundle = _bundle_for(out_dir, inputs)
+    R._fit_entity_index(bundle, news_dir=inputs['data']).save(os.path.join(out_dir, 'entities.npz'))
+
+
+def _stage_tfidf(out_dir, inputs):
+    from utils import recommenders as R
+
+    news_df, _ = R.load_mind_data(inputs['data'], click_columns=False)
+    with open(os.path.join(out_dir, 'tfidf.pkl'), 'wb') as f:
+        pickle.dump(R._fit_tfidf(news_df), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _stage_neighbours_shard(out_dir, inputs, shard, shards, top_n):
+    from utils import recommenders as R
+
+    with open(os.path.join(inputs['tfidf'], 'tfidf.pkl'), 'rb') as f:
+        _, matrix = pickle.load(f)
+    matrix = matrix.tocsr()
+    rows = np.array_split(np.arange(matrix.shape[0]), shards)[shard]
+    positions, scores = [], []
+    for start in range(0, len(rows), NEIGHBOURS_BLOCK_ROWS):
+        block_positions, block_scores = R.tfidf_neighbours(matrix, rows[start:start + NEIGHBOURS_BLOCK_ROWS], top_n)
+        positions.append(block_positions)
+        scores.append(block_scores)
+    top_n = min(top_n, matrix.shape[0] - 1)
+    np.savez(os.path.join(out_dir, 'neighbours.npz'),
+             positions=np.concatenate(positions) if positions else np.zeros((0, top_n), dtype=np.int32),
+             scores=np.concatenate(scores) if scores else np.zeros((0, top_n), dtype=np.float32))
+
+
+def _stage_neighbours(out_dir, inputs, shards):
+    positions, scores = [], []
+    for shard in range(shards):
+        with np.load(os.path.join(inputs[f'neighbours-{shard}'], 'neighbours.npz')) as arrays:
+            positions.append(arrays['positions'])
+            scores.append(arrays['scores'])
+    np.savez(os.path.join(out_dir, 'neighbours.npz'), positions=np.concatenate(positions),
+             scores=np.concatenate(scores))
+
+
+def _stage_embeddings(out_dir, inputs, model_name, dtype):
+    from utils import recommenders as R
+    from utils.embeddings import build_embeddings
+
+    news_df, _ = R.load_mind_data(inputs['data'], click_columns=False)
+    build_embeddings(news_df, os.path.join(out_dir, 'embeddings'), model_name, dtype)
+
+
+def _bundle_for(out_dir, inputs):
+    """In-memory ModelBundle of the data snapshot, using the encoded arrays instead of reparsing the strings"""
+    from utils.registry import build_bundle
+
+    staging = os.path.join(out_dir, '.bundle')
+    os.makedirs(staging)
+    try:
+        for name in DATA_FILES:
+            _link_or_copy(os.path.join(inputs['data'], name), os.path.join(staging, name))
+        _link_or_copy(os.path.join(inputs['interactions'], 'interactions.npz'),
+                      os.path.join(staging, 'interactions.npz'))
+        return build_bundle(staging, 'build')
+    finally:
+        shutil.rmtree(staging)
+
+
+def build_graph(data_dir, embeddings=True, embeddings_model=None, embeddings_dtype="float32",
+                neighbours_shards=NEIGHBOURS_SHARDS, neighbours_top_n=NEIGHBOURS_TOP_N):
+    """Stages in dependency order"""
+    from utils.embeddings import DEFAULT_MODEL
+
+    stages = [
+        Stage('data', _stage_data, params={'data_dir': os.path.abspath(data_dir)}),
+        Stage('interactions', _stage_interactions, ['data'], modules=FITTING_MODULES + ('utils.registry',)),
+        Stage('collaborative', _stage_collaborative, ['data', 'interactions'], modules=BUNDLE_MODULES),
+        Stage('trending', _stage_trending, ['interactions'], modules=FITTING_MODULES),
+        Stage('entities', _stage_entities, ['data', 'interactions'], modules=BUNDLE_MODULES),
+        Stage('tfidf', _stage_tfidf, ['data'], modules=FITTING_MODULES),
+    ]
+    shard_names = [f'neighbours-{shard}' for shard in range(neighbours_shards)]
+    for shard, name in enumerate(shard_names):
+        stages.append(Stage(name, _stage_neighbours_shard, ['tfidf'], publish=False, modules=FITTING_MODULES,
+                            params={'shard': shard, 'shards': neighbours_shards, 'top_n': neighbours_top_n}))
+    stages.append(Stage('neighbours', _stage_neighbours, shard_names, params={'shards': neighbours_shards}))
+    if embeddings:
+        stages.append(Stage('embeddings', _stage_embeddings, ['data'], optional=True,
+                            modules=FITTING_MODULES + ('utils.embeddings',),
+                            params={'model_name': embeddings_model or DEFAULT_MODEL, 'dtype': embeddings_dtype}))
+    return stages
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _module_file(name):
+    # Located without importing it: keys are computed before any stage runs
+    return importlib.util.find_spec(name).origin
+
+
+def stage_keys(stages):
+    """Cache key of every stage: its code and parameters plus the data files or its dependencies' keys.
+
+    Code is the source file defining the stage function and the files of
+    stage.modules, so editing a fitting function a stage calls invalidates it.
+    """
+    keys = {}
+    source_digests = {}
+    for stage in stages:
+        digest = hashlib.sha256()
+        digest.update(f"{BUILD_VERSION}:{stage.name}".encode())
+        for path in [inspect.getsourcefile(stage.func)] + [_module_file(name) for name in stage.modules]:
+            if path not in source_digests:
+                source_digests[path] = _file_digest(path)
+            digest.update(source_digests[path].encode())
+        digest.update(json.dumps({k: v for k, v in stage.params.items() if k != 'data_dir'},
+                                 sort_keys=True).encode())
+        if stage.func is _stage_data:
+            # Keyed by content, so moving the data directory does not invalidate the cache
+            for name in DATA_FILES:
+                digest.update(_file_digest(os.path.join(stage.params['data_dir'], name)).encode())
+        for dep in stage.deps:
+            digest.update(keys[dep].encode())
+        keys[stage.name] = digest.hexdigest()[:16]
+    return keys
+
+
+def _run_stage(func, out_dir, inputs, params):
+    """Worker-side: run one stage into a temporary directory and move it into the cache"""
+    start = time.perf_counter()
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        func(tmp_dir, inputs, **params)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return time.perf_counter() - start
+
+
+def _link_or_copy(src, dst):
+    """Hard-link src to dst (copy across filesystems); directories are linked file by file"""
+    if os.path.isdir(src):
+        os.makedirs(dst, exist_ok=True)
+        for name in os.listdir(src):
+            _link_or_copy(os.path.join(src, name), os.path.join(dst, name))
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def build(data_dir, output_dir=DEFAULT_OUTPUT_DIR, version=None, workers=None, force=False, **graph_options):
+    """Build (or reuse from cache) every stage and assemble <output_dir>/<version>; returns its path"""
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    version_dir = os.path.join(output_dir, version)
+    if os.path.exists(version_dir):
+        raise FileExistsError(f"Version directory already exists: {version_dir}")
+    cache_dir = os.path.join(output_dir, '.cache')
+    stages = build_graph(data_dir, **graph_options)
+    by_name = {stage.name: stage for stage in stages}
+    keys = stage_keys(stages)
+    outputs = {stage.name: os.path.join(cache_dir, stage.name, keys[stage.name]) for stage in stages}
+
+    report = {}
+    done, failed = set(), set()
+    for stage in stages:
+        if not force and os.path.isdir(outputs[stage.name]):
+            done.add(stage.name)
+            report[stage.name] = {'key': keys[stage.name], 'cached': True, 'seconds': 0.0}
+        else:
+            os.makedirs(os.path.dirname(outputs[stage.name]), exist_ok=True)
+
+    start = time.perf_counter()
+    pending = [stage for stage in stages if stage.name not in done]
+    running = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(dep in failed for dep in stage.deps):
+                    pending.remove(stage)
+                    failed.add(stage.name)
+                    report[stage.name] = {'key': keys[stage.name], 'skipped': 'dependency failed'}
+                elif all(dep in done for dep in stage.deps):
+                    pending.remove(stage)
+                    inputs = {dep: outputs[dep] for dep in stage.deps}
+                    future = pool.submit(_run_stage, stage.func, outputs[stage.name], inputs, stage.params)
+                    running[future] = stage
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    if not stage.optional:
+                        raise RuntimeError(f"Build stage {stage.name!r} failed: {e}") from e
+                    logger.warning("Optional build stage failed, skipping it",
+                                   extra={"stage": stage.name, "error": str(e)})
+                    failed.add(stage.name)
+                    report[stage.name] = {'key': keys[stage.name], 'skipped': str(e)}
+                    continue
+                done.add(stage.name)
+                report[stage.name] = {'key': keys[stage.name], 'cached': False, 'seconds': round(seconds, 3)}
+                logger.info("Built stage", extra={"stage": stage.name, "duration_ms": round(seconds * 1000, 1)})
+
+    # Assemble the version directory last so a failed build never leaves a half-written version
+    tmp_version_dir = version_dir + '.tmp'
+    shutil.rmtree(tmp_version_dir, ignore_errors=True)
+    os.makedirs(tmp_version_dir)
+    for name in done:
+        if by_name[name].publish:
+            _link_or_copy(outputs[name], tmp_version_dir)
+    manifest = {
+        'version': version,
+        'created_at': time.time(),
+        'data_dir': os.path.abspath(data_dir),
+        'build_version': BUILD_VERSION,
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'stages': report,
+    }
+    with open(os.path.join(tmp_version_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_version_dir, version_dir)
+    return version_dir
+
+
+def main(argv=None):
+    from utils import recommenders as R
+
+    parser = argparse.ArgumentParser(description="Build all serving artifacts into a versioned model directory")
+    parser.add_argument("--data", default=R._data_dir(), help="Directory with news.tsv and behaviors.tsv")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Registry root (see utils/registry.py)")
+    parser.add_argument("--version", default=None, help="Version name (default: a timestamp)")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every stage, ignoring the cache")
+    parser.add_argument("--no-embeddings", action="store_true", help="Skip the transformer embeddings stage")
+    parser.add_argument("--embeddings-model", default=None)
+    parser.add_argument("--neighbours", type=int, default=NEIGHBOURS_TOP_N, help="Neighbours kept per article")
+    parser.add_argument("--publish", action="store_true", help="Make the new version CURRENT")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    version_dir = build(args.data, args.output, args.version, args.workers, args.force,
+                        embeddings=not args.no_embeddings, embeddings_model=args.embeddings_model,
+                        neighbours_top_n=args.neighbours)
+    with open(os.path.join(version_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    for name, stage in manifest['stages'].items():
+        status = ('skipped: ' + stage['skipped']) if 'skipped' in stage else \
+            'cached' if stage['cached'] else f"{stage['seconds']:.2f}s"
+        print(f"  {name:<16} {stage['key']}  {status}")
+    print(f"Built {version_dir} in {manifest['wall_seconds']:.2f}s")
+    if args.publish:
+        from utils.registry import publish
+        publish(args.output, manifest['version'])
+        print(f"Published {manifest['version']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Category and subcategory index over the loaded news.
+
+Built once per model bundle from the categorical codes, so browsing a
+category, ranking its most clicked articles or restricting a recommender's
+scores to it never scans the news table:
+
+    positions(name)  article positions in the category, in news.tsv order
+    ranking(name)    the same positions, most clicked first
+    mask(name)       boolean array over positions, for masking score vectors
+    matching(text)   positions in categories/subcategories containing text
+
+Names match Category or SubCategory, case-insensitively.
+"""
+
+import numpy as np
+
+
+class CategoryIndex:
+    """Category/subcategory -> article positions, popularity rankings and masks"""
+
+    def __init__(self, news_df, item_clicks=None):
+        self.size = len(news_df)
+        self.categories = self._group(news_df['Category'])
+        self.subcategories = self._group(news_df['SubCategory'])
+        # Most articles first, the order value_counts() gave the old scans
+        self.top_categories = news_df['Category'].value_counts().index.tolist()
+
+        clicks = np.zeros(self.size, dtype=np.int64)
+        if item_clicks is not None:
+            clicks[:] = item_clicks[:self.size]
+        self.clicks = clicks
+        self._rankings = {}
+        for group in (self.categories, self.subcategories):
+            for name, positions in group.items():
+                ranked = positions[np.argsort(-clicks[positions], kind='stable')]
+                self._rankings.setdefault(name.lower(), []).append(ranked)
+        self._rankings = {key: self._merge(parts) for key, parts in self._rankings.items()}
+        self._masks = {}
+
+    @staticmethod
+    def _group(column):
+        """name -> int32 positions (ascending) for a categorical column"""
+        codes = column.cat.codes.to_numpy()
+        order = np.argsort(codes, kind='stable').astype(np.int32)
+        bounds = np.searchsorted(codes[order], np.arange(len(column.cat.categories) + 1))
+        return {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(column.cat.categories)}
+
+    def _merge(self, parts):
+        # A name used as both a category and a subcategory ranks the union
+        if len(parts) == 1:
+            return parts[0]
+        positions = np.unique(np.concatenate(parts))
+        return positions[np.argsort(-self.clicks[positions], kind='stable')]
+
+    def names(self):
+        """Sorted category names"""
+        return sorted(self.categories)
+
+    def positions(self, category):
+        """Positions of articles whose Category is exactly category, in news.tsv order"""
+        return self.categories.get(category, np.zeros(0, dtype=np.int32))
+
+    def ranking(self, name):
+        """Positions in the category or subcategory, most clicked first"""
+        return self._rankings.get(name.lower(), np.zeros(0, dtype=np.int32))
+
+    def mask(self, name):
+        """Boolean mask over positions of articles in the category or subcategory"""
+        key = name.lower()
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[self.ranking(key)] = True
+            mask.flags.writeable = False
+            # Only known names are kept, so arbitrary input can't grow the cache
+            if key in self._rankings:
+                self._masks[key] = mask
+        return mask
+
+    def matching(self, text, subcategories=True):
+        """Positions (ascending) of articles whose Category (or SubCategory) contains text, case-insensitively"""
+        text = text.lower()
+        groups = (self.categories, self.subcategories) if subcategories else (self.categories,)
+        parts = [positions for group in groups for name, positions in group.items() if text in name.lower()]
+        if not parts:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
@@ -0,0 +1,75 @@
+"""
+Re-rankers that trade a little relevance for less redundant result lists.
+
+Both work on a candidate pool already ranked by a recommender (a few times
+larger than k) and return the positions of the k items to show, in order:
+
+    mmr(relevance, vectors, k)       maximal marginal relevance over item vectors
+    category_quota(categories, k)    at most n items per category, in rank order
+
+MMR keeps the maximum similarity of every candidate to the items selected so
+far and updates it with one matrix-vector product per pick, so choosing k of
+n candidates costs O(k * n * dim) in numpy rather than O(k * n^2) in Python.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def mmr(relevance, vectors, k, diversity=0.3):
+    """Positions of k candidates chosen by maximal marginal relevance.
+
+    relevance is one score per candidate (any scale; min-max normalized here)
+    and vectors one row per candidate, L2-normalized (dense or scipy sparse),
+    so that their dot product is a cosine similarity. Each pick maximizes
+    (1 - diversity) * relevance - diversity * max similarity to the picks so far.
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = len(relevance)
+    k = min(k, n)
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    span = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / span if span > 0 else np.ones(n)
+
+    if sp.issparse(vectors):
+        # Only the pool's non-zero columns matter; dense rows make each per-pick product cheap
+        vectors = vectors.tocsr()
+        vectors = vectors[:, np.unique(vectors.indices)].toarray()
+    vectors = np.asarray(vectors)
+
+    gain = (1 - diversity) * relevance
+    # Nothing is selected yet, so the first pick is the most relevant candidate
+    max_similarity = np.full(n, -np.inf)
+    penalty = np.zeros(n)
+    selected = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        pick = int(np.argmax(gain - diversity * penalty))
+        selected[step] = pick
+        gain[pick] = -np.inf
+        np.maximum(max_similarity, vectors @ vectors[pick], out=max_similarity)
+        penalty = max_similarity
+    return selected
+
+
+def category_quota(categories, k, max_per_category=2):
+    """Positions of k candidates, taking at most max_per_category from each category in rank order.
+
+    categories holds one integer code per candidate, best ranked first. When
+    the quota leaves fewer than k, the best remaining candidates fill the list.
+    """
+    categories = np.asarray(categories)
+    n = len(categories)
+    # Rank of each candidate within its category: position in a stable sort minus the group start
+    order = np.argsort(categories, kind='stable')
+    sorted_codes = categories[order]
+    group_start = np.searchsorted(sorted_codes, sorted_codes, side='left')
+    within = np.empty(n, dtype=np.int64)
+    within[order] = np.arange(n) - group_start
+
+    allowed = within < max_per_category
+    selected = np.flatnonzero(allowed)[:k]
+    if len(selected) < k:
+        # Quota exhausted: fill with the best candidates it held back, then restore rank order
+        selected = np.sort(np.concatenate([selected, np.flatnonzero(~allowed)[:k - len(selected)]]))
+    return selected
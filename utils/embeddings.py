@@ -0,0 +1,156 @@
+"""
+Precomputed sentence embeddings for MIND articles.
+
+An offline job encodes every article's title + abstract once with a local
+transformer encoder (mean-pooled, L2-normalized) and saves:
+
+    <output>/embeddings.npy   float32 or float16 matrix, one row per article
+    <output>/news_ids.npy     NewsID of each row
+    <output>/meta.json        model name, dtype, dimension, row count
+
+At serve time the matrix is memory-mapped, so recommending only needs a
+vector average and one matrix-vector product - no transformer forward pass.
+
+Usage:
+    python -m utils.embeddings --model sentence-transformers/all-MiniLM-L6-v2 \
+        --dtype float32 --output artifacts/embeddings
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_EMBEDDINGS_DIR = os.path.join(PROJECT_ROOT, 'artifacts', 'embeddings')
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class ArticleEmbeddings:
+    """Row-normalized article embedding matrix with NewsID lookup"""
+
+    def __init__(self, matrix, news_ids, meta=None):
+        self.matrix = matrix
+        self.news_ids = news_ids
+        self.meta = meta or {}
+        self.row_of = {news_id: row for row, news_id in enumerate(news_ids.tolist())}
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def rows_for(self, news_ids):
+        """Row indices for the given NewsIDs (unknown ids are skipped)"""
+        return np.fromiter((self.row_of[n] for n in news_ids if n in self.row_of), dtype=np.int64)
+
+    def user_vector(self, rows):
+        """Normalized mean of the given rows, or None if there are none"""
+        if len(rows) == 0:
+            return None
+        vector = np.asarray(self.matrix[rows], dtype=np.float32).mean(axis=0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def scores(self, vector):
+        """Cosine similarity of every article with a normalized query vector"""
+        return self.matrix @ vector
+
+
+def article_texts(news_df):
+    return (news_df['Title'].fillna('') + '. ' + news_df['Abstract'].fillna('')).tolist()
+
+
+def encode_texts(texts, model_name=DEFAULT_MODEL, batch_size=64, max_length=128, device=None):
+    """Mean-pooled, L2-normalized float32 sentence embeddings"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).to(device).eval()
+
+    batches = []
+    with torch.inference_mode():
+        for start in range(0, len(texts), batch_size):
+            batch = tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                              max_length=max_length, return_tensors="pt").to(device)
+            hidden = model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            batches.append(pooled.cpu().numpy().astype(np.float32))
+            if start // batch_size % 50 == 0:
+                logger.info("Encoded articles", extra={"done": start + len(batch["input_ids"]), "total": len(texts)})
+    return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+
+def build_embeddings(news_df, output_dir=DEFAULT_EMBEDDINGS_DIR, model_name=DEFAULT_MODEL,
+                     dtype="float32", batch_size=64, max_length=128):
+    """Encode all articles and write the embedding artifact to output_dir"""
+    start = time.perf_counter()
+    matrix = encode_texts(article_texts(news_df), model_name, batch_size, max_length)
+    save_embeddings(output_dir, matrix.astype(dtype), news_df['NewsID'].to_numpy(dtype=str),
+                    model=model_name)
+    logger.info("Built article embeddings", extra={
+        "rows": matrix.shape[0], "dim": matrix.shape[1], "dtype": dtype,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+    return output_dir
+
+
+def save_embeddings(output_dir, matrix, news_ids, **meta):
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'embeddings.npy'), matrix)
+    np.save(os.path.join(output_dir, 'news_ids.npy'), np.asarray(news_ids, dtype=str))
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump({**meta, "dtype": str(matrix.dtype), "dim": int(matrix.shape[1]),
+                   "rows": int(matrix.shape[0])}, f, indent=2)
+
+
+def load_embeddings(path=DEFAULT_EMBEDDINGS_DIR):
+    """Memory-map a saved artifact; returns None if it does not exist.
+
+    float16 artifacts are upcast to float32 once at load, because numpy has
+    no BLAS path for half precision and per-request matmuls would be slow.
+    """
+    matrix_path = os.path.join(path, 'embeddings.npy')
+    if not os.path.exists(matrix_path):
+        return None
+    matrix = np.load(matrix_path, mmap_mode='r')
+    if matrix.dtype != np.float32:
+        matrix = np.asarray(matrix, dtype=np.float32)
+    news_ids = np.load(os.path.join(path, 'news_ids.npy'))
+    meta = {}
+    meta_path = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    return ArticleEmbeddings(matrix, news_ids, meta)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute article embeddings for semantic recommendations")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Hugging Face encoder name or local path")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--output", default=DEFAULT_EMBEDDINGS_DIR)
+    args = parser.parse_args(argv)
+
+    from utils import recommenders as R
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    news_df, _ = R.load_mind_data()
+    build_embeddings(news_df, args.output, args.model, args.dtype, args.batch_size, args.max_length)
+    print(f"Wrote {len(news_df)} article embeddings to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
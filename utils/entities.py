@@ -0,0 +1,153 @@
+"""
+Knowledge-graph entities of MIND articles as sparse matrices.
+
+news.tsv carries the WikidataIds found in each title and abstract
+(TitleEntities / AbstractEntities, JSON lists). They are parsed once per
+model bundle, one json.loads per column, into:
+
+    articles   CSR article x entity weights (confidence, titles weigh more), rows L2-normalized
+    affinity   CSR user x entity affinities: sum of the user's clicked articles,
+               pruned to the strongest AFFINITY_TOP_N entities, rows L2-normalized
+
+so an entity-based recommendation is one sparse product, articles @ user
+vector, and "which articles mention entity Q" is a column of the same matrix.
+``python -m utils.build`` saves the index as entities.npz.
+"""
+
+import json
+import logging
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+logger = logging.getLogger(__name__)
+
+TITLE_WEIGHT = 1.0
+ABSTRACT_WEIGHT = 0.5
+AFFINITY_TOP_N = 64  # entities kept per user
+
+
+def parse_entity_column(values):
+    """One list of entity dicts per article from a TitleEntities/AbstractEntities column"""
+    documents = [value if isinstance(value, str) and value.startswith('[') else '[]' for value in values]
+    try:
+        # The whole column as one JSON document: a single parse instead of one per article
+        return json.loads('[' + ','.join(documents) + ']')
+    except ValueError:
+        parsed = []
+        for document in documents:
+            try:
+                parsed.append(json.loads(document))
+            except ValueError:
+                parsed.append([])
+        return parsed
+
+
+def article_entity_matrix(title_entities, abstract_entities):
+    """(entity ids, CSR article x entity matrix with L2-normalized rows) from parsed entity lists"""
+    entity_code = {}
+    rows, cols, weights = array('i'), array('i'), array('f')
+    for column, weight in ((title_entities, TITLE_WEIGHT), (abstract_entities, ABSTRACT_WEIGHT)):
+        for position, entities in enumerate(column):
+            for entity in entities:
+                wikidata_id = entity.get('WikidataId')
+                if not wikidata_id:
+                    continue
+                rows.append(position)
+                cols.append(entity_code.setdefault(wikidata_id, len(entity_code)))
+                weights.append(weight * float(entity.get('Confidence', 1.0)))
+    # Duplicates (an entity in both title and abstract) are summed
+    matrix = sp.csr_matrix((np.frombuffer(weights, dtype=np.float32),
+                            (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+                           shape=(len(title_entities), len(entity_code)), dtype=np.float32)
+    entity_ids = np.array(list(entity_code), dtype=object)
+    return entity_ids, normalize(matrix)
+
+
+def _top_n_per_row(matrix, top_n):
+    """Copy of a CSR matrix keeping the top_n largest entries of each row"""
+    matrix = matrix.tocsr()
+    lengths = np.diff(matrix.indptr)
+    if not len(lengths) or lengths.max() <= top_n:
+        return matrix
+    rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+    # Sort each row's entries by weight, largest first, and keep the first top_n
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(len(order)) - np.repeat(matrix.indptr[:-1], lengths)
+    keep = order[rank < top_n]
+    return sp.csr_matrix((matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape)
+
+
+class EntityIndex:
+    """Entity vocabulary with article x entity and user x entity sparse matrices"""
+
+    def __init__(self, entity_ids, articles, user_ids, affinity):
+        self.entity_ids = entity_ids
+        self.articles = articles.tocsr()
+        self.user_ids = user_ids
+        self.affinity = affinity.tocsr()
+        self.entity_code = {entity_id: code for code, entity_id in enumerate(entity_ids.tolist())}
+        self.user_row = {user_id: row for row, user_id in enumerate(user_ids.tolist())}
+        self._by_entity = None
+
+    @classmethod
+    def build(cls, title_entities, abstract_entities, user_ids, clicks):
+        """Index from raw entity columns and a CSR user x article click matrix (rows match user_ids)"""
+        entity_ids, articles = article_entity_matrix(parse_entity_column(title_entities),
+                                                     parse_entity_column(abstract_entities))
+        affinity = _top_n_per_row(clicks @ articles, AFFINITY_TOP_N)
+        return cls(entity_ids, articles, user_ids, normalize(affinity).astype(np.float32))
+
+    def for_users(self, user_ids):
+        """Index keeping the affinity rows of user_ids only (e.g. one shard's users)"""
+        owned = np.flatnonzero(np.isin(self.user_ids, user_ids))
+        return EntityIndex(self.entity_ids, self.articles, self.user_ids[owned], self.affinity[owned])
+
+    def user_vector(self, user_id, positions=None):
+        """L2-normalized 1 x entity CSR affinity of the user, plus the articles at positions; None if empty"""
+        row = self.user_row.get(user_id)
+        vector = self.affinity[row] if row is not None else None
+        if positions is not None and len(positions):
+            recent = sp.csr_matrix(self.articles[positions].sum(axis=0))
+            vector = recent if vector is None else vector + recent
+        if vector is None or vector.nnz == 0:
+            return None
+        return normalize(vector)
+
+    def scores(self, vector):
+        """Cosine similarity of every article with a normalized entity vector (dense, 0 for no shared entity)"""
+        return (self.articles @ vector.T).toarray().ravel()
+
+    def articles_with(self, entity_id):
+        """Positions of the articles mentioning an entity"""
+        code = self.entity_code.get(entity_id)
+        if code is None:
+            return np.zeros(0, dtype=np.int32)
+        if self._by_entity is None:
+            self._by_entity = self.articles.tocsc()
+        return self._by_entity.indices[self._by_entity.indptr[code]:self._by_entity.indptr[code + 1]]
+
+    def save(self, path):
+        np.savez(path, entity_ids=self.entity_ids.astype(str), user_ids=self.user_ids.astype(str),
+                 **_csr_arrays('articles', self.articles), **_csr_arrays('affinity', self.affinity))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['entity_ids'].astype(object), _csr_from(arrays, 'articles'),
+                       arrays['user_ids'].astype(object), _csr_from(arrays, 'affinity'))
+
+    def memory_usage(self):
+        return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (self.articles, self.affinity))
+
+
+def _csr_arrays(name, matrix):
+    return {f'{name}_data': matrix.data, f'{name}_indices': matrix.indices,
+            f'{name}_indptr': matrix.indptr, f'{name}_shape': np.array(matrix.shape)}
+
+
+def _csr_from(arrays, name):
+    return sp.csr_matrix((arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+                         shape=tuple(arrays[f'{name}_shape']))
@@ -0,0 +1,124 @@
+"""
+Structured, non-blocking logging for the Smart News Recommendation System.
+
+``configure_logging`` installs a bounded ``QueueHandler`` on the root logger;
+a background ``QueueListener`` does the formatting and the write to stdout,
+so a request thread only pays for building the record and an enqueue. If
+the queue is full, records are dropped and counted
+(snr_log_records_dropped_total on /metrics) rather than blocking.
+
+Every record carries the current request id (set by the API middleware via
+``request_id_var``) and any ``extra=`` fields such as ``duration_ms``.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+from utils.metrics import record_dropped_log
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came from extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records when the queue is full"""
+
+    def prepare(self, record):
+        # Resolve the message and request id in the caller's thread; leave
+        # the (expensive) formatting to the listener thread.
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.request_id = request_id_var.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            record_dropped_log()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as key=value"""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname:7s} {record.name}"
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            line += f" [{request_id}]"
+        line += f" {record.getMessage()}"
+        extras = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RESERVED)
+        if extras:
+            line += f" {extras}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+def configure_logging(level="INFO", json_format=True, queue_size=10000, stream=None):
+    """Route all logging through a bounded queue to a background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if json_format else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = _NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, _NonBlockingQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    return handler
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,216 @@
+"""
+Lightweight in-process metrics for the Smart News Recommendation System.
+
+Provides thread-safe counters and histograms rendered in the Prometheus text
+exposition format, plus helpers used by the recommenders, the PDF builder and
+the FastAPI middleware to record where each request's time goes. Metrics are
+kept per process; with several uvicorn workers each worker exposes its own.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus default buckets, extended for slow model loads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+               for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for one label set"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self._series.get(key)
+        return (series[2], series[1]) if series else (0, 0.0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted((key, ([*s[0]], s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together at /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "snr_http_request_duration_seconds",
+    "HTTP request latency by endpoint",
+    ("method", "endpoint", "status"),
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "snr_stage_duration_seconds",
+    "Latency of recommendation and export pipeline stages",
+    ("stage", "algorithm"),
+))
+MODEL_LOAD_TIME = REGISTRY.register(Histogram(
+    "snr_model_load_seconds",
+    "Time spent loading datasets and models",
+    ("model",),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "snr_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss)",
+    ("cache", "result"),
+))
+SINGLEFLIGHT_CALLS = REGISTRY.register(Counter(
+    "snr_singleflight_calls_total",
+    "Deduplicated calls by group and role (leader computed, shared waited)",
+    ("group", "role"),
+))
+DEGRADED_RESPONSES = REGISTRY.register(Counter(
+    "snr_degraded_responses_total",
+    "Recommendations served from a fallback (deadline exceeded or model not built)",
+    ("algorithm", "source"),
+))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    "snr_log_records_dropped_total",
+    "Log records dropped because the logging queue was full",
+))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def stage_timer(stage, algorithm="none"):
+    """Time a pipeline stage (data_load, exclusion, candidate_generation, scoring, formatting, pdf_build, precompute, ...)"""
+    return STAGE_LATENCY.time(stage=stage, algorithm=algorithm)
+
+
+def record_stage(stage, seconds, algorithm="none"):
+    """Record a stage timed elsewhere, e.g. a job whose work ran in another process"""
+    STAGE_LATENCY.observe(seconds, stage=stage, algorithm=algorithm)
+
+
+def model_load_timer(model):
+    """Time a dataset or model load"""
+    return MODEL_LOAD_TIME.time(model=model)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_singleflight(group, shared):
+    """Count a single-flight call as computed by its leader or shared from one"""
+    SINGLEFLIGHT_CALLS.inc(group=group, role="shared" if shared else "leader")
+
+
+def record_degraded(algorithm, source):
+    """Count a result served from a fallback source (cached, collaborative, content, trending)"""
+    DEGRADED_RESPONSES.inc(algorithm=algorithm, source=source)
+
+
+def record_dropped_log():
+    """Count a log record dropped by the non-blocking logging queue"""
+    LOG_RECORDS_DROPPED.inc()
+
+
+def render_latest():
+    """Render all registered metrics in Prometheus text format"""
+    return REGISTRY.render()
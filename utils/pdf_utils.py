@@ -3,18 +3,27 @@ PDF generation utilities for the Smart News Recommendation System.
 Creates downloadable PDF reports of recommended articles.
 """
 
+import hashlib
+import importlib.util
+import io
+import logging
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+from utils.metrics import stage_timer, record_cache
+
+# ReportLab is only imported when a PDF is actually built (in the export
+# workers), so importing this module for the cache helpers stays cheap
+REPORTLAB_AVAILABLE = importlib.util.find_spec("reportlab") is not None
+
+logger = logging.getLogger(__name__)
+
+PDF_MEDIA_TYPE = "application/pdf"
+TEXT_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+# Paragraph styles are built once per process and reused by every report
+_report_styles = None
 
 def generate_pdf_from_articles(articles, user_id="guest", filename=None):
     """
@@ -48,12 +57,104 @@ def generate_pdf_from_articles(articles, user_id="guest", filename=None):
     filepath = os.path.join(temp_dir, filename)
     
     try:
-        # Create the PDF document
-        doc = SimpleDocTemplate(filepath, pagesize=A4, 
-                              rightMargin=72, leftMargin=72,
-                              topMargin=72, bottomMargin=18)
+        with stage_timer("pdf_build"):
+            _build_pdf(filepath, articles, user_id)
+        return filepath
+        
+    except Exception:
+        logger.exception("Error generating PDF, falling back to text report", extra={"user_id": user_id})
+        # Fallback to text file
+        return generate_text_report(articles, user_id, filename.replace('.pdf', '.txt'))
+
+def render_report(articles, user_id="guest"):
+    """
+    Render a report entirely in memory.
+    
+    Args:
+        articles (list): List of article dictionaries with keys: title, abstract, category, etc.
+        user_id (str): User ID for personalization
+    
+    Returns:
+        tuple: (content bytes, media type) - a PDF, or a plain-text report
+        when ReportLab is unavailable or fails
+    """
+    
+    if REPORTLAB_AVAILABLE:
+        buffer = io.BytesIO()
+        try:
+            _build_pdf(buffer, articles, user_id)
+            return buffer.getvalue(), PDF_MEDIA_TYPE
+        except Exception:
+            logger.exception("Error generating PDF, falling back to text report", extra={"user_id": user_id})
+    
+    return _text_report(articles, user_id).encode('utf-8'), TEXT_MEDIA_TYPE
+
+def _build_pdf(target, articles, user_id):
+    """Lay out the report with ReportLab into a file path or file-like object"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+    
+    # Create the PDF document
+    doc = SimpleDocTemplate(target, pagesize=A4, 
+                          rightMargin=72, leftMargin=72,
+                          topMargin=72, bottomMargin=18)
+    
+    title_style, heading_style, body_style = _get_report_styles()
+    
+    # Build the content
+    content = []
+    
+    # Title
+    title = Paragraph(f"📰 News Recommendations for {user_id}", title_style)
+    content.append(title)
+    
+    # Timestamp
+    timestamp = Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", body_style)
+    content.append(timestamp)
+    content.append(Spacer(1, 20))
+    
+    # Articles
+    for i, article in enumerate(articles, 1):
+        # Article number and title
+        article_title = article.get('title', 'No Title Available')
+        title_para = Paragraph(f"{i}. {article_title}", heading_style)
+        content.append(title_para)
+        
+        # Category info
+        category = article.get('category', 'Unknown')
+        subcategory = article.get('subcategory', 'Unknown')
+        category_para = Paragraph(f"<b>Category:</b> {category} / {subcategory}", body_style)
+        content.append(category_para)
+        
+        # Abstract
+        abstract = article.get('abstract', 'No abstract available.')
+        # Clean up the abstract for PDF
+        abstract = abstract.replace('<', '&lt;').replace('>', '&gt;')
+        abstract_para = Paragraph(f"<b>Summary:</b> {abstract}", body_style)
+        content.append(abstract_para)
+        
+        # Add spacing between articles
+        content.append(Spacer(1, 15))
+        
+        # Add page break after every 3 articles to avoid overcrowding
+        if i % 3 == 0 and i < len(articles):
+            content.append(PageBreak())
+    
+    # Footer
+    footer = Paragraph("Generated by Smart News Recommendation System", body_style)
+    content.append(Spacer(1, 30))
+    content.append(footer)
+    
+    # Build the PDF
+    doc.build(content)
+
+def _get_report_styles():
+    """Return the (title, heading, body) paragraph styles, building them on first use"""
+    global _report_styles
+    if _report_styles is None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
         
-        # Define styles
         styles = getSampleStyleSheet()
         title_style = ParagraphStyle(
             'CustomTitle',
@@ -78,60 +179,27 @@ def generate_pdf_from_articles(articles, user_id="guest", filename=None):
             fontSize=10,
             spaceAfter=12
         )
-        
-        # Build the content
-        content = []
-        
-        # Title
-        title = Paragraph(f"📰 News Recommendations for {user_id}", title_style)
-        content.append(title)
-        
-        # Timestamp
-        timestamp = Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", body_style)
-        content.append(timestamp)
-        content.append(Spacer(1, 20))
-        
-        # Articles
-        for i, article in enumerate(articles, 1):
-            # Article number and title
-            article_title = article.get('title', 'No Title Available')
-            title_para = Paragraph(f"{i}. {article_title}", heading_style)
-            content.append(title_para)
-            
-            # Category info
-            category = article.get('category', 'Unknown')
-            subcategory = article.get('subcategory', 'Unknown')
-            category_para = Paragraph(f"<b>Category:</b> {category} / {subcategory}", body_style)
-            content.append(category_para)
-            
-            # Abstract
-            abstract = article.get('abstract', 'No abstract available.')
-            # Clean up the abstract for PDF
-            abstract = abstract.replace('<', '&lt;').replace('>', '&gt;')
-            abstract_para = Paragraph(f"<b>Summary:</b> {abstract}", body_style)
-            content.append(abstract_para)
-            
-            # Add spacing between articles
-            content.append(Spacer(1, 15))
-            
-            # Add page break after every 3 articles to avoid overcrowding
-            if i % 3 == 0 and i < len(articles):
-                content.append(PageBreak())
-        
-        # Footer
-        footer = Paragraph("Generated by Smart News Recommendation System", body_style)
-        content.append(Spacer(1, 30))
-        content.append(footer)
-        
-        # Build the PDF
-        doc.build(content)
-        
-        return filepath
-        
-    except Exception as e:
-        print(f"Error generating PDF: {e}")
-        # Fallback to text file
-        return generate_text_report(articles, user_id, filename.replace('.pdf', '.txt'))
+        _report_styles = (title_style, heading_style, body_style)
+    return _report_styles
+
+def _text_report(articles, user_id):
+    """Plain-text version of the report"""
+    lines = [
+        f"NEWS RECOMMENDATIONS FOR {user_id.upper()}",
+        "=" * 50,
+        f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+    ]
+    for i, article in enumerate(articles, 1):
+        lines.append(f"{i}. {article.get('title', 'No Title Available')}")
+        lines.append("-" * 40)
+        lines.append(f"Category: {article.get('category', 'Unknown')} / {article.get('subcategory', 'Unknown')}")
+        lines.append(f"Summary: {article.get('abstract', 'No abstract available.')}")
+        lines.append("")
+    lines.append("")
+    lines.append("=" * 50)
+    lines.append("Generated by Smart News Recommendation System")
+    return "\n".join(lines) + "\n"
 
 def generate_text_report(articles, user_id="guest", filename=None):
     """
@@ -162,26 +230,56 @@ def generate_text_report(articles, user_id="guest", filename=None):
     
     try:
         with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(f"NEWS RECOMMENDATIONS FOR {user_id.upper()}\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            for i, article in enumerate(articles, 1):
-                f.write(f"{i}. {article.get('title', 'No Title Available')}\n")
-                f.write("-" * 40 + "\n")
-                f.write(f"Category: {article.get('category', 'Unknown')} / {article.get('subcategory', 'Unknown')}\n")
-                f.write(f"Summary: {article.get('abstract', 'No abstract available.')}\n")
-                f.write("\n")
-            
-            f.write("\n" + "=" * 50 + "\n")
-            f.write("Generated by Smart News Recommendation System\n")
+            f.write(_text_report(articles, user_id))
         
         return filepath
         
-    except Exception as e:
-        print(f"Error generating text report: {e}")
+    except Exception:
+        logger.exception("Error generating text report", extra={"user_id": user_id})
         return None
 
+def report_cache_key(item_ids, user_id="guest"):
+    """Content address of a report: hash of the user id and ordered article ids"""
+    digest = hashlib.sha256(str(user_id).encode('utf-8'))
+    for item_id in item_ids:
+        digest.update(b'\0' + str(item_id).encode('utf-8'))
+    return digest.hexdigest()
+
+class ReportCache:
+    """Thread-safe LRU cache of rendered reports, bounded by total bytes"""
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return (content, media_type) or None, counting the lookup as hit/miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache("pdf_report", entry is not None)
+        return entry
+    
+    def put(self, key, content, media_type):
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous[0])
+            self._entries[key] = (content, media_type)
+            self.size_bytes += len(content)
+            # Evict least recently used reports until within budget
+            while self.size_bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+    
+    def __len__(self):
+        return len(self._entries)
+
 def cleanup_old_files(max_age_hours=24):
     """
     Clean up old generated files to save disk space.
@@ -206,13 +304,16 @@ def cleanup_old_files(max_age_hours=24):
             if age_hours > max_age_hours:
                 try:
                     os.remove(filepath)
-                    print(f"Cleaned up old file: {filename}")
+                    logger.info("Cleaned up old file", extra={"file": filename})
                 except Exception as e:
-                    print(f"Error removing file {filename}: {e}")
+                    logger.warning("Error removing file", extra={"file": filename, "error": str(e)})
 
 # Export functions
 __all__ = [
     'generate_pdf_from_articles',
     'generate_text_report', 
+    'render_report',
+    'report_cache_key',
+    'ReportCache',
     'cleanup_old_files'
 ]
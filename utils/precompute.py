@@ -0,0 +1,306 @@
+"""
+Offline top-k recommendations for the most active users.
+
+A periodic job ranks users by activity in the behaviors log, scores them in
+batches (one matrix product per batch for collaborative filtering and
+semantic embeddings, per-user calls for the other algorithms) and writes the
+top-k item ids and scores to a SQLite store. Like the online recommenders,
+the stored lists leave out the articles each user has already seen.
+``recommend_for_user`` serves from the store while an entry is fresh, so
+heavy users skip online scoring; everyone else goes through the normal
+pipeline.
+
+Rows are compact: space-joined item ids plus a float32 score blob per
+(user, algorithm); titles are filled in from the loaded news data on read.
+Requests for fewer than k items get the stored prefix; for hybrid, whose
+candidate pool grows with k, that can differ slightly from an online call.
+
+Usage:
+    python -m utils.precompute --algorithms collaborative semantic \
+        --users 5000 --k 50 --db artifacts/precomputed.sqlite3
+    python -m utils.precompute --interval 900   # keep refreshing
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+from utils import recommenders as R
+from utils.metrics import record_cache, stage_timer
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, 'artifacts', 'precomputed.sqlite3')
+DEFAULT_ALGORITHMS = ["collaborative"]
+# Bumped when stored rankings change meaning; an older store is emptied on open
+# 2: articles the user has seen are excluded, as in recommend_for_user
+# 3: rows record the model version they were ranked with
+STORE_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recommendations (
+    user_id TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    computed_at REAL NOT NULL,
+    reason TEXT NOT NULL,
+    item_ids TEXT NOT NULL,
+    scores BLOB NOT NULL,
+    PRIMARY KEY (user_id, algorithm)
+) WITHOUT ROWID
+"""
+
+
+class PrecomputedStore:
+    """SQLite-backed (user, algorithm) -> top-k store, safe to share across threads"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            # WAL lets request threads read while a refresh is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+                # Rows ranked by an older version would be served as if current
+                conn.execute("DROP TABLE IF EXISTS recommendations")
+                conn.execute(f"PRAGMA user_version = {STORE_VERSION}")
+            conn.execute(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def put_many(self, algorithm, rows, model_version, computed_at=None):
+        """Write (user_id, reason, item_ids, scores) rows ranked by model_version in one transaction"""
+        computed_at = computed_at or time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO recommendations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(user_id, algorithm, model_version, computed_at, reason, " ".join(item_ids),
+                  np.asarray(scores, dtype=np.float32).tobytes())
+                 for user_id, reason, item_ids, scores in rows],
+            )
+
+    def get(self, user_id, algorithm, max_age=None, model_version=None):
+        """(item_ids, scores, reason, computed_at) or None if missing, older than max_age seconds
+        or, when model_version is given, ranked by a different model version"""
+        row = self._connection().execute(
+            "SELECT model_version, computed_at, reason, item_ids, scores FROM recommendations "
+            "WHERE user_id = ? AND algorithm = ?", (user_id, algorithm)).fetchone()
+        if (row is None or (model_version is not None and row[0] != model_version)
+                or (max_age is not None and time.time() - row[1] > max_age)):
+            return None
+        _, computed_at, reason, item_ids, scores = row
+        return item_ids.split(), np.frombuffer(scores, dtype=np.float32), reason, computed_at
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
+
+
+def lookup(store, user_id, algorithm, k, max_age=None):
+    """Formatted top-k from the store, or None when there is no usable entry.
+
+    Entries ranked by a model version other than the active one are misses:
+    after a reload they would serve the previous model's items and scores.
+    """
+    bundle = R._active_bundle
+    entry = store.get(user_id, algorithm, max_age, bundle.version) if bundle is not None else None
+    record_cache("precomputed", entry is not None)
+    if entry is None:
+        return None
+    item_ids, scores, reason, _ = entry
+    if len(item_ids) < k:
+        return None
+    titles = R.news_column('Title')
+    results = []
+    for item_id, score in zip(item_ids[:k], scores[:k].tolist()):
+        code = R._item_code.get(item_id)
+        title = titles[code] if code is not None and code < len(titles) else None
+        results.append({
+            "item_id": item_id,
+            "score": score,
+            "title": title if isinstance(title, str) else f"Article {item_id}",
+            "reason": reason,
+        })
+    return results
+
+
+def most_active_users(limit):
+    """User ids with the most clicks plus impressions in the loaded behaviors"""
+    R._ensure_data_loaded()
+    user_codes = R._behaviors_df['UserID'].cat.codes.to_numpy()
+    activity = np.bincount(user_codes, weights=np.diff(R._history_offsets) + np.diff(R._impression_offsets),
+                           minlength=len(R._behaviors_df['UserID'].cat.categories))
+    limit = min(limit, len(activity))
+    top = np.argpartition(-activity, limit - 1)[:limit] if limit else np.zeros(0, dtype=np.int64)
+    top = top[np.argsort(-activity[top], kind="stable")]
+    return R._behaviors_df['UserID'].cat.categories[top].tolist()
+
+
+def _seen_masks(users):
+    """Candidate mask of each user for a default request (seen articles excluded), as online"""
+    return [R._candidate_mask(None, R._exclusion_mask(user_id, None, (True, False))) for user_id in users]
+
+
+def _collaborative_batches(users, k, batch_size):
+    """Score users against the CF factors one matrix product per batch"""
+    user_encoder = R._get_collaborative_model()[0]
+    known = set(user_encoder.classes_)
+    users = [u for u in users if u in known]
+    news_ids = R._news_df['NewsID'].to_numpy()
+    reason = "Collaborative Filtering: Based on your preferences"
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        ranked = R.collaborative_top_k(batch, k, _seen_masks(batch))
+        # Same as online: score reported as 1.0
+        yield [(user_id, reason, news_ids[positions].tolist(), np.ones(len(positions)))
+               for user_id, (positions, _) in zip(batch, ranked)]
+
+
+def _semantic_batches(users, k, batch_size, embeddings):
+    """Score mean history embeddings against the article matrix one batch at a time"""
+    reason = "BERT Semantic: Based on your preferences"
+    users = [u for u in users if len(R._user_embedding_rows.get(u, ())) > 0]
+    news_ids = R._news_df['NewsID'].to_numpy()
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        vectors = [embeddings.user_vector(R._user_embedding_rows[u]) for u in batch]
+        batch = [u for u, v in zip(batch, vectors) if v is not None]
+        if not batch:
+            continue
+        ranked = R.semantic_top_k([v for v in vectors if v is not None], k, _seen_masks(batch))
+        yield [(user_id, reason, news_ids[positions].tolist(), scores)
+               for user_id, (positions, scores) in zip(batch, ranked)]
+
+
+def _online_batches(users, algorithm, k, batch_size):
+    """Algorithms without a batched scorer: one pipeline call per user"""
+    for start in range(0, len(users), batch_size):
+        rows = []
+        for user_id in users[start:start + batch_size]:
+            results = R._recommend(user_id, k, None, algorithm)
+            # Don't store fallbacks (e.g. trending after an error)
+            if results and not results[0]['reason'].startswith("Trending"):
+                rows.append((user_id, results[0]['reason'], [r['item_id'] for r in results],
+                             [r['score'] for r in results]))
+        yield rows
+
+
+def _held_batches(batches, bundle):
+    """Compute each batch with the model held; stop if a different bundle was activated meanwhile"""
+    batches = iter(batches)
+    while True:
+        with R.hold_model():
+            if R._active_bundle is not bundle:
+                logger.info("Model swapped during precompute, stopping this run",
+                            extra={"version": bundle.version})
+                return
+            rows = next(batches, None)
+        if rows is None:
+            return
+        yield rows
+
+
+def precompute(store, algorithms=None, users=1000, k=50, batch_size=256):
+    """Recompute and store top-k for the most active users; returns rows written per algorithm"""
+    algorithms = algorithms or DEFAULT_ALGORITHMS
+    with R.hold_model():
+        active = most_active_users(users)
+        bundle = R._active_bundle
+    written = {}
+    for algorithm in algorithms:
+        start = time.perf_counter()
+        computed_at = time.time()
+        if algorithm == "collaborative":
+            batches = _collaborative_batches(active, k, batch_size)
+        elif algorithm in ("semantic", "bert") and R._ensure_embeddings_loaded() is not None:
+            batches = _semantic_batches(active, k, batch_size, R._article_embeddings)
+        elif algorithm in ("semantic", "bert"):
+            # Without embeddings both serve degraded fallbacks, which are not worth storing
+            logger.warning("Skipping precompute: no article embeddings", extra={"algorithm": algorithm})
+            continue
+        else:
+            batches = _online_batches(active, algorithm, k, batch_size)
+
+        count = 0
+        with stage_timer("precompute", algorithm):
+            for rows in _held_batches(batches, bundle):
+                store.put_many(algorithm, rows, bundle.version, computed_at)
+                count += len(rows)
+        written[algorithm] = count
+        logger.info("Precomputed recommendations", extra={
+            "algorithm": algorithm, "users": count, "k": k,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+    return written
+
+
+class PrecomputeScheduler:
+    """Background thread that reruns precompute() every ``interval`` seconds"""
+
+    def __init__(self, store, algorithms=None, users=1000, k=50, interval=900, batch_size=256):
+        self.store = store
+        self.algorithms = algorithms
+        self.users = users
+        self.k = k
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="precompute", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                precompute(self.store, self.algorithms, self.users, self.k, self.batch_size)
+                self.last_run = time.time()
+            except Exception:
+                logger.exception("Precompute run failed")
+            self._stop.wait(self.interval)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute top-k recommendations for the most active users")
+    parser.add_argument("--algorithms", nargs="+", default=DEFAULT_ALGORITHMS)
+    parser.add_argument("--users", type=int, default=1000, help="Number of most active users to cover")
+    parser.add_argument("--k", type=int, default=50, help="Recommendations stored per user")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--interval", type=float, default=None,
+                        help="Keep running, recomputing every N seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    store = PrecomputedStore(args.db)
+    while True:
+        written = precompute(store, args.algorithms, args.users, args.k, args.batch_size)
+        print(f"Stored {written} in {args.db}")
+        if args.interval is None:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
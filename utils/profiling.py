@@ -0,0 +1,203 @@
+"""
+Opt-in profiling for slow recommendation requests.
+
+Two modes are supported:
+- ``cprofile``: deterministic cProfile run, saved in pstats format (``.prof``)
+  for snakeviz, flameprof or gprof2dot.
+- ``sample``: low-overhead stack sampler producing folded stacks
+  (``.folded``) that flamegraph.pl and speedscope read directly.
+
+The API layer activates profiling for a single request by calling
+``activate()``; functions wrapped with ``@profiled`` then run under the
+profiler. Nothing is profiled (and no profiler object exists) otherwise.
+
+Offline usage:
+    python -m utils.profiling --algorithm hybrid --user U13740 --mode sample \
+        --output hybrid.folded
+"""
+
+import argparse
+import contextvars
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+MODES = ("cprofile", "sample")
+
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+
+
+class Profile:
+    """Result of one profiled call"""
+
+    def __init__(self, mode, data, duration):
+        self.mode = mode
+        self.data = data
+        self.duration = duration
+
+    @property
+    def extension(self):
+        return ".prof" if self.mode == "cprofile" else ".folded"
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
+
+    def summary(self, limit=25):
+        """Human-readable top functions (cprofile) or hottest stacks (sample)"""
+        if self.mode == "cprofile":
+            stats = pstats.Stats(_StatsSource(marshal.loads(self.data)), stream=io.StringIO())
+            stats.sort_stats("cumulative").print_stats(limit)
+            return stats.stream.getvalue()
+        lines = self.data.decode().splitlines()
+        lines.sort(key=lambda line: int(line.rsplit(" ", 1)[1]), reverse=True)
+        return "\n".join(lines[:limit])
+
+
+class _StatsSource:
+    """Minimal object pstats.Stats can load pre-marshalled stats from"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's Python stack into folded-stack counts"""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def profile_call(fn, *args, mode="cprofile", interval=0.005, **kwargs):
+    """Run fn under the given profiler; return (result, Profile)"""
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode: {mode}")
+
+    start = time.perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        data = marshal.dumps(profiler.stats)
+    else:
+        sampler = SamplingProfiler(interval=interval)
+        sampler.start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            sampler.stop()
+        data = sampler.folded().encode()
+    return result, Profile(mode, data, time.perf_counter() - start)
+
+
+class ProfileRequest:
+    """Per-request profiling state shared between the middleware and @profiled"""
+
+    def __init__(self, mode="cprofile", interval=0.005):
+        self.mode = mode
+        self.interval = interval
+        self.profiles = []
+
+    def run(self, fn, *args, **kwargs):
+        result, profile = profile_call(fn, *args, mode=self.mode, interval=self.interval, **kwargs)
+        self.profiles.append(profile)
+        return result
+
+
+def activate(mode="cprofile", interval=0.005):
+    """Enable profiling for the current context; returns (request, reset token)"""
+    request = ProfileRequest(mode, interval)
+    return request, _active_profile.set(request)
+
+
+def deactivate(token):
+    _active_profile.reset(token)
+
+
+def is_active():
+    """Whether the current context is being profiled"""
+    return _active_profile.get() is not None
+
+
+def profiled(fn):
+    """Run fn under the active request profiler, if any"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        request = _active_profile.get()
+        if request is None:
+            return fn(*args, **kwargs)
+        return request.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile one recommendation algorithm for a user")
+    parser.add_argument("--algorithm", default="hybrid")
+    parser.add_argument("--user", required=True, help="User id, e.g. U13740")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", choices=MODES, default="cprofile")
+    parser.add_argument("--interval", type=float, default=0.005, help="Sampling interval in seconds")
+    parser.add_argument("--cold", action="store_true", help="Include dataset loading in the profile")
+    parser.add_argument("--output", default=None, help="Profile file (default: <algorithm>-<user><ext>)")
+    args = parser.parse_args(argv)
+
+    from utils import recommenders as R
+
+    if not args.cold:
+        R._ensure_data_loaded()
+
+    _, profile = profile_call(R.recommend_for_user, args.user, k=args.k, algorithm=args.algorithm,
+                              mode=args.mode, interval=args.interval)
+    path = profile.save(args.output or f"{args.algorithm}-{args.user}{profile.extension}")
+    print(profile.summary())
+    print(f"Profiled {args.algorithm} for {args.user} in {profile.duration * 1000:.1f} ms -> {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
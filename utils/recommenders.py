@@ -1,48 +1,324 @@
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
+import contextvars
+import copy
+import logging
 import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import Optional
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.decomposition import TruncatedSVD
 from sklearn.preprocessing import LabelEncoder
+from utils import diversity, profiling
+from utils.metrics import stage_timer, model_load_timer, record_degraded
+from utils.embeddings import DEFAULT_EMBEDDINGS_DIR, load_embeddings
+from utils.entities import EntityIndex
+from utils.rwlock import ReadWriteLock
 import warnings
 warnings.filterwarnings('ignore')
 
-# Global variables for lazy loading
+logger = logging.getLogger(__name__)
+
+# Global variables for lazy loading. They mirror the fields of the active
+# ModelBundle (utils/registry.py) and are replaced together by
+# activate_bundle(), which waits for readers holding hold_model().
+_active_bundle = None
 _news_df = None
 _behaviors_df = None
-_is_data_loaded = False
+_load_lock = threading.Lock()
+_swap_lock = threading.Lock()
+_state_lock = ReadWriteLock()
+
+# Version name of the bundle built from MINDsmall_train when no registry is used
+LEGACY_VERSION = "MINDsmall_train"
+
+# Click histories and impressions as integer item codes in CSR layout, built at
+# load instead of keeping the "N12345 N67890 ..." strings. Item code c is the
+# NewsID _item_ids[c]; codes below len(_news_df) are also _news_df positions.
+_item_ids = None
+_item_code = None  # NewsID -> item code
+_history_offsets = None  # clicks of behaviors row i: _history_codes[_history_offsets[i]:_history_offsets[i + 1]]
+_history_codes = None
+_impression_offsets = None
+_impression_codes = None
+_impression_labels = None
+_user_rows = None  # user id -> behaviors row positions
+
+# news.tsv columns; only NEWS_HOT_COLUMNS are loaded, the rest are read on first use
+NEWS_COLUMNS = ['NewsID', 'Category', 'SubCategory', 'Title', 'Abstract', 'URL', 'TitleEntities', 'AbstractEntities']
+NEWS_HOT_COLUMNS = ['NewsID', 'Category', 'SubCategory', 'Title', 'Abstract']
+_lazy_news_columns = {}
+
+# Precomputed article embeddings (see utils/embeddings.py), loaded on first use
+embeddings_dir = DEFAULT_EMBEDDINGS_DIR
+_article_embeddings = None
+_embeddings_checked = False
+_embedding_positions = None  # embedding row -> _news_df position
+_degraded_warned = False  # "semantic" without embeddings is logged once per process
+_user_embedding_rows = None  # user id -> embedding rows of clicked articles
+
+# Fitted TF-IDF index over title + abstract: (vectorizer, matrix), fitted on first use
+_tfidf = None
+_tfidf_lock = threading.Lock()
+
+# Optional artifact from python -m utils.build (None when serving without it)
+_item_neighbours = None  # (positions, scores): top TF-IDF neighbours of each _news_df row
+
+_item_clicks = None  # item code -> clicks (history + positive impressions)
+_category_index = None  # utils.categories.CategoryIndex over _news_df
+
+# (index, count) when this process serves one partition of the users (see utils/sharding.py)
+shard = None
+
+# Article/user entity matrices (utils.entities.EntityIndex), built once per bundle
+_entity_index = None
+_entity_lock = threading.Lock()
+
+# Keyword arguments for BERT4RecRecommender (quantize, num_threads, export, ...)
+bert_inference_options = {}
+_bert_lock = threading.Lock()
 
-def load_mind_data():
-    """Load MIND dataset with proper error handling"""
+# Fitted collaborative filtering model, shared by all requests
+_cf_model = None
+_cf_lock = threading.Lock()
+_cf_positions = None  # (news_encoder, _news_df position per CF item)
+
+# Per-algorithm time budget in seconds for recommend_for_user; algorithms
+# without an entry run to completion. Past the deadline a degraded result is
+# served from the last good response, the CF model or trending.
+recommend_deadlines = {}
+deadline_workers = 8
+_deadline_executor = None
+_deadline_lock = threading.Lock()
+_last_good = OrderedDict()  # (user_id, algorithm) -> last formatted recommendations
+_last_good_lock = threading.Lock()
+
+# Re-ranking (see utils/diversity.py): candidates ranked before picking k, and the trade-offs
+RERANKERS = ("mmr", "category")
+diversity_pool_size = 50  # at least 2 * k
+diversity_weight = 0.3  # MMR: weight of redundancy against relevance
+diversity_max_per_category = 2
+LAST_GOOD_MAX_ENTRIES = 10000
+
+# Precomputed top-k for active users (utils.precompute.PrecomputedStore);
+# entries younger than precomputed_max_age seconds skip online scoring
+precomputed_store = None
+precomputed_max_age = 3600
+
+def _data_dir():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
-    data_dir = os.path.join(project_root, 'MINDsmall_train')
+    return os.path.join(project_root, 'MINDsmall_train')
+
+def load_mind_data(data_dir=None, click_columns=True):
+    """Load MIND dataset with proper error handling.
+    
+    Category columns are categorical; URL and the entity JSON columns are not
+    loaded (see news_column) and the unused behaviors Time column is skipped.
+    click_columns=False also skips History and Impressions, for callers that
+    have them already encoded (interactions.npz from utils.build).
+    """
+    data_dir = data_dir or _data_dir()
     
     news_path = os.path.join(data_dir, 'news.tsv')
     behaviors_path = os.path.join(data_dir, 'behaviors.tsv')
     
-    print(f"Loading news data from: {news_path}")
+    logger.info("Loading news data", extra={"path": news_path})
     news_df = pd.read_csv(news_path, sep='\t', header=None, 
-                         names=['NewsID', 'Category', 'SubCategory', 'Title', 'Abstract', 'URL', 'TitleEntities', 'AbstractEntities'])
+                         names=NEWS_COLUMNS, usecols=NEWS_HOT_COLUMNS,
+                         dtype={'Category': 'category', 'SubCategory': 'category'})
     
-    print(f"Loading behaviors data from: {behaviors_path}")
+    logger.info("Loading behaviors data", extra={"path": behaviors_path})
     # Use sample for faster loading during testing
     behaviors_df = pd.read_csv(behaviors_path, sep='\t', header=None,
                               names=['ImpressionID', 'UserID', 'Time', 'History', 'Impressions'],
+                              usecols=['ImpressionID', 'UserID', 'History', 'Impressions'] if click_columns
+                              else ['ImpressionID', 'UserID'],
+                              dtype={'ImpressionID': 'int32', 'UserID': 'category'},
                               nrows=5000)  # Limit rows for faster loading
     
     return news_df, behaviors_df
 
 def _ensure_data_loaded():
-    """Ensure data is loaded (lazy loading)"""
-    global _news_df, _behaviors_df, _is_data_loaded
-    if not _is_data_loaded:
-        print("Loading MIND dataset...")
-        _news_df, _behaviors_df = load_mind_data()
-        _is_data_loaded = True
-        print(f"Loaded {len(_news_df)} news articles and {len(_behaviors_df)} user behaviors")
+    """Ensure data is loaded (lazy loading): without an active bundle, build one from MINDsmall_train"""
+    if _active_bundle is None:
+        with _load_lock:
+            if _active_bundle is None:
+                from utils.registry import build_bundle
+                bundle = build_bundle(_data_dir(), LEGACY_VERSION, shard=shard)
+                # Nothing reads the globals before the first bundle, so no write
+                # lock; a registry bundle activated meanwhile wins
+                with _swap_lock:
+                    if _active_bundle is None:
+                        _apply_bundle(bundle)
+
+def hold_model():
+    """Context manager that keeps the active bundle from being swapped until exit"""
+    return _state_lock.reading()
+
+def activate_bundle(bundle):
+    """Serve bundle from now on; in-flight holders of hold_model() finish on the old one first"""
+    with _state_lock.writing(), _swap_lock:
+        _apply_bundle(bundle)
+
+# Bundle fields mirrored into the module global of the same name with a leading underscore
+_BUNDLE_GLOBALS = (
+    'news_df', 'behaviors_df', 'item_ids', 'item_code', 'history_offsets', 'history_codes',
+    'impression_offsets', 'impression_codes', 'impression_labels', 'user_rows',
+    'item_clicks', 'category_index', 'cf_model', 'tfidf', 'item_neighbours',
+    'entity_index', 'article_embeddings', 'embedding_positions', 'user_embedding_rows',
+)
+
+def _apply_bundle(bundle):
+    global _active_bundle, _embeddings_checked, _lazy_news_columns
+    module_globals = globals()
+    for name in _BUNDLE_GLOBALS:
+        module_globals['_' + name] = getattr(bundle, name)
+    # Per-bundle caches start empty; parts the bundle did not precompute load lazily
+    _embeddings_checked = bundle.article_embeddings is not None
+    _lazy_news_columns = {}
+    with _last_good_lock:
+        _last_good.clear()
+    _active_bundle = bundle
+
+def _encode_click_lists(column, item_ids, item_code, labelled=False):
+    """Encode whitespace-separated NewsID lists as CSR (offsets, codes[, labels]).
+    
+    Ids not yet in item_code get new codes appended to item_ids. With
+    labelled=True tokens are impressions ("N123-1") and labels are returned too.
+    """
+    offsets = np.zeros(len(column) + 1, dtype=np.int64)
+    codes = array('i')
+    labels = array('b')
+    for i, value in enumerate(column.to_numpy()):
+        if isinstance(value, str):
+            for token in value.split():
+                if labelled:
+                    parts = token.split('-')
+                    if len(parts) != 2:
+                        continue
+                    token = parts[0]
+                    labels.append(int(parts[1]))
+                code = item_code.get(token)
+                if code is None:
+                    code = item_code[token] = len(item_ids)
+                    item_ids.append(token)
+                codes.append(code)
+        offsets[i + 1] = len(codes)
+    codes = np.frombuffer(codes, dtype=np.int32) if codes else np.zeros(0, dtype=np.int32)
+    if labelled:
+        return offsets, codes, np.frombuffer(labels, dtype=np.int8) if labels else np.zeros(0, dtype=np.int8)
+    return offsets, codes
+
+def _encode_behaviors(news_df, behaviors_df):
+    """Item codes and CSR history/impression arrays built from the raw strings, as a dict of bundle fields"""
+    # Articles keep their _news_df position as code; unknown ids are appended
+    item_ids = news_df['NewsID'].tolist()
+    item_code = {}
+    for position, news_id in enumerate(item_ids):
+        item_code.setdefault(news_id, position)
+    
+    history_offsets, history_codes = _encode_click_lists(
+        behaviors_df['History'], item_ids, item_code)
+    impression_offsets, impression_codes, impression_labels = _encode_click_lists(
+        behaviors_df['Impressions'], item_ids, item_code, labelled=True)
+    return {
+        'item_ids': np.array(item_ids, dtype=object),
+        'item_code': item_code,
+        'history_offsets': history_offsets,
+        'history_codes': history_codes,
+        'impression_offsets': impression_offsets,
+        'impression_codes': impression_codes,
+        'impression_labels': impression_labels,
+        'user_rows': behaviors_df.groupby('UserID', observed=True, sort=False).indices,
+    }
+
+def item_click_counts(fields):
+    """Clicks per item code (history + clicked impressions) from the encoded click arrays"""
+    n_items = len(fields['item_ids'])
+    clicks = np.bincount(fields['history_codes'], minlength=n_items)
+    clicks += np.bincount(fields['impression_codes'], weights=fields['impression_labels'],
+                          minlength=n_items).astype(np.int64)
+    return clicks
+
+def history_codes(row):
+    """Item codes clicked before behaviors row ``row`` (a view into the CSR array)"""
+    return _history_codes[_history_offsets[row]:_history_offsets[row + 1]]
+
+def user_history_codes(user_id):
+    """Item codes of all clicks in the user's behaviors rows, in row order"""
+    rows = _user_rows.get(user_id)
+    if rows is None:
+        return np.zeros(0, dtype=np.int32)
+    if len(rows) == 1:
+        return history_codes(rows[0])
+    return np.concatenate([history_codes(row) for row in rows])
+
+def seen_mask(user_id, recent_clicks=None, skipped=False):
+    """Boolean mask over _news_df positions of articles the user has seen, or None if there are none.
+    
+    Seen means clicked (history or impression) in any of the user's behaviors
+    rows or listed in recent_clicks; with skipped, also shown in an impression
+    and not clicked. Built from the item codes, so it costs O(history).
+    """
+    n_news = len(_news_df)
+    parts = []
+    for row in _user_rows.get(user_id, ()):
+        parts.append(history_codes(row))
+        start, end = _impression_offsets[row], _impression_offsets[row + 1]
+        shown = _impression_codes[start:end]
+        parts.append(shown if skipped else shown[_impression_labels[start:end] > 0])
+    if recent_clicks:
+        parts.append(np.fromiter((_item_code.get(news_id, n_news) for news_id in recent_clicks),
+                                 dtype=np.int64, count=len(recent_clicks)))
+    codes = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+    # Codes past the news table are ids missing from news.tsv; nothing to exclude
+    codes = codes[codes < n_news]
+    if not len(codes):
+        return None
+    mask = np.zeros(n_news, dtype=bool)
+    mask[codes] = True
+    return mask
+
+def news_column(name):
+    """Read-only array of a news.tsv column, aligned with _news_df rows.
+    
+    Loaded columns are returned without copying; URL and the entity columns
+    are read from disk on first access and kept.
+    """
+    _ensure_data_loaded()
+    if name in _news_df.columns:
+        values = _news_df[name].to_numpy()
+    else:
+        values = _lazy_news_columns.get(name)
+        if values is None:
+            if name not in NEWS_COLUMNS:
+                raise KeyError(name)
+            column = pd.read_csv(os.path.join(_active_bundle.path, 'news.tsv'), sep='\t', header=None,
+                                 names=NEWS_COLUMNS, usecols=[name])[name]
+            values = _lazy_news_columns.setdefault(name, column.to_numpy())
+    values = values.view()
+    values.flags.writeable = False
+    return values
+
+def data_memory_usage():
+    """Approximate bytes held by the loaded dataset, per structure"""
+    _ensure_data_loaded()
+    csr = (_history_offsets, _history_codes, _impression_offsets, _impression_codes, _impression_labels)
+    return {
+        'news_df': int(_news_df.memory_usage(deep=True).sum()),
+        'behaviors_df': int(_behaviors_df.memory_usage(deep=True).sum()),
+        'item_codes': int(_item_ids.nbytes + sys.getsizeof(_item_code)),
+        'click_arrays': int(sum(a.nbytes for a in csr)),
+        'lazy_news_columns': int(sum(pd.Series(v).memory_usage(deep=True) for v in _lazy_news_columns.values())),
+        'entity_index': _entity_index.memory_usage() if _entity_index is not None else 0,
+    }
 
 def parse_impressions(impression_str):
     """Parse impression string into list of (news_id, label) tuples"""
@@ -64,37 +340,104 @@ def parse_history(history_str):
         return []
     return history_str.split()
 
-def collaborative_filtering_recommendations(user_id, top_k=10):
+def collaborative_filtering_recommendations(user_id, top_k=10, category=None, exclude=None):
     """Generate recommendations using collaborative filtering with SVD"""
     _ensure_data_loaded()
     
+    with stage_timer("candidate_generation", "collaborative"):
+        user_encoder, news_encoder, matrix_reduced, svd_model = _get_collaborative_model()
+        allowed = _candidate_mask(category, exclude)
+    
+    # Get recommendations for the user
+    if user_id in user_encoder.classes_:
+        with stage_timer("scoring", "collaborative"):
+            top_positions, _ = collaborative_top_k([user_id], top_k, [allowed])[0]
+            recommendations = _article_records(top_positions)
+        
+        return recommendations
+    else:
+        # Return popular articles for new users
+        return get_popular_articles(top_k, category=category, exclude=exclude)
+
+def collaborative_top_k(user_ids, top_k, masks):
+    """(_news_df positions, scores) of the top_k CF items for each user, best first.
+    
+    user_ids must be known to the CF model; masks holds one _candidate_mask
+    per user (None: no restriction). Scores all users with one matrix product;
+    the online recommender and utils.precompute both rank through here.
+    """
+    user_encoder, news_encoder, matrix_reduced, svd_model = _get_collaborative_model()
+    # _news_df position of each scored item; -1 for ids missing from news.tsv
+    positions = _collaborative_positions(news_encoder)
+    scores = matrix_reduced[user_encoder.transform(user_ids)] @ svd_model.components_
+    return [_top_scored(row, positions, mask, top_k) for row, mask in zip(scores, masks)]
+
+def _top_scored(scores, positions, allowed, top_k):
+    """(_news_df positions, scores) of the top_k scores whose position is allowed, best first.
+    
+    positions maps each score to a _news_df position (-1 for ids missing from
+    news.tsv, never returned); allowed is a _candidate_mask or None.
+    """
+    valid = positions >= 0
+    if allowed is not None:
+        valid &= allowed[positions]
+    scores = np.where(valid, scores, -np.inf)
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return positions[:0], scores[:0]
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    # Stable on the partition: equal scores keep index order, so both callers agree
+    top = top[np.argsort(-scores[top], kind='stable')]
+    top = top[np.isfinite(scores[top])]
+    return positions[top], scores[top]
+
+def _collaborative_positions(news_encoder):
+    """_news_df position of every CF item (news_encoder order), computed once per model"""
+    global _cf_positions
+    cached = _cf_positions
+    if cached is not None and cached[0] is news_encoder:
+        return cached[1]
+    n_news = len(_news_df)
+    codes = np.fromiter((_item_code.get(news_id, n_news) for news_id in news_encoder.classes_),
+                        dtype=np.int64, count=len(news_encoder.classes_))
+    positions = np.where(codes < n_news, codes, -1)
+    _cf_positions = (news_encoder, positions)
+    return positions
+
+def _get_collaborative_model():
+    """Fit the CF model on first use and reuse it (the data does not change while a bundle is active)"""
+    global _cf_model
+    if _cf_model is None:
+        bundle = _active_bundle
+        with _cf_lock:
+            if _cf_model is None:
+                with model_load_timer("collaborative"):
+                    model = _fit_collaborative_model(bundle)
+                # Don't attach a model fitted on data that was swapped out meanwhile
+                if _active_bundle is not bundle:
+                    return model
+                _cf_model = model
+    return _cf_model
+
+def _fit_collaborative_model(data):
+    """Build the user-item matrix from the behaviors of data (a ModelBundle) and factorize it with SVD"""
     # Preprocess data for collaborative filtering
-    interaction_data = []
     user_encoder = LabelEncoder()
     news_encoder = LabelEncoder()
     
-    all_users = []
-    all_news = []
-    
-    for _, row in _behaviors_df.iterrows():
-        current_user_id = row['UserID']
-        history = parse_history(row['History'])
-        impressions = parse_impressions(row['Impressions'])
-        
-        # Add positive interactions from history
-        for news_id in history:
-            interaction_data.append((current_user_id, news_id, 1))
-            all_users.append(current_user_id)
-            all_news.append(news_id)
-        
-        # Add interactions from impressions
-        for news_id, label in impressions:
-            interaction_data.append((current_user_id, news_id, label))
-            all_users.append(current_user_id)
-            all_news.append(news_id)
+    # History clicks count as positive interactions, impressions carry their label
+    users = data.behaviors_df['UserID'].cat.categories.to_numpy()
+    user_codes = data.behaviors_df['UserID'].cat.codes.to_numpy()
+    interaction_users = np.concatenate([np.repeat(user_codes, np.diff(data.history_offsets)),
+                                        np.repeat(user_codes, np.diff(data.impression_offsets))])
+    interaction_items = np.concatenate([data.history_codes, data.impression_codes])
     
     # Create interaction matrix
-    df_interactions = pd.DataFrame(interaction_data, columns=['user_id', 'news_id', 'rating'])
+    df_interactions = pd.DataFrame({
+        'user_id': users[interaction_users],
+        'news_id': data.item_ids[interaction_items],
+        'rating': np.concatenate([np.ones(len(data.history_codes), dtype=np.int8), data.impression_labels]),
+    })
     df_interactions = df_interactions.groupby(['user_id', 'news_id'])['rating'].mean().reset_index()
     
     # Encode users and news
@@ -114,138 +457,265 @@ def collaborative_filtering_recommendations(user_id, top_k=10):
     svd_model = TruncatedSVD(n_components=n_latent_factors, random_state=42)
     matrix_reduced = svd_model.fit_transform(user_item_matrix)
     
-    # Get recommendations for the user
-    if user_id in user_encoder.classes_:
-        user_encoded = user_encoder.transform([user_id])[0]
-        user_profile = matrix_reduced[user_encoded]
+    return user_encoder, news_encoder, matrix_reduced, svd_model
+
+def content_based_recommendations(user_id, top_k=10, category=None, exclude=None):
+    """Generate recommendations using content-based filtering"""
+    _ensure_data_loaded()
+    
+    with stage_timer("candidate_generation", "content"):
+        # TF-IDF matrix for news content, fitted once per bundle
+        tfidf_vectorizer, tfidf_matrix = _get_tfidf()
+        
+        # Get user's reading history
+        user_rows = _user_rows.get(user_id)
+        if user_rows is None:
+            return get_popular_articles(top_k, category=category, exclude=exclude)
         
-        # Calculate scores for all news
-        scores = np.dot(svd_model.components_.T, user_profile)
+        # Create user profile from reading history
+        user_profile = np.zeros(tfidf_matrix.shape[1])
+        news_titles = news_column('Title')
+        
+        for row in user_rows:
+            clicked = history_codes(row)
+            titles = [t for t in news_titles[clicked[clicked < len(news_titles)]] if isinstance(t, str)]
+            
+            if titles:
+                user_content = ' '.join(titles)
+                user_tfidf = tfidf_vectorizer.transform([user_content])
+                user_profile += user_tfidf.toarray()[0]
+    
+    if np.sum(user_profile) == 0:
+        return get_popular_articles(top_k, category=category, exclude=exclude)
+    
+    with stage_timer("scoring", "content"):
+        # Calculate similarity with all news articles
+        user_profile = user_profile.reshape(1, -1)
+        similarities = cosine_similarity(user_profile, tfidf_matrix)[0]
+        allowed = _candidate_mask(category, exclude)
+        if allowed is not None:
+            similarities = np.where(allowed, similarities, -np.inf)
         
         # Get top recommendations
-        top_indices = np.argsort(scores)[::-1][:top_k]
-        recommended_news_ids = news_encoder.inverse_transform(top_indices)
+        top_indices = np.argsort(similarities)[::-1][:top_k]
+        if allowed is not None:
+            top_indices = top_indices[np.isfinite(similarities[top_indices])]
         
-        # Get news details
         recommendations = []
-        for news_id in recommended_news_ids:
-            news_info = _news_df[_news_df['NewsID'] == news_id]
-            if not news_info.empty:
-                recommendations.append({
-                    'NewsID': news_id,
-                    'Title': news_info.iloc[0]['Title'],
-                    'Category': news_info.iloc[0]['Category'],
-                    'Abstract': news_info.iloc[0]['Abstract']
-                })
-        
-        return recommendations
-    else:
-        # Return popular articles for new users
-        return get_popular_articles(top_k)
-
-def content_based_recommendations(user_id, top_k=10):
-    """Generate recommendations using content-based filtering"""
-    _ensure_data_loaded()
+        for idx in top_indices:
+            news_row = _news_df.iloc[idx]
+            recommendations.append({
+                'NewsID': news_row['NewsID'],
+                'Title': news_row['Title'],
+                'Category': news_row['Category'],
+                'Abstract': news_row['Abstract'],
+                'Similarity': similarities[idx]
+            })
     
-    # Create TF-IDF matrix for news content
-    news_content = _news_df['Title'].fillna('') + ' ' + _news_df['Abstract'].fillna('')
+    return recommendations
+
+def _get_tfidf():
+    """Fit the TF-IDF index on first use and reuse it (the data does not change while a bundle is active)"""
+    global _tfidf
+    if _tfidf is None:
+        bundle = _active_bundle
+        with _tfidf_lock:
+            if _tfidf is None:
+                with model_load_timer("tfidf"):
+                    tfidf = _fit_tfidf(bundle.news_df)
+                if _active_bundle is not bundle:
+                    return tfidf
+                _tfidf = tfidf
+    return _tfidf
+
+def _fit_tfidf(news_df):
+    """(vectorizer, matrix) over title + abstract of every article"""
+    news_content = news_df['Title'].fillna('') + ' ' + news_df['Abstract'].fillna('')
     tfidf_vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-    tfidf_matrix = tfidf_vectorizer.fit_transform(news_content)
-    
-    # Get user's reading history
-    user_data = _behaviors_df[_behaviors_df['UserID'] == user_id]
-    if user_data.empty:
-        return get_popular_articles(top_k)
+    return tfidf_vectorizer, tfidf_vectorizer.fit_transform(news_content)
+
+def _get_entity_index():
+    """Build the entity index on first use and reuse it (the data does not change while a bundle is active)"""
+    global _entity_index
+    if _entity_index is None:
+        bundle = _active_bundle
+        with _entity_lock:
+            if _entity_index is None:
+                with model_load_timer("entities"):
+                    index = _fit_entity_index(bundle)
+                if _active_bundle is not bundle:
+                    return index
+                _entity_index = index
+    return _entity_index
+
+def _fit_entity_index(data, news_dir=None):
+    """EntityIndex over the articles and clicks of data (a ModelBundle); news.tsv is read from news_dir or data.path"""
+    entity_columns = pd.read_csv(os.path.join(news_dir or data.path, 'news.tsv'), sep='\t', header=None,
+                                 names=NEWS_COLUMNS, usecols=['TitleEntities', 'AbstractEntities'])
+    if len(entity_columns) != len(data.news_df):
+        raise ValueError("news.tsv does not match the loaded articles")
     
-    # Create user profile from reading history
-    user_profile = np.zeros(tfidf_matrix.shape[1])
-    news_id_to_title = dict(zip(_news_df['NewsID'], _news_df['Title']))
+    # Binary user x article clicks: history plus clicked impressions, every behaviors row of a user
+    users = data.behaviors_df['UserID'].cat.categories.to_numpy()
+    user_codes = data.behaviors_df['UserID'].cat.codes.to_numpy()
+    clicked = data.impression_labels > 0
+    click_users = np.concatenate([np.repeat(user_codes, np.diff(data.history_offsets)),
+                                  np.repeat(user_codes, np.diff(data.impression_offsets))[clicked]])
+    click_items = np.concatenate([data.history_codes, data.impression_codes[clicked]])
+    # Codes past the news table are ids missing from news.tsv
+    keep = (click_items < len(data.news_df)) & (click_users >= 0)
+    clicks = sp.csr_matrix((np.ones(int(keep.sum()), dtype=np.float32), (click_users[keep], click_items[keep])),
+                           shape=(len(users), len(data.news_df)))
+    clicks.data[:] = 1
     
-    for _, row in user_data.iterrows():
-        clicked_ids = parse_history(row['History'])
-        titles = [news_id_to_title[nid] for nid in clicked_ids if nid in news_id_to_title]
-        
-        if titles:
-            user_content = ' '.join(titles)
-            user_tfidf = tfidf_vectorizer.transform([user_content])
-            user_profile += user_tfidf.toarray()[0]
+    return EntityIndex.build(entity_columns['TitleEntities'].to_numpy(), entity_columns['AbstractEntities'].to_numpy(),
+                             users, clicks)
+
+def entity_recommendations(user_id, top_k=10, recent_clicks=None, category=None, exclude=None):
+    """Recommend articles sharing knowledge-graph entities with the user's clicks (one sparse product)"""
+    _ensure_data_loaded()
     
-    if np.sum(user_profile) == 0:
-        return get_popular_articles(top_k)
+    with stage_timer("candidate_generation", "entity"):
+        index = _get_entity_index()
+        positions = None
+        if recent_clicks:
+            codes = np.fromiter((_item_code.get(news_id, len(_news_df)) for news_id in recent_clicks),
+                                dtype=np.int64, count=len(recent_clicks))
+            positions = codes[codes < len(_news_df)]
+        user_vector = index.user_vector(user_id, positions)
+    if user_vector is None:
+        return get_popular_articles(top_k, category=category, exclude=exclude)
     
-    # Calculate similarity with all news articles
-    user_profile = user_profile.reshape(1, -1)
-    similarities = cosine_similarity(user_profile, tfidf_matrix)[0]
+    with stage_timer("scoring", "entity"):
+        scores = index.scores(user_vector)
+        allowed = _candidate_mask(category, exclude)
+        # Only articles sharing at least one entity are candidates
+        candidates = scores > 0 if allowed is None else (scores > 0) & allowed
+        candidates = np.flatnonzero(candidates)
+        if len(candidates) > top_k:
+            # The k-th best score, then ties at it in news.tsv order, without sorting every candidate
+            kth = np.partition(scores[candidates], len(candidates) - top_k)[len(candidates) - top_k]
+            above = candidates[scores[candidates] > kth]
+            candidates = np.concatenate([above, candidates[scores[candidates] == kth][:top_k - len(above)]])
+        top_positions = candidates[np.lexsort((candidates, -scores[candidates]))]
+        
+        recommendations = _article_records(top_positions)
+        for record, position in zip(recommendations, top_positions):
+            record['Similarity'] = float(scores[position])
     
-    # Get top recommendations
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+    return recommendations
+
+def tfidf_neighbours(tfidf_matrix, rows, top_n=20):
+    """(positions, scores) of the top_n most cosine-similar articles to each of rows, itself excluded"""
+    # TfidfVectorizer rows are L2-normalized, so the dot product is the cosine
+    similarities = (tfidf_matrix[rows] @ tfidf_matrix.T).toarray().astype(np.float32)
+    similarities[np.arange(len(rows)), rows] = -1
+    top_n = min(top_n, similarities.shape[1] - 1)
+    top = np.argpartition(-similarities, top_n - 1, axis=1)[:, :top_n]
+    order = np.argsort(-np.take_along_axis(similarities, top, axis=1), axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    return top.astype(np.int32), np.take_along_axis(similarities, top, axis=1)
+
+def similar_articles(news_id, top_k=10):
+    """Articles with the most similar title + abstract, from the neighbours artifact when built"""
+    _ensure_data_loaded()
+    position = _item_code.get(news_id)
+    if position is None or position >= len(_news_df):
+        return []
+    if _item_neighbours is not None and top_k <= _item_neighbours[0].shape[1]:
+        positions, scores = _item_neighbours[0][position], _item_neighbours[1][position]
+    else:
+        positions, scores = tfidf_neighbours(_get_tfidf()[1], np.array([position]), top_k)
+        positions, scores = positions[0], scores[0]
     
     recommendations = []
-    for idx in top_indices:
+    for idx, score in zip(positions[:top_k], scores[:top_k]):
         news_row = _news_df.iloc[idx]
         recommendations.append({
             'NewsID': news_row['NewsID'],
             'Title': news_row['Title'],
             'Category': news_row['Category'],
             'Abstract': news_row['Abstract'],
-            'Similarity': similarities[idx]
+            'Similarity': float(score)
         })
-    
     return recommendations
 
-def hybrid_recommendations(user_id, top_k=10, cf_weight=0.6, cb_weight=0.4):
+def hybrid_recommendations(user_id, top_k=10, cf_weight=0.6, cb_weight=0.4, category=None, exclude=None):
     """Generate hybrid recommendations combining collaborative and content-based filtering"""
-    cf_recs = collaborative_filtering_recommendations(user_id, top_k * 2)
-    cb_recs = content_based_recommendations(user_id, top_k * 2)
-    
-    # Simple hybrid approach: combine and weight
-    all_recs = {}
-    
-    # Add collaborative filtering recommendations
-    for i, rec in enumerate(cf_recs):
-        score = cf_weight * (len(cf_recs) - i) / len(cf_recs)
-        all_recs[rec['NewsID']] = {
-            'rec': rec,
-            'score': score
-        }
+    cf_recs = collaborative_filtering_recommendations(user_id, top_k * 2, category=category, exclude=exclude)
+    cb_recs = content_based_recommendations(user_id, top_k * 2, category=category, exclude=exclude)
     
-    # Add content-based recommendations
-    for i, rec in enumerate(cb_recs):
-        score = cb_weight * (len(cb_recs) - i) / len(cb_recs)
-        news_id = rec['NewsID']
-        if news_id in all_recs:
-            all_recs[news_id]['score'] += score
-        else:
-            all_recs[news_id] = {
+    with stage_timer("scoring", "hybrid"):
+        # Simple hybrid approach: combine and weight
+        all_recs = {}
+        
+        # Add collaborative filtering recommendations
+        for i, rec in enumerate(cf_recs):
+            score = cf_weight * (len(cf_recs) - i) / len(cf_recs)
+            all_recs[rec['NewsID']] = {
                 'rec': rec,
                 'score': score
             }
-    
-    # Sort by combined score
-    sorted_recs = sorted(all_recs.items(), key=lambda x: x[1]['score'], reverse=True)
+        
+        # Add content-based recommendations
+        for i, rec in enumerate(cb_recs):
+            score = cb_weight * (len(cb_recs) - i) / len(cb_recs)
+            news_id = rec['NewsID']
+            if news_id in all_recs:
+                all_recs[news_id]['score'] += score
+            else:
+                all_recs[news_id] = {
+                    'rec': rec,
+                    'score': score
+                }
+        
+        # Sort by combined score
+        sorted_recs = sorted(all_recs.items(), key=lambda x: x[1]['score'], reverse=True)
     
     return [item[1]['rec'] for item in sorted_recs[:top_k]]
 
-def get_popular_articles(top_k=10):
-    """Get popular articles based on category diversity"""
+def get_popular_articles(top_k=10, category=None, exclude=None):
+    """Get popular articles based on category diversity, or the most clicked ones in category.
+    
+    exclude is a boolean mask over _news_df positions (see seen_mask) of articles to leave out.
+    """
     _ensure_data_loaded()
     
+    if _category_mask(category) is not None:
+        return _article_records(_unexcluded(_category_index.ranking(category), exclude)[:top_k])
+    
     # Simple popularity based on category distribution
     popular_articles = []
-    categories = _news_df['Category'].value_counts().head(5).index
-    
-    for category in categories:
-        category_articles = _news_df[_news_df['Category'] == category].head(2)
-        for _, article in category_articles.iterrows():
-            if len(popular_articles) < top_k:
-                popular_articles.append({
-                    'NewsID': article['NewsID'],
-                    'Title': article['Title'],
-                    'Category': article['Category'],
-                    'Abstract': article['Abstract']
-                })
+    for category in _category_index.top_categories[:5]:
+        popular_articles.extend(_article_records(_unexcluded(_category_index.positions(category), exclude)[:2]))
     
-    return popular_articles
+    return popular_articles[:top_k]
+
+def _unexcluded(positions, exclude):
+    return positions if exclude is None else positions[~exclude[positions]]
+
+def _category_mask(category):
+    """Boolean mask over _news_df positions for a category/subcategory name; None for no filter"""
+    if not category or category.lower() == 'all':
+        return None
+    return _category_index.mask(category)
+
+def _candidate_mask(category=None, exclude=None):
+    """Mask of scorable _news_df positions: in category and not excluded; None for no restriction"""
+    allowed = _category_mask(category)
+    if exclude is None:
+        return allowed
+    return ~exclude if allowed is None else allowed & ~exclude
+
+def _article_records(positions):
+    """NewsID/Title/Category/Abstract dicts for _news_df positions, in order"""
+    articles = _news_df.iloc[positions]
+    return [
+        {'NewsID': news_id, 'Title': title, 'Category': category, 'Abstract': abstract}
+        for news_id, title, category, abstract in zip(
+            articles['NewsID'].tolist(), articles['Title'].tolist(),
+            articles['Category'].tolist(), articles['Abstract'].tolist())
+    ]
 
 def get_user_list():
     """Get list of available users"""
@@ -255,24 +725,12 @@ def get_user_list():
 def get_news_by_category(category, limit=10):
     """Get news articles by category"""
     _ensure_data_loaded()
-    
-    category_news = _news_df[_news_df['Category'] == category].head(limit)
-    
-    news_list = []
-    for _, article in category_news.iterrows():
-        news_list.append({
-            'NewsID': article['NewsID'],
-            'Title': article['Title'],
-            'Category': article['Category'],
-            'Abstract': article['Abstract']
-        })
-    
-    return news_list
+    return _article_records(_category_index.positions(category)[:limit])
 
 def get_categories():
     """Get list of available categories"""
     _ensure_data_loaded()
-    return _news_df['Category'].value_counts().head(10).index.tolist()
+    return _category_index.top_categories[:10]
 
 # Additional functions expected by main.py
 def get_user_recommendations(user_id, method='hybrid', top_k=10):
@@ -290,14 +748,13 @@ def get_article_recommendations(keywords, top_k=10, category=None):
     """Get article recommendations based on keywords and optional category"""
     _ensure_data_loaded()
     
-    # Start with all articles
-    df = _news_df.copy()
+    # Start with all articles (filters below produce new frames, no copy needed)
+    df = _news_df
     
-    # Filter by category if specified
+    # Filter by category if specified (categories whose name contains it, from the index)
     if category and category.lower() != 'all':
-        category_mask = df['Category'].str.contains(category, case=False, na=False)
-        df = df[category_mask]
-        print(f"Filtering by category '{category}': {len(df)} articles found")
+        df = df.iloc[_category_index.matching(category, subcategories=False)]
+        logger.debug("Filtered by category", extra={"category": category, "articles": len(df)})
     
     # Search in titles and abstracts
     if keywords and keywords.strip():
@@ -335,36 +792,55 @@ def get_news_metadata(news_id):
             'Category': article_data['Category'],
             'SubCategory': article_data['SubCategory'],
             'Abstract': article_data['Abstract'],
-            'URL': article_data['URL']
+            'URL': news_column('URL')[article.index[0]]
         }
     return None
 
-def get_bert4rec_recommendations(user_id, top_k=10):
-    """BERT4Rec recommendations using the real transformer model"""
+def get_bert4rec_recommendations(user_id, top_k=10, exclude=None):
+    """BERT4Rec recommendations using the real transformer model (exclude defaults to the user's clicks)"""
     _ensure_data_loaded()
     
     try:
         # Import and use the real BERT4Rec implementation
-        from utils.bert4rec import BERT4RecRecommender
+        from utils.bert4rec import get_bert4rec_instance
         
-        print("Using BERT4Rec for sequential recommendations")
+        logger.debug("Using BERT4Rec for sequential recommendations", extra={"user_id": user_id})
         
-        # Initialize BERT4Rec
-        bert_recommender = BERT4RecRecommender()
+        # Model and histories are loaded once and shared across requests
+        bert_recommender = get_bert4rec_instance(**bert_inference_options)
         bert_recommender.load_model()
-        bert_recommender.load_data(_news_df, _behaviors_df)
+        if bert_recommender.data_version != _active_bundle.version:
+            bert_recommender = _bert_for_active_bundle()
         
         # Get BERT4Rec recommendations
-        recommendations = bert_recommender.recommend_articles_for_user(user_id, top_k)
+        if exclude is None:
+            exclude = seen_mask(user_id)
+        recommendations = bert_recommender.recommend_articles_for_user(user_id, top_k, exclude=exclude)
         
         return recommendations
         
     except ImportError as e:
-        print(f"BERT4Rec import failed ({str(e)}), falling back to hybrid recommendations")
-        return hybrid_recommendations(user_id, top_k)
+        logger.warning("BERT4Rec import failed, falling back to hybrid recommendations", extra={"error": str(e)})
+        return hybrid_recommendations(user_id, top_k, exclude=exclude)
     except Exception as e:
-        print(f"BERT4Rec failed ({str(e)}), falling back to hybrid recommendations")
-        return hybrid_recommendations(user_id, top_k)
+        logger.warning("BERT4Rec failed, falling back to hybrid recommendations", extra={"error": str(e)})
+        return hybrid_recommendations(user_id, top_k, exclude=exclude)
+
+def _bert_for_active_bundle():
+    """BERT4Rec instance with the active bundle's histories, replacing the shared one.
+    
+    The new instance is a shallow copy that shares the loaded model and
+    tokenizer, so requests still using the old one are not affected.
+    """
+    import utils.bert4rec as bert4rec
+    bundle = _active_bundle
+    with _bert_lock:
+        recommender = bert4rec.get_bert4rec_instance(**bert_inference_options)
+        if recommender.data_version != bundle.version:
+            recommender = copy.copy(recommender)
+            recommender.load_data(_news_df, user_clicks=get_user_click_ids(), version=bundle.version)
+            bert4rec._bert4rec_instance = recommender
+    return recommender
 
 def get_trending_articles(top_k=10):
     """Get trending articles (same as popular articles)"""
@@ -375,25 +851,21 @@ def get_user_histories():
     _ensure_data_loaded()
     
     histories = {}
-    for _, row in _behaviors_df.iterrows():
-        user_id = row['UserID']
-        history = parse_history(row['History'])
-        
-        if user_id not in histories:
-            histories[user_id] = []
-        
-        histories[user_id].extend(history)
-    
-    # Remove duplicates and limit
-    for user_id in histories:
-        histories[user_id] = list(set(histories[user_id]))[:50]  # Limit to 50 articles per user
+    for user_id in _user_rows:
+        history = _item_ids[user_history_codes(user_id)]
+        histories[user_id] = list(set(history))[:50]  # Limit to 50 articles per user
     
     return histories
 
+def get_user_click_ids():
+    """User id -> clicked NewsIDs in behaviors order (duplicates kept)"""
+    _ensure_data_loaded()
+    return {user_id: _item_ids[user_history_codes(user_id)].tolist() for user_id in _user_rows}
+
 def get_unique_articles_df():
-    """Get unique articles DataFrame"""
+    """Get unique articles DataFrame (shares data with the loaded frame; treat as read-only)"""
     _ensure_data_loaded()
-    return _news_df.copy()
+    return _news_df.copy(deep=False)
 
 # Create user_histories as a simple variable for compatibility
 user_histories = None
@@ -404,19 +876,18 @@ unique_articles_df = None
 def get_available_categories():
     """Get list of available news categories from the dataset"""
     _ensure_data_loaded()
-    categories = _news_df['Category'].unique().tolist()
-    categories = [cat for cat in categories if pd.notna(cat)]  # Remove NaN values
-    return sorted(categories)
+    return _category_index.names()
 
 # ---- Thin helper API for FastAPI layer ----
 
-def get_trending_articles(k: int = 20):
-    """Return top-k trending articles.
+def get_trending_articles(k: int = 20, category: Optional[str] = None):
+    """Return top-k trending articles (the most clicked ones when category is given).
     MUST return: list[dict] with keys: item_id (str), score (float), title (str|opt), reason (str|opt)."""
     _ensure_data_loaded()
     
     # Use the existing get_popular_articles function and convert to expected format
-    popular_articles = get_popular_articles(top_k=k)
+    with stage_timer("candidate_generation", "trending"):
+        popular_articles = get_popular_articles(top_k=k, category=category)
     
     trending_articles = []
     for article in popular_articles:
@@ -432,149 +903,372 @@ def get_trending_articles(k: int = 20):
 def format_recommendations(recs, reason_prefix):
     """Format recommendations to standard format"""
     results = []
+    # Almost every rec takes the default reason; build that string once
+    default_reason = f"{reason_prefix}: Based on your preferences"
     for rec in recs:
         if isinstance(rec, dict):
             # Standardize the format
-            item = {
-                "item_id": rec.get('NewsID', rec.get('item_id', 'unknown')),
-                "score": float(rec.get('score', rec.get('Similarity', 1.0))),
-                "title": rec.get('Title', rec.get('title', f"Article {rec.get('NewsID', 'unknown')}")),
-                "reason": f"{reason_prefix}: {rec.get('reason', 'Based on your preferences')}"
-            }
-            results.append(item)
+            news_id = rec['NewsID'] if 'NewsID' in rec else rec.get('item_id', 'unknown')
+            if 'Title' in rec:
+                title = rec['Title']
+            elif 'title' in rec:
+                title = rec['title']
+            else:
+                title = f"Article {rec.get('NewsID', 'unknown')}"
+            if 'score' in rec:
+                score = rec['score']
+            else:
+                score = rec.get('Similarity', 1.0)
+            reason = rec.get('reason')
+            results.append({
+                "item_id": news_id,
+                "score": float(score),
+                "title": title,
+                "reason": default_reason if reason is None else f"{reason_prefix}: {reason}",
+            })
         else:
             # Handle legacy tuple format
-            print(f"Warning: unexpected recommendation format: {rec}")
+            logger.warning("Unexpected recommendation format", extra={"rec": repr(rec)})
     return results
 
-def bert_recommendations(user_id: str, top_k: int = 10):
-    """BERT-based recommendations (enhanced content-based for now)"""
-    # For now, use enhanced content-based approach
-    # This simulates BERT by giving higher weight to recent interactions
-    user_data = _behaviors_df[_behaviors_df['UserID'] == user_id]
-    if user_data.empty:
-        return get_popular_articles(top_k)
+def bert_recommendations(user_id: str, top_k: int = 10, category=None, exclude=None):
+    """Fallback for "bert" when no article embeddings are built: content-based over the user's history.
     
-    # Get user's recent history with higher weighting for recent items
-    recent_articles = []
-    for _, row in user_data.iterrows():
-        history = parse_history(row['History'])
-        # Take only the most recent items for BERT-style sequential modeling
-        recent_articles.extend(history[-5:])  # Last 5 articles
+    Deterministic, so results can be cached, precomputed and compared.
+    """
+    user_rows = _user_rows.get(user_id)
+    if user_rows is None or not any(len(history_codes(row)) for row in user_rows):
+        return get_popular_articles(top_k, category=category, exclude=exclude)
     
-    if not recent_articles:
-        return get_popular_articles(top_k)
+    return content_based_recommendations(user_id, top_k, category=category, exclude=exclude)
+
+def _ensure_embeddings_loaded():
+    """Memory-map the article embeddings once; returns None when they were never built"""
+    global _article_embeddings, _embeddings_checked, _embedding_positions, _user_embedding_rows
+    if not _embeddings_checked:
+        _ensure_data_loaded()
+        with model_load_timer("article_embeddings"):
+            embeddings = load_embeddings(embeddings_dir)
+            if embeddings is not None:
+                _embedding_positions, _user_embedding_rows = _map_embeddings(_active_bundle, embeddings)
+        _article_embeddings = embeddings
+        _embeddings_checked = True
+        if embeddings is None:
+            logger.info("No article embeddings found", extra={"path": embeddings_dir})
+        else:
+            logger.info("Loaded article embeddings", extra={
+                "rows": embeddings.matrix.shape[0], "dim": embeddings.dim, "users": len(_user_embedding_rows),
+            })
+    return _article_embeddings
+
+def _map_embeddings(data, embeddings):
+    """(embedding row -> news position, user id -> embedding rows of clicked articles) for data (a ModelBundle)"""
+    positions = pd.Index(data.news_df['NewsID']).get_indexer(embeddings.news_ids)
+    
+    # Map every user's click history to embedding rows once, not per request
+    code_rows = pd.Index(embeddings.news_ids).get_indexer(data.item_ids)
+    user_rows = {}
+    for uid, behavior_rows in data.user_rows.items():
+        rows = np.concatenate([code_rows[data.history_codes[data.history_offsets[row]:data.history_offsets[row + 1]]]
+                               for row in behavior_rows])
+        user_rows[uid] = rows[rows >= 0]
+    return positions, user_rows
+
+def semantic_recommendations(user_id: str, top_k: int = 10, recent_clicks=None, category=None, exclude=None):
+    """Recommend by dot product between precomputed article embeddings and the user's mean history embedding"""
+    embeddings = _ensure_embeddings_loaded()
+    if embeddings is None:
+        raise RuntimeError("Article embeddings not built; run python -m utils.embeddings")
     
-    # Use content-based approach with recent focus
-    content_recs = content_based_recommendations(user_id, top_k * 2)
+    with stage_timer("candidate_generation", "semantic"):
+        rows = _user_embedding_rows.get(user_id, np.zeros(0, dtype=np.int64))
+        if recent_clicks:
+            rows = np.concatenate([rows, embeddings.rows_for(recent_clicks)])
+        user_vector = embeddings.user_vector(rows)
+    if user_vector is None:
+        return get_popular_articles(top_k, category=category, exclude=exclude)
     
-    # Add some randomization to simulate BERT's neural approach
-    import random
-    random.shuffle(content_recs)
+    with stage_timer("scoring", "semantic"):
+        top_positions, top_scores = semantic_top_k([user_vector], top_k, [_candidate_mask(category, exclude)])[0]
+        recommendations = _article_records(top_positions)
+        for record, score in zip(recommendations, top_scores.tolist()):
+            record['Similarity'] = score
+    
+    return recommendations
+
+def semantic_top_k(user_vectors, top_k, masks):
+    """(_news_df positions, scores) of the top_k articles for each user vector, best first.
     
-    return content_recs[:top_k]
+    masks holds one _candidate_mask per vector (None: no restriction). Scores
+    all vectors with one matrix product; the online recommender and
+    utils.precompute both rank through here.
+    """
+    scores = np.stack(user_vectors) @ np.asarray(_article_embeddings.matrix).T
+    return [_top_scored(row, _embedding_positions, mask, top_k) for row, mask in zip(scores, masks)]
 
-def recommend_for_user(user_id: str, k: int = 10, recent_clicks=None, locale: str = "en", algorithm: str = "hybrid"):
+def recommend_for_user(user_id: str, k: int = 10, recent_clicks=None, locale: str = "en", algorithm: str = "hybrid",
+                       deadline: Optional[float] = None, category: Optional[str] = None,
+                       exclude_seen: bool = True, exclude_skipped: bool = False, rerank: Optional[str] = None):
     """Return top-k personalized recommendations for user_id.
-    MUST return: list[dict] with keys: item_id, score, title|opt, reason|opt."""
+    MUST return: list[dict] with keys: item_id, score, title|opt, reason|opt.
+    
+    deadline (seconds, default recommend_deadlines[algorithm]) bounds the
+    wait; when it passes, a cheaper result is returned and its reason says so.
+    category (a Category or SubCategory name) restricts results to it.
+    exclude_seen leaves out articles the user clicked (history and
+    recent_clicks), and exclude_skipped those shown to them and not clicked.
+    rerank ("mmr" or "category") diversifies a larger ranked pool down to k."""
     _ensure_data_loaded()
+    if category and category.lower() == 'all':
+        category = None
+    if rerank:
+        if rerank not in RERANKERS:
+            raise ValueError(f"Unknown reranker {rerank!r}; expected one of {RERANKERS}")
+        pool = recommend_for_user(user_id, max(diversity_pool_size, 2 * k), recent_clicks, locale, algorithm,
+                                  deadline, category, exclude_seen, exclude_skipped)
+        with stage_timer("reranking", algorithm):
+            return rerank_recommendations(pool, k, rerank)
+    exclude = (exclude_seen, exclude_skipped)
+    # Stored and remembered results use the default exclusion and no extra filters
+    plain = not category and exclude == (True, False)
+    
+    # Recent clicks or a category change the ranking, so only plain requests use the store
+    if precomputed_store is not None and not recent_clicks and plain:
+        from utils.precompute import lookup
+        results = lookup(precomputed_store, user_id, algorithm, k, precomputed_max_age)
+        if results is not None:
+            return results
     
+    if deadline is None:
+        deadline = recommend_deadlines.get(algorithm)
+    # A profiled request runs inline: the profiler only sees the calling
+    # thread, which would otherwise just wait on the deadline executor
+    if not deadline or profiling.is_active():
+        results = _recommend(user_id, k, recent_clicks, algorithm, category, exclude)
+        if plain:
+            _remember_good(user_id, algorithm, results)
+        return results
+    
+    future = _get_deadline_executor().submit(
+        contextvars.copy_context().run, _recommend_holding_model, user_id, k, recent_clicks, algorithm, category,
+        exclude)
+    try:
+        results = future.result(timeout=deadline)
+    except FutureTimeoutError:
+        # Still queued: drop it. Already running: let it finish in the background.
+        future.cancel()
+        return _degraded_recommendations(user_id, k, algorithm, category,
+                                         _exclusion_mask(user_id, recent_clicks, exclude), plain)
+    if plain:
+        _remember_good(user_id, algorithm, results)
+    return results
+
+def rerank_recommendations(results, k, method="mmr"):
+    """Top k of formatted results (best first), re-ranked for diversity by method (see RERANKERS)"""
+    if len(results) <= 1:
+        return results[:k]
+    n_news = len(_news_df)
+    codes = np.fromiter((_item_code.get(item['item_id'], n_news) for item in results),
+                        dtype=np.int64, count=len(results))
+    known = codes < n_news
+    positions = np.where(known, codes, 0)
+    if method == "mmr":
+        # Relevance from rank: scores aren't comparable (constant 1.0 for CF and
+        # trending, cosines for content, both mixed in hybrid lists)
+        relevance = 1 - np.arange(len(results)) / len(results)
+        order = diversity.mmr(relevance, _diversity_vectors(positions, known), k, diversity_weight)
+    else:
+        # Items missing from news.tsv each count as a category of their own
+        categories = np.where(known, _news_df['Category'].cat.codes.to_numpy()[positions],
+                              -1 - np.arange(len(results)))
+        order = diversity.category_quota(categories, k, diversity_max_per_category)
+    return [results[i] for i in order]
+
+def _diversity_vectors(positions, known):
+    """L2-normalized vectors of candidate articles: embeddings when built, else TF-IDF rows (zero if unknown)"""
+    embeddings = _ensure_embeddings_loaded()
+    if embeddings is not None:
+        rows = embeddings.rows_for(_news_df['NewsID'].to_numpy()[positions])
+        if len(rows) == len(positions):
+            return np.where(known[:, None], np.asarray(embeddings.matrix[rows], dtype=np.float32), 0)
+    tfidf_matrix = _get_tfidf()[1]
+    return tfidf_matrix[positions].multiply(known[:, None]).tocsr()
+
+def _get_deadline_executor():
+    global _deadline_executor
+    if _deadline_executor is None:
+        with _deadline_lock:
+            if _deadline_executor is None:
+                _deadline_executor = ThreadPoolExecutor(max_workers=deadline_workers,
+                                                        thread_name_prefix="recommend")
+    return _deadline_executor
+
+def _recommend_holding_model(*args):
+    # Worker threads don't share the caller's read hold; a swap waiting on the
+    # caller then holds this back until the deadline releases it
+    with hold_model():
+        return _recommend(*args)
+
+def _remember_good(user_id, algorithm, results):
+    if not results or results[0]['reason'].startswith("Trending") or "(degraded:" in results[0]['reason']:
+        return
+    with _last_good_lock:
+        _last_good[(user_id, algorithm)] = results
+        _last_good.move_to_end((user_id, algorithm))
+        while len(_last_good) > LAST_GOOD_MAX_ENTRIES:
+            _last_good.popitem(last=False)
+
+def _degraded_recommendations(user_id, k, algorithm, category=None, exclude=None, plain=True):
+    """Best result available without running the slow algorithm:
+    precomputed (even if stale), last good response, CF model, trending.
+    Precomputed and last good results are only for plain requests (see recommend_for_user)."""
+    precomputed = cached = None
+    if precomputed_store is not None and plain:
+        from utils.precompute import lookup
+        precomputed = lookup(precomputed_store, user_id, algorithm, k)
+    if plain:
+        with _last_good_lock:
+            cached = _last_good.get((user_id, algorithm))
+    if precomputed is not None:
+        source, results = "precomputed", precomputed
+    elif cached is not None:
+        source, results = "cached", cached[:k]
+    elif _cf_model is not None and algorithm != "collaborative":
+        # Only when already fitted: scoring is a single dot product
+        source, results = "collaborative", format_recommendations(
+            collaborative_filtering_recommendations(user_id, top_k=k, category=category, exclude=exclude),
+            "Collaborative Filtering")
+    else:
+        source, results = "trending", format_recommendations(
+            get_popular_articles(top_k=k, category=category, exclude=exclude), "Trending")
+    
+    logger.warning("Recommendation deadline exceeded, serving degraded result",
+                   extra={"algorithm": algorithm, "user_id": user_id, "source": source})
+    record_degraded(algorithm, source)
+    return [{**item, "reason": f"{item['reason']} (degraded: {algorithm} deadline exceeded, {source} result)"}
+            for item in results]
+
+def _warn_degraded_once(algorithm, source):
+    # Every request would hit this while the artifact is missing; snr_degraded_responses_total counts them
+    global _degraded_warned
+    if not _degraded_warned:
+        _degraded_warned = True
+        logger.warning("Article embeddings not built, serving degraded results",
+                       extra={"algorithm": algorithm, "source": source, "path": embeddings_dir})
+
+def _exclusion_mask(user_id, recent_clicks, exclude):
+    """seen_mask for an (exclude_seen, exclude_skipped) pair"""
+    exclude_seen, exclude_skipped = exclude
+    if not (exclude_seen or exclude_skipped):
+        return None
+    if exclude_seen:
+        return seen_mask(user_id, recent_clicks, skipped=exclude_skipped)
+    # Skipped only: everything shown minus what was clicked
+    shown = seen_mask(user_id, skipped=True)
+    clicked = seen_mask(user_id)
+    return shown if shown is None or clicked is None else shown & ~clicked
+
+def _recommend(user_id, k, recent_clicks, algorithm, category=None, exclude=(True, False)):
+    # Its own stage: the recommenders time candidate_generation themselves
+    with stage_timer("exclusion", algorithm):
+        exclude = _exclusion_mask(user_id, recent_clicks, exclude)
+    degraded = None
     try:
         if algorithm == "collaborative":
             # Use collaborative filtering
-            recs = collaborative_filtering_recommendations(user_id, top_k=k)
-            return format_recommendations(recs, "Collaborative Filtering")
+            recs = collaborative_filtering_recommendations(user_id, top_k=k, category=category, exclude=exclude)
+            reason_prefix = "Collaborative Filtering"
             
         elif algorithm == "content":
             # Use content-based filtering
-            recs = content_based_recommendations(user_id, top_k=k)
-            return format_recommendations(recs, "Content-Based")
+            recs = content_based_recommendations(user_id, top_k=k, category=category, exclude=exclude)
+            reason_prefix = "Content-Based"
             
         elif algorithm == "hybrid":
             # Use hybrid approach
-            recs = hybrid_recommendations(user_id, top_k=k)
-            return format_recommendations(recs, "Hybrid Recommendation")
+            recs = hybrid_recommendations(user_id, top_k=k, category=category, exclude=exclude)
+            reason_prefix = "Hybrid Recommendation"
+            
+        elif algorithm in ("bert", "semantic") and _ensure_embeddings_loaded() is not None:
+            # Precomputed transformer embeddings: one vector average and one matmul
+            recs = semantic_recommendations(user_id, top_k=k, recent_clicks=recent_clicks, category=category,
+                                            exclude=exclude)
+            reason_prefix = "BERT Semantic"
+            
+        elif algorithm == "semantic":
+            # Embeddings were never built: rank by TF-IDF text similarity instead, and say so
+            recs = content_based_recommendations(user_id, top_k=k, category=category, exclude=exclude)
+            reason_prefix = "Content-Based"
+            degraded = "content"
+            
+        elif algorithm == "entity":
+            # Shared Wikidata entities between clicked and candidate articles
+            recs = entity_recommendations(user_id, top_k=k, recent_clicks=recent_clicks, category=category,
+                                          exclude=exclude)
+            reason_prefix = "Entity Match"
             
         elif algorithm == "bert":
             # Use BERT4Rec approach (simulated for now)
-            recs = bert_recommendations(user_id, top_k=k)
-            return format_recommendations(recs, "BERT4Rec")
+            recs = bert_recommendations(user_id, top_k=k, category=category, exclude=exclude)
+            reason_prefix = "BERT4Rec"
             
         else:
             # Default to hybrid
-            recs = hybrid_recommendations(user_id, top_k=k)
-            return format_recommendations(recs, "Hybrid Recommendation")
+            algorithm = "hybrid"
+            recs = hybrid_recommendations(user_id, top_k=k, category=category, exclude=exclude)
+            reason_prefix = "Hybrid Recommendation"
             
     except Exception as e:
-        print(f"Recommendation failed for algorithm {algorithm}: {e}")
+        logger.warning("Recommendation failed, falling back to trending",
+                       extra={"algorithm": algorithm, "user_id": user_id, "error": str(e)})
         # Fallback to trending
-        trending_recs = get_popular_articles(top_k=k)
-        return format_recommendations(trending_recs, "Trending")
+        algorithm = "trending"
+        recs = get_popular_articles(top_k=k, category=category, exclude=exclude)
+        reason_prefix = "Trending"
+    
+    with stage_timer("formatting", algorithm):
+        results = format_recommendations(recs, reason_prefix)
+    if degraded is not None:
+        _warn_degraded_once(algorithm, degraded)
+        record_degraded(algorithm, degraded)
+        results = [{**item, "reason": f"{item['reason']} (degraded: {algorithm} embeddings not built, "
+                                      f"{degraded} result)"} for item in results]
+    return results
 
 def search_by_keywords(q: str, k: int = 20, category: Optional[str] = None):
-    """Keyword search using your TF-IDF or content-based search.
+    """Keyword search over titles (2 points) and abstracts (1 point).
     MUST return: list[dict] with keys: item_id, score, title|opt, reason|opt."""
     _ensure_data_loaded()
     
-    try:
-        # Use existing keyword search functionality
-        article_results = get_article_recommendations(q, top_k=k)
-        formatted_results = []
-        
-        for _, article in article_results.iterrows():
-            # Apply category filter if specified
-            if category and category.lower() != 'all':
-                article_category = article.get('Category', '').lower()
-                article_subcategory = article.get('SubCategory', '').lower()
-                if (category.lower() not in article_category and 
-                    category.lower() not in article_subcategory):
-                    continue
-            
-            formatted_results.append({
-                "item_id": article['NewsID'],
-                "score": 1.0,  # get_article_recommendations doesn't return scores
-                "title": article['Title'] if pd.notna(article['Title']) else f"Article {article['NewsID']}",
-                "reason": "Keyword match"
-            })
-        
-        return formatted_results[:k]
-        
-    except Exception as e:
-        print(f"Keyword search failed: {e}")
-        # Fallback to simple title/abstract search
+    with stage_timer("candidate_generation", "search"):
+        # Category or subcategory containing category, from the index
+        if category and category.lower() != 'all':
+            articles = _news_df.iloc[_category_index.matching(category)]
+        else:
+            articles = _news_df
+    
+    with stage_timer("scoring", "search"):
         query_lower = q.lower()
-        matches = []
+        titles = articles['Title'].astype(object).fillna("")
+        abstracts = articles['Abstract'].astype(object).fillna("")
+        scores = (2.0 * titles.str.lower().str.contains(query_lower, regex=False).to_numpy(dtype=float)
+                  + abstracts.str.lower().str.contains(query_lower, regex=False).to_numpy(dtype=float))
         
-        for _, article in _news_df.iterrows():
-            # Apply category filter if specified
-            if category and category.lower() != 'all':
-                article_category = article.get('Category', '').lower()
-                article_subcategory = article.get('SubCategory', '').lower()
-                if (category.lower() not in article_category and 
-                    category.lower() not in article_subcategory):
-                    continue
-                    
-            score = 0.0
-            title = article['Title'] if pd.notna(article['Title']) else ""
-            abstract = article['Abstract'] if pd.notna(article['Abstract']) else ""
-            
-            # Simple keyword matching
-            if query_lower in title.lower():
-                score += 2.0
-            if query_lower in abstract.lower():
-                score += 1.0
-            
-            if score > 0:
-                matches.append({
-                    "item_id": article['NewsID'],
-                    "score": score,
-                    "title": title or f"Article {article['NewsID']}",
-                    "reason": "Keyword match"
-                })
-        
-        # Sort by score and return top k
-        matches.sort(key=lambda x: x['score'], reverse=True)
-        return matches[:k]
+        # Sort by score (stable, so ties keep news.tsv order) and return top k
+        matched = np.flatnonzero(scores > 0)
+        top = matched[np.argsort(-scores[matched], kind='stable')[:k]]
+    
+    news_ids = articles['NewsID'].to_numpy()
+    titles = titles.to_numpy()
+    return [
+        {
+            "item_id": news_ids[i],
+            "score": float(scores[i]),
+            "title": titles[i] or f"Article {news_ids[i]}",
+            "reason": "Keyword match"
+        }
+        for i in top
+    ]
 
 def get_article_details(news_ids):
     """Get full article details by news IDs for PDF export"""
@@ -591,6 +1285,6 @@ def get_article_details(news_ids):
                 'category': article['Category'], 
                 'subcategory': article['SubCategory'],
                 'abstract': article['Abstract'],
-                'url': article.get('URL', '')
+                'url': news_column('URL')[article_row.index[0]]
             })
     return articles
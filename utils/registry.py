@@ -0,0 +1,349 @@
+"""
+Versioned model bundles and hot reload.
+
+A registry root holds one directory per version plus an optional CURRENT
+file naming the version to serve (otherwise the last version in sort order):
+
+    <root>/CURRENT
+    <root>/<version>/news.tsv, behaviors.tsv   MIND snapshot (required)
+    <root>/<version>/manifest.json             build metadata (optional)
+    <root>/<version>/interactions.npz          encoded click arrays (optional)
+    <root>/<version>/collaborative.pkl         fitted CF model (optional)
+    <root>/<version>/tfidf.pkl                 fitted TF-IDF index (optional)
+    <root>/<version>/neighbours.npz            top TF-IDF neighbours per article (optional)
+    <root>/<version>/entities.npz              article/user entity matrices (optional)
+    <root>/<version>/trending.npz              click counts and ranking per item (optional)
+    <root>/<version>/embeddings/               see utils/embeddings.py (optional)
+
+``python -m utils.build`` writes all of these.
+
+A version is loaded into an immutable ModelBundle - data, item codes and
+warmed models - entirely off the request path, then swapped in with
+recommenders.activate_bundle(). Requests holding recommenders.hold_model()
+finish on the bundle they started with; new requests see the new one.
+Parts a version does not ship are fitted during warm-up instead.
+
+Usage:
+    python -m utils.registry --root artifacts/models            # list versions
+    python -m utils.registry --root artifacts/models --publish v2
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+from utils import recommenders as R
+from utils.categories import CategoryIndex
+from utils.embeddings import load_embeddings
+from utils.entities import EntityIndex
+from utils.metrics import model_load_timer, stage_timer
+from utils.sharding import owned_rows, take_csr_rows
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REGISTRY_DIR = os.path.join(PROJECT_ROOT, 'artifacts', 'models')
+CURRENT_FILE = "CURRENT"
+
+
+class ModelBundle:
+    """Everything one model version serves from; read-only once built"""
+
+    def __init__(self, version, path, news_df, behaviors_df, item_ids, item_code,
+                 history_offsets, history_codes, impression_offsets, impression_codes,
+                 impression_labels, user_rows, item_clicks, category_index, cf_model=None, tfidf=None,
+                 item_neighbours=None, entity_index=None, article_embeddings=None, embedding_positions=None,
+                 user_embedding_rows=None, manifest=None, loaded_at=None, shard=None):
+        fields = dict(locals())
+        del fields['self']
+        fields['manifest'] = manifest or {}
+        fields['loaded_at'] = loaded_at or time.time()
+        self.__dict__.update(fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ModelBundle is immutable; use replace()")
+
+    def replace(self, **changes):
+        """Copy with some fields changed (the data itself is shared, not copied)"""
+        fields = dict(self.__dict__)
+        fields.update(changes)
+        return ModelBundle(**fields)
+
+
+def build_bundle(data_dir, version, manifest=None, shard=None):
+    """Load and encode the MIND data in data_dir; models are left to fit on first use.
+    
+    With an interactions.npz (and trending.npz) next to the data, the click
+    strings are not parsed (and click counts are not recounted). With shard
+    (index, count), only the behaviors of the users that shard owns are kept;
+    click counts and the CF item factors still cover everyone, so trending and
+    collaborative scores are the same as unsharded.
+    """
+    start = time.perf_counter()
+    interactions_path = os.path.join(data_dir, 'interactions.npz')
+    with model_load_timer("mind_data"), stage_timer("data_load"):
+        if os.path.exists(interactions_path):
+            news_df, behaviors_df = R.load_mind_data(data_dir, click_columns=False)
+            fields = load_interactions(interactions_path, behaviors_df)
+        else:
+            news_df, behaviors_df = R.load_mind_data(data_dir)
+            fields = R._encode_behaviors(news_df, behaviors_df)
+            # The raw id strings are fully represented by the item codes
+            behaviors_df = behaviors_df.drop(columns=['History', 'Impressions'])
+        trending_path = os.path.join(data_dir, 'trending.npz')
+        if os.path.exists(trending_path):
+            with np.load(trending_path) as arrays:
+                fields['item_clicks'] = arrays['clicks']
+        else:
+            fields['item_clicks'] = R.item_click_counts(fields)
+        fields['category_index'] = CategoryIndex(news_df, fields['item_clicks'])
+        if shard is not None:
+            cf_model = None
+            if not os.path.exists(os.path.join(data_dir, 'collaborative.pkl')):
+                # SVD item factors depend on every user: fit them before the users are partitioned
+                with model_load_timer("collaborative"):
+                    cf_model = R._fit_collaborative_model(ModelBundle(version, data_dir, news_df, behaviors_df,
+                                                                      **fields))
+            behaviors_df = _partition_behaviors(behaviors_df, fields, shard)
+            if cf_model is not None:
+                fields['cf_model'] = _restrict_cf_model(
+                    cf_model, behaviors_df['UserID'].cat.categories.to_numpy())
+    logger.info("Loaded MIND dataset", extra={
+        "version": version, "shard": shard, "news": len(news_df), "behaviors": len(behaviors_df),
+        "items": len(fields['item_ids']), "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+    return ModelBundle(version, data_dir, news_df, behaviors_df, manifest=manifest, shard=shard, **fields)
+
+
+def _partition_behaviors(behaviors_df, fields, shard):
+    """Keep the behaviors rows of the users shard owns; updates the click arrays in fields"""
+    rows = owned_rows(behaviors_df['UserID'], shard)
+    fields['history_offsets'], fields['history_codes'] = take_csr_rows(
+        fields['history_offsets'], rows, fields['history_codes'])
+    fields['impression_offsets'], fields['impression_codes'], fields['impression_labels'] = take_csr_rows(
+        fields['impression_offsets'], rows, fields['impression_codes'], fields['impression_labels'])
+    behaviors_df = behaviors_df.iloc[rows].reset_index(drop=True)
+    behaviors_df['UserID'] = behaviors_df['UserID'].cat.remove_unused_categories()
+    fields['user_rows'] = behaviors_df.groupby('UserID', observed=True, sort=False).indices
+    return behaviors_df
+
+
+def _restrict_cf_model(cf_model, user_ids):
+    """CF model keeping only the latent vectors of user_ids (item factors are shared by all shards)"""
+    user_encoder, news_encoder, matrix_reduced, svd_model = cf_model
+    owned = np.isin(user_encoder.classes_, user_ids)
+    encoder = LabelEncoder()
+    encoder.classes_ = user_encoder.classes_[owned]
+    return encoder, news_encoder, matrix_reduced[owned], svd_model
+
+
+# Arrays of recommenders._encode_behaviors() stored in interactions.npz
+INTERACTION_ARRAYS = ('history_offsets', 'history_codes', 'impression_offsets', 'impression_codes',
+                      'impression_labels')
+
+
+def save_interactions(path, fields):
+    """Write the encoded click arrays (see recommenders._encode_behaviors) to an .npz file"""
+    np.savez(path, item_ids=fields['item_ids'].astype(str),
+             **{name: fields[name] for name in INTERACTION_ARRAYS})
+
+
+def load_interactions(path, behaviors_df):
+    """Bundle fields from interactions.npz; behaviors_df must be the rows it was built from"""
+    with np.load(path) as arrays:
+        fields = {name: arrays[name] for name in INTERACTION_ARRAYS}
+        item_ids = arrays['item_ids'].astype(object)
+    if len(fields['history_offsets']) != len(behaviors_df) + 1:
+        raise ValueError(f"{path} has {len(fields['history_offsets']) - 1} behaviors rows, "
+                         f"the data has {len(behaviors_df)}")
+    # First occurrence wins, as in _encode_behaviors
+    fields['item_code'] = dict(zip(item_ids[::-1].tolist(), range(len(item_ids) - 1, -1, -1)))
+    fields['item_ids'] = item_ids
+    fields['user_rows'] = behaviors_df.groupby('UserID', observed=True, sort=False).indices
+    return fields
+
+
+def load_bundle(path, version=None, warm=True, shard=None):
+    """Build the bundle for a version directory; with warm, every model is ready before it is returned.
+    
+    With shard (index, count), user-side data is restricted to that shard's users.
+    """
+    version = version or os.path.basename(os.path.normpath(path))
+    manifest_path = os.path.join(path, 'manifest.json')
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    bundle = build_bundle(path, version, manifest, shard)
+    shard_users = bundle.behaviors_df['UserID'].cat.categories.to_numpy() if shard is not None else None
+
+    changes = {}
+    cf_path = os.path.join(path, 'collaborative.pkl')
+    if os.path.exists(cf_path):
+        with open(cf_path, 'rb') as f:
+            changes['cf_model'] = pickle.load(f)
+        if shard is not None:
+            changes['cf_model'] = _restrict_cf_model(changes['cf_model'], shard_users)
+    elif warm and bundle.cf_model is None:
+        with model_load_timer("collaborative"):
+            changes['cf_model'] = R._fit_collaborative_model(bundle)
+
+    tfidf_path = os.path.join(path, 'tfidf.pkl')
+    if os.path.exists(tfidf_path):
+        with open(tfidf_path, 'rb') as f:
+            changes['tfidf'] = pickle.load(f)
+    elif warm:
+        with model_load_timer("tfidf"):
+            changes['tfidf'] = R._fit_tfidf(bundle.news_df)
+
+    neighbours_path = os.path.join(path, 'neighbours.npz')
+    if os.path.exists(neighbours_path):
+        with np.load(neighbours_path) as arrays:
+            changes['item_neighbours'] = (arrays['positions'], arrays['scores'])
+
+    entities_path = os.path.join(path, 'entities.npz')
+    if os.path.exists(entities_path):
+        changes['entity_index'] = EntityIndex.load(entities_path)
+        if shard is not None:
+            changes['entity_index'] = changes['entity_index'].for_users(shard_users)
+    elif warm:
+        with model_load_timer("entities"):
+            changes['entity_index'] = R._fit_entity_index(bundle)
+
+    embeddings = load_embeddings(os.path.join(path, 'embeddings'))
+    if embeddings is not None:
+        positions, user_rows = R._map_embeddings(bundle, embeddings)
+        changes.update(article_embeddings=embeddings, embedding_positions=positions,
+                       user_embedding_rows=user_rows)
+    return bundle.replace(**changes)
+
+
+class ModelRegistry:
+    """Versions under a root directory; load() swaps the served bundle atomically"""
+
+    def __init__(self, root=DEFAULT_REGISTRY_DIR, warm=True):
+        self.root = root
+        self.warm = warm
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def versions(self):
+        """Version names that have a data snapshot, in sort order"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, 'news.tsv')))
+
+    def current_version(self):
+        """Version named by CURRENT, else the last one; None when the registry is empty"""
+        current_path = os.path.join(self.root, CURRENT_FILE)
+        if os.path.exists(current_path):
+            with open(current_path) as f:
+                version = f.read().strip()
+            if version:
+                return version
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def load(self, version=None):
+        """Load a version (default: current) and serve it; the old bundle keeps serving if this fails"""
+        with self._reload_lock:
+            version = version or self.current_version()
+            if version is None:
+                raise FileNotFoundError(f"No model versions in {self.root}")
+            path = os.path.join(self.root, version)
+            if version not in self.versions():
+                raise FileNotFoundError(f"Model version {version!r} not found in {self.root}")
+
+            start = time.perf_counter()
+            with model_load_timer("bundle"):
+                bundle = load_bundle(path, version, warm=self.warm, shard=R.shard)
+            previous = R._active_bundle
+            R.activate_bundle(bundle)
+            logger.info("Activated model version", extra={
+                "version": version, "previous": previous.version if previous else None,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            })
+            return bundle
+
+    def status(self):
+        bundle = R._active_bundle
+        return {
+            "version": bundle.version if bundle else None,
+            "loaded_at": bundle.loaded_at if bundle else None,
+            "shard": list(bundle.shard) if bundle and bundle.shard else None,
+            "current": self.current_version(),
+            "available": self.versions(),
+            "last_error": self.last_error,
+        }
+
+    def watch(self, interval=30):
+        """Poll the root every ``interval`` seconds and load the current version when it changes"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, args=(interval,), name="model-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self, interval):
+        failed = None
+        while not self._stop.wait(interval):
+            version = None
+            try:
+                version = self.current_version()
+                active = R._active_bundle
+                # Don't retry a broken version every poll; wait until CURRENT changes
+                if version is None or version == failed or (active is not None and active.version == version):
+                    continue
+                self.load(version)
+                self.last_error = None
+            except Exception as e:
+                failed = version
+                self.last_error = f"{version}: {e}"
+                logger.exception("Model reload failed", extra={"version": version})
+
+    def stop_watching(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def publish(root, version):
+    """Point CURRENT at version (atomic rename, so watchers never read a partial file)"""
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List model versions or choose the one to serve")
+    parser.add_argument("--root", default=DEFAULT_REGISTRY_DIR)
+    parser.add_argument("--publish", metavar="VERSION", help="Make VERSION current")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.root)
+    if args.publish:
+        if args.publish not in registry.versions():
+            print(f"Unknown version {args.publish!r}; available: {', '.join(registry.versions()) or 'none'}")
+            return 1
+        publish(args.root, args.publish)
+    current = registry.current_version()
+    for version in registry.versions():
+        print(("* " if version == current else "  ") + version)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
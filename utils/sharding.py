@@ -0,0 +1,71 @@
+"""
+Consistent hashing of user ids onto shards.
+
+In sharded mode each server process keeps the behaviors (click histories,
+user vectors) of the users it owns; articles and item-side models are
+replicated on every shard. The owner of a user is found on a hash ring with
+many virtual nodes per shard, so adding a shard moves only about 1/N of the
+users. The router (server/app/router.py) and the shards build the same ring
+from the shard count, so they always agree on the owner.
+"""
+
+import bisect
+import hashlib
+
+import numpy as np
+
+RING_REPLICAS = 128  # virtual nodes per shard
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+def shard_names(count):
+    return [f"shard-{index}" for index in range(count)]
+
+
+class HashRing:
+    """Consistent hash ring over node names"""
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+        self.nodes = list(nodes)
+        points = sorted((_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    @classmethod
+    def for_shards(cls, count, replicas=RING_REPLICAS):
+        return cls(shard_names(count), replicas)
+
+    def node_for(self, key):
+        """Node owning key: the first ring point clockwise from its hash"""
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def index_for(self, key):
+        """Position in nodes of the node owning key"""
+        return self.nodes.index(self.node_for(key))
+
+
+def owned_rows(user_ids, shard):
+    """Positions in user_ids (a categorical Series, one entry per behaviors row) owned by shard (index, count)"""
+    index, count = shard
+    ring = HashRing.for_shards(count)
+    # Hash each distinct user once, then broadcast to its rows
+    owner = np.array([ring.node_for(user_id) for user_id in user_ids.cat.categories], dtype=object)
+    owned_codes = np.flatnonzero(owner == shard_names(count)[index])
+    return np.flatnonzero(np.isin(user_ids.cat.codes.to_numpy(), owned_codes))
+
+
+def take_csr_rows(offsets, rows, *arrays):
+    """(offsets, *arrays) of the CSR lists at rows, e.g. the click lists of a subset of behaviors rows"""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=offsets.dtype)
+    np.cumsum(lengths, out=new_offsets[1:])
+    # Source index of every kept element: its row's start plus its place in the row
+    source = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return (new_offsets, *(array[source] for array in arrays))